@@ -0,0 +1,185 @@
+################################################################################
+# bench_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script benchmarks make-fpga itself on synthetic designs.
+################################################################################
+
+import sys,os,argparse,time,tempfile,subprocess
+from make_fpga import *
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# create n synthetic designs of k VHDL sources each (a chain of entities plus
+# a package), return list of (directory,sources,run specs)
+def make_designs(root,n,k):
+    r = []
+    for i in range(n):
+        d = os.path.join(root,'design%d' % i)
+        os.makedirs(d,exist_ok=True)
+        src = []
+        with open(os.path.join(d,'pkg.vhd'),'w') as f:
+            f.write('package pkg is\n  constant W : integer := 8;\nend package;\n')
+        src.append(os.path.join(d,'pkg.vhd'))
+        for j in range(k):
+            with open(os.path.join(d,'u%d.vhd' % j),'w') as f:
+                f.write('use work.pkg.all;\nentity u%d is end entity;\narchitecture rtl of u%d is\nbegin\n' % (j,j))
+                if j:
+                    f.write('  c: entity work.u%d;\n' % (j-1))
+                f.write('end architecture;\n')
+            src.append(os.path.join(d,'u%d.vhd' % j))
+        run = ['r%d:u%d,n=%d' % (j,k-1,j) for j in range(4)]
+        r.append((d,src,run))
+    return r
+
+# per design subprocess generation vs in process generation
+def bench_gen(args):
+    with tempfile.TemporaryDirectory() as root:
+        designs = make_designs(root,args.designs,args.sources)
+        t0 = time.perf_counter()
+        for d,src,run in designs:
+            with open(os.path.join(d,'sub.mak'),'w') as f:
+                subprocess.check_call([
+                    sys.executable,os.path.join(here,'make_'+args.kind+'.py'),
+                    '--src']+src+['--run']+run+['--scan_cache',os.path.join(d,'.scan_sub.json')],
+                    stdout=f
+                    )
+        t_sub = time.perf_counter()-t0
+        t0 = time.perf_counter()
+        for d,src,run in designs:
+            p = make_project(src,run=run,scan_cache=os.path.join(d,'.scan_inp.json'))
+            with open(os.path.join(d,'inp.mak'),'w') as f:
+                f.write(generate(args.kind,p))
+        t_inp = time.perf_counter()-t0
+        for d,_,_ in designs:
+            if open(os.path.join(d,'sub.mak')).read() != open(os.path.join(d,'inp.mak')).read():
+                error_exit('outputs differ for %s' % d)
+    n = args.designs
+    print('generate %d %s makefiles (%d sources each)' % (n,args.kind,args.sources+1))
+    print('  subprocess per design: %8.3fs (%7.2f ms/design)' % (t_sub,1000*t_sub/n))
+    print('  in process:            %8.3fs (%7.2f ms/design)' % (t_inp,1000*t_inp/n))
+    print('  speedup:               %8.1fx' % (t_sub/t_inp))
+
+# run spec parsing: explicit specs and sweep expansion
+def bench_runs(args):
+    n = args.runs
+    specs = ['run%d:tb_top,width=%d,name="test %d",init=\'1\';typ:/tb_top/dut%d=dut.sdf' % (i,8+i%57,i,i%4) for i in range(n)]
+    t0 = time.perf_counter()
+    runs = process_run(specs)
+    t_spec = time.perf_counter()-t0
+    if len(runs) != n:
+        error_exit('expected %d runs, got %d' % (n,len(runs)))
+    a = max(1,int(round((n/10)**(1/3))))
+    sweep = ['sweep:tb_top,a={0..%d},b={0..%d},seed={1..%d}' % (a-1,a-1,n//(a*a))]
+    t0 = time.perf_counter()
+    m = sum(1 for _ in iter_runs(sweep))
+    t_sweep = time.perf_counter()-t0
+    print('parse %d explicit run specs:  %8.3fs (%6.2f us/run)' % (n,t_spec,1e6*t_spec/n))
+    print('expand sweep to %d runs:      %8.3fs (%6.2f us/run)' % (m,t_sweep,1e6*t_sweep/m))
+    print('  %s' % sweep[0])
+
+# time (best of repeat) for command to complete
+def best_time(cmd,cwd,repeat):
+    t = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.check_call(cmd,cwd=cwd,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+        t = min(t or 1e9,time.perf_counter()-t0)
+    return t
+
+# make startup (make -n with all compilation up to date) against source count
+def bench_make(args):
+    print('%8s %14s %14s %14s %14s' % ('sources','make_nvc.py','nvc.mak','pairmap chain','deps.mk'))
+    for n in args.sources:
+        with tempfile.TemporaryDirectory() as root:
+            (d,src,run), = make_designs(root,1,n-1)
+            src = [os.path.relpath(x,d) for x in src]
+            p = make_project(src,run=run,scan_cache='')
+            with open(os.path.join(d,'makefile'),'w') as f:
+                f.write(generate('nvc',p))
+            with open(os.path.join(d,'nvc.mk'),'w') as f:
+                f.write('NVC_SRC:=%s\nNVC_RUN:=%s\nNVC_EDIT:=0\nBUILTIN_RULES:=0\ninclude %s/nvc.mak\n' % (
+                    ' '.join(src),' '.join(r.replace(':','=',1) for r in run),here))
+            with open(os.path.join(d,'dep.mk'),'w') as f:
+                f.write('include %s/common.mak\nSRC:=%s\n' % (here,' '.join(src)))
+                f.write('x:=$(firstword $(SRC))<= $(call pairmap,src_dep,$(call rest,$(SRC)),$(call chop,$(SRC)))\nall:;@:\n')
+            # compilation stamps newer than sources
+            time.sleep(0.01)
+            for l,s in p.src:
+                for x in (os.path.join(d,l,os.path.basename(s)+'.com'),os.path.join(d,'sim_nvc',l,'.touch',os.path.basename(s))):
+                    os.makedirs(os.path.dirname(x),exist_ok=True)
+                    open(x,'w').close()
+            make = ['make','-n','-f']
+            t = [
+                best_time(make+['makefile','nvc'],d,args.repeat),
+                best_time(make+['nvc.mk','nvc'],d,args.repeat),
+                best_time(make+['dep.mk'],d,args.repeat),
+                # regenerating the dependencies nvc.mak includes (scan cache warm)
+                best_time([sys.executable,os.path.join(here,'make_fpga.py'),'deps','--dir','sim_nvc','--out','sim_nvc/deps.mk']+src,d,args.repeat)
+                ]
+        print('%8d %13.3fs %13.3fs %13.3fs %13.3fs' % tuple([n]+t))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='bench_fpga.py',
+        description='Benchmark make-fpga on synthetic designs'
+       )
+    sub = parser.add_subparsers(dest='cmd',required=True)
+    p = sub.add_parser(
+        'gen',
+        help='makefile generation: subprocess per design vs in process'
+       )
+    p.add_argument(
+        '--kind',
+        choices=['nvc','vsim'],
+        help='generator (defaults to nvc)',
+        default='nvc'
+       )
+    p.add_argument(
+        '--designs',
+        type=int,
+        help='number of designs (defaults to 200)',
+        default=200
+       )
+    p.add_argument(
+        '--sources',
+        type=int,
+        help='number of sources per design (defaults to 20)',
+        default=20
+       )
+    p = sub.add_parser(
+        'runs',
+        help='run spec parsing and sweep expansion'
+       )
+    p.add_argument(
+        '--runs',
+        type=int,
+        help='number of runs (defaults to 10000)',
+        default=10000
+       )
+    p = sub.add_parser(
+        'make',
+        help='make startup time (make -n, up to date) against source count'
+       )
+    p.add_argument(
+        '--sources',
+        type=int,
+        nargs='+',
+        help='source counts (defaults to 100 500 1000 2000)',
+        default=[100,500,1000,2000]
+       )
+    p.add_argument(
+        '--repeat',
+        type=int,
+        help='repeat each measurement, report best (defaults to 3)',
+        default=3
+       )
+    args = parser.parse_args(argv)
+    if args.cmd == 'gen':
+        bench_gen(args)
+    elif args.cmd == 'runs':
+        bench_runs(args)
+    elif args.cmd == 'make':
+        bench_make(args)
+
+if __name__ == '__main__':
+    main()
@@ -44,8 +44,10 @@ check_shell_error = $(if $(filter 0,$(.SHELLSTATUS)),,$(error $1))
 rest              = $(wordlist 2,$(words $1),$1)
 chop              = $(wordlist 1,$(words $(call rest,$1)),$1)
 src_dep           = $1<=$2
+src_stamps        = $(foreach s,$1,$2/$(call get_src_lib,$s,$3)/.touch/$(notdir $(call get_src_file,$s)))
 pairmap           = $(and $(strip $2),$(strip $3),$(call $1,$(firstword $2),$(firstword $3)) $(call pairmap,$1,$(call rest,$2),$(call rest,$3)))
-nodup             = $(if $1,$(firstword $1) $(call nodup,$(filter-out $(firstword $1),$1)))
+nodup_var         = _nodup_$(subst =,%e,$(subst :,%c,$(subst %,%p,$1)))
+nodup             = $(strip $(foreach x,$1,$(if $($(call nodup_var,$x)),,$(eval $(call nodup_var,$x):=1)$x))$(foreach x,$1,$(eval $(call nodup_var,$x):=)))
 get_src_file      = $(foreach x,$1,$(word 1,$(subst =, ,$(word 1,$(subst ;, ,$x)))))
 get_src_lib       = $(foreach x,$1,$(if $(word 1,$(subst ;, ,$(word 2,$(subst =, ,$(word 1,$(subst ;, ,$x)))))),$(word 1,$(subst ;, ,$(word 2,$(subst =, ,$(word 1,$(subst ;, ,$x)))))),$2))
 get_src_lang      = $(word 1,$(word 2,$(subst ;, ,$1)))
@@ -55,9 +57,20 @@ get_run_name      = $(foreach x,$1,$(word 1,$(subst =, ,$x)))
 get_run_lib       = $(if $(findstring :,$(word 1,$(subst ;, ,$1))),$(word 1,$(subst :, ,$(word 2,$(subst =, ,$1)))),$2)
 get_run_unit      = $(if $(findstring :,$(word 1,$(subst ;, ,$1))),$(word 2,$(subst :, ,$(word 2,$(subst =, ,$(word 1,$(subst ;, ,$1)))))),$(word 2,$(subst =, ,$(word 1,$(subst ;, ,$1)))))
 get_run_gen       = $(subst $(comma), ,$(word 2,$(subst ;, ,$1)))
+stamp             = $(if $(filter 0,$(STAMP)),(cd $3 && $(call STEP) $4) && touch $1,$(call STEP) $(PYTHON) $(MAKE_FPGA_PY) stamp -C $3 $1 $2 -- $4)
 banner            = @printf "$(col_bg_wht)$(col_fi_blu)-------------------------------------------------------------------------------$(col_rst)\n$(col_bg_wht)$(col_fi_blu) %-78s$(col_rst)\n$(col_bg_wht)$(col_fi_blu)-------------------------------------------------------------------------------$(col_rst)\n" "$1"
 print_col         = @printf "$($1)$2$(if $3,$(comma)$3)$(if $4,$(comma)$4)$(if $5,$(comma)$5)$(col_rst)\n"
 
+# content hash compile stamps (set STAMP=0 to fall back to touch files)
+# stamp: $1 = stamp file, $2 = inputs, $3 = directory to run in, $4 = command
+PYTHON?=python3
+MAKE_FPGA_PY:=$(abspath $(dir $(lastword $(MAKEFILE_LIST))))/make_fpga.py
+
+# per step timing and resource log (set STEP_LOG=file to record each compile,
+# elaborate and run step, summarize with: $(PYTHON) $(MAKE_FPGA_PY) steps file)
+# use as recipe prefix: $(STEP) or $(call STEP,name suffix,extra inputs)
+STEP=$(if $(STEP_LOG),$(PYTHON) $(MAKE_FPGA_PY) step --log $(abspath $(STEP_LOG)) --name $@$1 $^ $2 --)
+
 ifeq ($(OS),Windows_NT)
 create_symlink=cmd /C "mklink $(subst /,\,$1) $(subst /,\,$2)"
 MKDIR=$(XILINX_VIVADO)\gnuwin\bin\mkdir.exe
@@ -0,0 +1,339 @@
+################################################################################
+# dist_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script distributes the runs of an FPGA simulation across worker hosts.
+# The coordinator compiles the simulation once (as run_fpga.py does), then
+# hands runs to workers that connect to it; workers receive a snapshot of the
+# compiled libraries (or use them in place on shared storage) and stream run
+# logs and results back. With --local, the workers are local processes.
+################################################################################
+
+import sys,os,argparse,io,gzip,json,time,queue,socket,secrets,tarfile,threading,subprocess
+import concurrent.futures
+from make_fpga import *
+from run_fpga import add_arguments,process_args,compile_all,run_one,summarize
+
+help_protocol = \
+    'Protocol: JSON lines over TCP. A worker connection performs one run at a time:\n' \
+    '  worker -> {"op": "hello", "token": ..., "host": ...}\n' \
+    '  coord  -> {"op": "setup", "args": {...}, "root": ..., "key": ..., "size": ...}\n' \
+    '            or {"op": "setup", "args": {...}, "dir": ...} (shared storage)\n' \
+    '  worker -> {"op": "need"} (followed by size bytes of snapshot) or {"op": "have"}\n' \
+    '  coord  -> {"op": "run", "run": [name,top,gen,sdf,wave,limits]}\n' \
+    '            (limits: {"heap": bytes, "rss": bytes, "wall": seconds, "stop": time},\n' \
+    '            each optional)\n' \
+    '  worker -> {"op": "log", "data": ...} ... {"op": "result", "result": {...}}\n' \
+    '  coord  -> ... {"op": "done"}\n' \
+    'Workers open one connection per job. The token is given by --token or\n' \
+    '$DIST_FPGA_TOKEN (the coordinator makes one up if neither is set).\n'
+
+# run arguments passed to workers (see run_fpga.py)
+run_keys = ('sim','path','vhdl','work','lib','gen','sdf','wave','timeout','max_errors','abort_on')
+
+# a run lost with its worker is handed out again this many times
+retries = 2
+
+def send(f,m):
+    f.write((json.dumps(m)+'\n').encode())
+    f.flush()
+
+def recv(f):
+    s = f.readline()
+    if not s:
+        raise ConnectionError('connection closed')
+    return json.loads(s)
+
+def parse_addr(s):
+    host,_,port = s.rpartition(':')
+    if not port.isdigit():
+        error_exit('bad address (expected host:port): %s' % s)
+    return host or '127.0.0.1',int(port)
+
+################################################################################
+# coordinator
+
+# compiled output directory without run directories, as a gzipped tar (the
+# key is its content hash, so workers only fetch a snapshot once)
+def snapshot(args,runs):
+    skip = set(r[0] for r in runs)
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf,mode='wb',mtime=0) as z:
+        with tarfile.open(fileobj=z,mode='w') as t:
+            for e in sorted(os.listdir(args.dir)):
+                if e not in skip:
+                    t.add(os.path.join(args.dir,e),arcname=e)
+    b = buf.getvalue()
+    return hashlib.sha1(b).hexdigest()[:20],b
+
+# serve one worker connection: hand out runs until all runs are complete (the
+# connection waits while others are in progress, as a run lost with its worker
+# is handed out again)
+def serve_worker(args,conn,token,snap,todo,done,complete):
+    f = conn.makefile('rwb')
+    host = conn.getpeername()[0]
+    run = None
+    try:
+        m = recv(f)
+        if m.get('op') != 'hello' or m.get('token') != token:
+            print('rejected connection from %s' % host,flush=True)
+            return
+        host = m.get('host',host)
+        setup = {'op': 'setup','args': {k: getattr(args,k) for k in run_keys}}
+        if snap:
+            setup.update({'root': os.path.abspath(args.dir),'key': snap[0],'size': len(snap[1])})
+            send(f,setup)
+            if recv(f).get('op') == 'need':
+                f.write(snap[1])
+                f.flush()
+        else:
+            setup['dir'] = os.path.abspath(args.dir)
+            send(f,setup)
+        while True:
+            try:
+                run = todo.get(timeout=0.5)
+            except queue.Empty:
+                if complete.is_set():
+                    break
+                continue
+            send(f,{'op': 'run','run': run})
+            log = os.path.join(args.dir,run[0],'run.log')
+            lf = None
+            if snap:
+                os.makedirs(os.path.dirname(log),exist_ok=True)
+                lf = open(log,'w')
+            try:
+                while True:
+                    m = recv(f)
+                    if m['op'] == 'log':
+                        if lf:
+                            lf.write(m['data'])
+                            lf.flush()
+                    elif m['op'] == 'result':
+                        break
+            finally:
+                if lf:
+                    lf.close()
+            r = m['result']
+            r.update({'log': log,'host': host})
+            run = None
+            done(r)
+        send(f,{'op': 'done'})
+    except (OSError,ValueError,KeyError,ConnectionError) as e:
+        print('lost worker %s: %s' % (host,e),flush=True)
+        if run:
+            done(None,run)
+    finally:
+        conn.close()
+
+def coordinator(args,runs):
+    compile_all(args)
+    snap = None if args.shared else snapshot(args,runs)
+    token = args.token or os.environ.get('DIST_FPGA_TOKEN') or secrets.token_hex(16)
+    srv = socket.create_server(parse_addr(args.listen))
+    srv.settimeout(1)
+    addr = '%s:%d' % srv.getsockname()[:2]
+    todo = queue.Queue()
+    for r in runs:
+        todo.put(r)
+    results = []
+    tries = {}
+    lock = threading.Lock()
+    complete = threading.Event()
+
+    # record result r, or requeue a run lost with its worker
+    def done(r,lost=None):
+        with lock:
+            if lost:
+                tries[lost[0]] = tries.get(lost[0],0)+1
+                if tries[lost[0]] <= retries:
+                    todo.put(lost)
+                    return
+                r = {'name': lost[0],'top': lost[1],'status': 'error','rc': None,'time': 0,
+                    'log': os.path.join(args.dir,lost[0],'run.log'),'message': 'worker lost','host': None}
+            results.append(r)
+            print('%-7s %s (%.1fs) %s [%s]' % (r['status'].upper(),r['name'],r['time'],r['log'],r['host']),flush=True)
+            if len(results) == len(runs):
+                complete.set()
+
+    local = None
+    if args.local:
+        env = dict(os.environ,DIST_FPGA_TOKEN=token)
+        local = subprocess.Popen([sys.executable,os.path.abspath(__file__),'worker',addr,
+            '--jobs',str(args.local),'--dir',args.dir+'_workers'],env=env)
+    else:
+        print('%d run(s) waiting for workers, e.g.: %s worker %s --token %s' % (
+            len(runs),os.path.abspath(__file__),addr,token),flush=True)
+    try:
+        while len(results) < len(runs):
+            try:
+                conn,_ = srv.accept()
+            except socket.timeout:
+                if local and local.poll() is not None and len(results) < len(runs):
+                    error_exit('local workers exited before all runs completed')
+                continue
+            conn.settimeout(None)
+            threading.Thread(target=serve_worker,args=(args,conn,token,snap,todo,done,complete),daemon=True).start()
+    finally:
+        srv.close()
+        if local:
+            try:
+                local.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                local.kill()
+    return summarize(args,runs,results)
+
+################################################################################
+# worker
+
+snap_lock = threading.Lock()
+
+# unpack snapshot into d (once), pointing absolute paths in it at d
+def unpack(f,m,d):
+    with snap_lock:
+        if os.path.isdir(d):
+            send(f,{'op': 'have'})
+            return
+        send(f,{'op': 'need'})
+        b = f.read(m['size'])
+        if len(b) != m['size']:
+            raise ConnectionError('snapshot truncated')
+        tmp = '%s.%d.tmp' % (d,os.getpid())
+        with tarfile.open(fileobj=io.BytesIO(b),mode='r:gz') as t:
+            if hasattr(tarfile,'data_filter'):
+                t.extractall(tmp,filter='data')
+            else:
+                t.extractall(tmp)
+        # vsim maps libraries by absolute path
+        ini = os.path.join(tmp,'modelsim.ini')
+        if os.path.isfile(ini):
+            with open(ini,'r') as x:
+                s = x.read()
+            with open(ini,'w') as x:
+                x.write(s.replace(m['root'],os.path.abspath(d)))
+        os.replace(tmp,d)
+
+# one worker connection: perform runs handed out by the coordinator
+def worker_conn(args,addr):
+    conn = socket.create_connection(addr)
+    f = conn.makefile('rwb')
+    try:
+        send(f,{'op': 'hello','token': args.token,'host': socket.gethostname()})
+        m = recv(f)
+        if 'key' in m:
+            d = os.path.join(args.dir,m['key'])
+            unpack(f,m,d)
+            stream = True
+        else:
+            d = m['dir']
+            stream = False
+        ra = argparse.Namespace(dir=d,**m['args'])
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            while True:
+                m = recv(f)
+                if m['op'] != 'run':
+                    break
+                r = m['run']
+                log = os.path.join(d,r[0],'run.log')
+                if os.path.exists(log):
+                    os.remove(log)
+                fut = pool.submit(run_one,ra,r)
+                pos = 0
+                while True:
+                    finished = fut.done()
+                    if stream and os.path.exists(log):
+                        with open(log,'r',errors='replace') as x:
+                            x.seek(pos)
+                            s = x.read()
+                            pos = x.tell()
+                        if s:
+                            send(f,{'op': 'log','data': s})
+                    if finished:
+                        break
+                    time.sleep(0.5)
+                send(f,{'op': 'result','result': fut.result()})
+    except ConnectionError:
+        pass
+    finally:
+        conn.close()
+
+def worker(args):
+    args.token = args.token or os.environ.get('DIST_FPGA_TOKEN')
+    if not args.token:
+        error_exit('worker: no token (use --token or $DIST_FPGA_TOKEN)')
+    addr = parse_addr(args.addr)
+    os.makedirs(args.dir,exist_ok=True)
+    threads = [threading.Thread(target=worker_conn,args=(args,addr)) for _ in range(max(1,args.jobs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return 0
+
+################################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='dist_fpga.py',
+        description='Distribute the runs of an FPGA simulation across worker hosts',
+        epilog=help_protocol,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    sub = parser.add_subparsers(dest='cmd',required=True)
+    p = sub.add_parser(
+        'coord',
+        help='compile the simulation, then hand its runs to workers',
+        epilog=help_run,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    add_arguments(p)
+    p.add_argument(
+        '--listen',
+        help='address to listen for workers on (defaults to 127.0.0.1:0, i.e. any free port)',
+        default='127.0.0.1:0'
+       )
+    p.add_argument(
+        '--token',
+        help='token workers must present (defaults to $DIST_FPGA_TOKEN or a random one)'
+       )
+    p.add_argument(
+        '--shared',
+        action='store_true',
+        help='workers use the output directory in place (shared storage at the same path) rather than a snapshot'
+       )
+    p.add_argument(
+        '--local',
+        type=int,
+        metavar='JOBS',
+        help='start a local worker performing this many runs concurrently (single host mode)'
+       )
+    p = sub.add_parser(
+        'worker',
+        help='perform runs handed out by a coordinator'
+       )
+    p.add_argument(
+        'addr',
+        help='coordinator address (host:port)'
+       )
+    p.add_argument(
+        '--token',
+        help='token (defaults to $DIST_FPGA_TOKEN)'
+       )
+    p.add_argument(
+        '--jobs',
+        type=int,
+        help='number of runs to perform concurrently (defaults to CPU count)',
+        default=os.cpu_count()
+       )
+    p.add_argument(
+        '--dir',
+        help='directory for snapshots and runs (defaults to "dist_worker")',
+        default='dist_worker'
+       )
+    args = parser.parse_args(argv)
+    if args.cmd == 'coord':
+        return coordinator(args,process_args(args))
+    else:
+        return worker(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
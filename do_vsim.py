@@ -7,199 +7,305 @@
 import sys,os,argparse
 from make_fpga import *
 
-# parse arguments
+# TCL script for project p (serve: start serving watch_vsim.py requests)
+def emit(p,serve=False):
+    rdeps = src_rdeps(p.deps())
+    cached = cached_libs(p)
+    o = []
+    o.append('# TCL script generated by do_vsim.py (see https://github.com/amb5l/make-fpga)')
+    o.append('# for simulation using ModelSim/Questa/etc')
 
-parser = argparse.ArgumentParser(
-    prog='do_vsim.py',
-    description='Create makefiles for simulating FPGA designs with ModelSim/Questa/etc',
-    epilog=help_run,
-    formatter_class=argparse.RawDescriptionHelpFormatter
-   )
-parser.add_argument(
-    '--path',
-    help='path to tool binaries'
-   )
-parser.add_argument(
-    '--lib',
-    nargs='+',
-    action='append',
-    help='precompiled libraries'
-   )
-parser.add_argument(
-    '--vhdl',
-    choices=['1987','1993','2002','2008'],
-    help='VHDL LRM version (defaults to 2008)',
-    default='2008'
-   )
-parser.add_argument(
-    '--work',
-    help='work library (defaults to "work")',
-    default='work'
-   )
-parser.add_argument(
-    '--src',
-    required=True,
-    nargs='+',
-    action='append',
-    help='source(s) in compile order (append =LIB to specify library name)'
-   )
-parser.add_argument(
-    '--run',
-    required=True,
-    nargs='+',
-    action='append',
-    help='simulation run specification(s) (see below)'
-   )
-parser.add_argument(
-    '--gen',
-    nargs='+',
-    action='append',
-    help='generics assignment(s) (applied to all runs)'
-   )
-parser.add_argument(
-    '--sdf',
-    nargs='+',
-    action='append',
-    help='SDF mapping(s) (applied to all runs)'
-   )
+    o.append('################################################################################')
+    o.append('# simulation specific definitions')
+    o.append('')
+    o.append('# list of source specs in compilation order')
+    o.append('# each source spec is a list containing library name and source file')
+    o.append('quietly set srcs {')
+    for l,s in p.src:
+        o.append('  { '+l+' '+s+' '+'}')
+    o.append('}')
+    o.append('')
+    o.append('# reverse dependencies: for each source in srcs, the indices of all')
+    o.append('# sources that depend on it directly or indirectly')
+    o.append('quietly set rdeps {')
+    for r in rdeps:
+        o.append('  { '+' '.join(map(str,r))+' }')
+    o.append('}')
+    o.append('')
+    o.append('# list of generic assignments applied to all runs')
+    o.append('# each generic assignment is a list containing name and value')
+    o.append('quietly set gens {')
+    for n,v in p.gen:
+        o.append(' { %s {%s} }' % (n,v))
+    o.append('}')
+    o.append('')
+    o.append('# list of SDF mappings applied to all runs')
+    o.append('# each SDF mapping is a list containing delay, design unit path and filename')
+    o.append('quietly set sdfs {')
+    for t,q,f in p.sdf:
+        o.append(' { %s %s %s }' % (t,q,f))
+    o.append('}')
+    o.append('')
+    o.append('# list of simulation run specs')
+    o.append('# each run spec is a list containing name and run specifics:')
+    o.append('#  top design unit, generic assignment list and SDF mapping list')
+    o.append('quietly set runs {')
+    for r in p.runs:
+        gen = ['{ '+n+' '+v+' }' for n,v in r[2]]
+        sdf = ['{ '+t+' '+q.replace('//','/')+' '+f+' }' for t,q,f in r[3]]
+        o.append(' { '+r[0]+' '+r[1]+' { '+' '.join(gen)+' } { '+' '+' '.join(sdf)+' } }')
+    o.append('}')
+    o.append('')
+    o.append('# list of precompiled libraries to use')
+    o.append('quietly set libs { '+' '.join(p.lib)+' }')
+    o.append('')
+    if cached:
+        o.append('# precompiled libraries from the shared library cache (see libcache_fpga.py)')
+        o.append('quietly set libcache { '+' '.join([l for l,_ in cached])+' }')
+        o.append('quietly set libcache_cmd { python3 %s get --sim vsim --defs %s%s --vmap modelsim.ini }' % (
+            libcache_py,os.path.abspath(p.lib_defs).replace('\\','/'),' --path '+p.path if p.path else ''))
+        o.append('')
+    o.append('# work library name')
+    o.append('quietly set work "'+p.work+'"')
+    o.append('')
+    o.append('# VHDL LRM version')
+    o.append('quietly set vhdl "'+p.vhdl+'"')
+    o.append('')
+    o.append('# arguments for vcom')
+    o.append('quietly set vcom_args "-modelsimini modelsim.ini -explicit -stats=none -work $work -$vhdl"')
+    o.append('')
+    o.append('# arguments for vlog')
+    o.append('quietly set vlog_args "-modelsimini modelsim.ini -stats=none"')
+    o.append('')
+    o.append('# arguments for vsim')
+    o.append('quietly set vsim_lib [join [lmap l $libs {string cat "-L $l"}]]')
+    o.append('quietly set vsim_gen [join [lmap g $gens {string cat "-g[lindex $g 0]=[lindex $g 1]"}]]')
+    o.append('quietly set vsim_sdf [join [lmap m $sdfs {string cat "-sdf[lindex $m 0] [lindex $m 1]=[lindex $m 2]"}]]')
+    o.append('quietly set vsim_tcl "set NumericStdNoWarnings 1; if \[file exists wave.do\] {do wave.do}; run -all; noview .main_pane.source; view wave; wave zoom full"')
+    o.append('quietly set vsim_args "$vsim_lib $vsim_gen -t ps -gui -onfinish stop -do \\"$vsim_tcl\\""')
+    o.append('')
+    o.append('################################################################################')
+    o.append('# common section')
+    o.append('')
+    o.append('# initialise - create modelsim.ini, %screate and map user libaries' % ('map cached libraries, then ' if cached else 'then '))
+    o.append('proc init {} {')
+    o.append('  global srcs '+('libcache libcache_cmd' if cached else ''))
+    o.append('  if {![file exists modelsim.ini]} {vmap -c}')
+    if cached:
+        o.append('  foreach lib $libcache {')
+        o.append('    puts [exec {*}$libcache_cmd $lib 2>@1]')
+        o.append('  }')
+    o.append('  set srcs_dict [dict create]')
+    o.append('  foreach src $srcs {dict set srcs_dict [lindex $src 0] [lindex $src 1]}')
+    o.append('  foreach lib [dict keys $srcs_dict] {')
+    o.append('    if {![file isdirectory $lib]} {')
+    o.append('      vlib $lib')
+    o.append('      vmap -modelsimini modelsim.ini $lib $lib')
+    o.append('    }')
+    o.append('  }')
+    o.append('}')
+    o.append('')
+    o.append('# compile source with given index')
+    o.append('proc com_src {i} {')
+    o.append('  global srcs vcom_args vlog_args')
+    o.append('  set lib [lindex $srcs $i 0]')
+    o.append('  set src [lindex $srcs $i 1]')
+    o.append('  if {[string range [file extension $src] 0 3] == ".vhd"} {')
+    o.append('    vcom {*}$vcom_args -work $lib $src')
+    o.append('  } else {')
+    o.append('    vlog {*}$vlog_args -work $lib $src')
+    o.append('  }')
+    o.append('  close [open "$lib/[file tail $src].com" w]')
+    o.append('}')
+    o.append('')
+    o.append('# compile changed sources and their dependents (skips all others)')
+    o.append('proc com {{force ""}} {')
+    o.append('  global srcs rdeps')
+    o.append('  set n [llength $srcs]')
+    o.append('  set needed [lrepeat $n [expr ! [string equal $force ""]]]')
+    o.append('  set t [lrepeat $n 0]')
+    o.append('  for {set i 0} {$i < $n} {incr i} {')
+    o.append('    set src [lindex $srcs $i 1]')
+    o.append('    set com "[lindex $srcs $i 0]/[file tail $src].com"')
+    o.append('    if {[file exists $com]} {lset t $i [file mtime $com]}')
+    o.append('    if {[lindex $t $i] == 0 || [file mtime $src] > [lindex $t $i]} {')
+    o.append('      lset needed $i 1')
+    o.append('    }')
+    o.append('  }')
+    o.append('  for {set i 0} {$i < $n} {incr i} {')
+    o.append('    foreach j [lindex $rdeps $i] {')
+    o.append('      if {[lindex $needed $i] || [lindex $t $i] > [lindex $t $j]} {')
+    o.append('        lset needed $j 1')
+    o.append('      }')
+    o.append('    }')
+    o.append('  }')
+    o.append('  set skipped 0')
+    o.append('  for {set i 0} {$i < $n} {incr i} {')
+    o.append('    if {[lindex $needed $i]} {')
+    o.append('      com_src $i')
+    o.append('    } else {')
+    o.append('      incr skipped')
+    o.append('    }')
+    o.append('  }')
+    o.append('  puts "compiled [expr $n - $skipped] of $n source(s), skipped $skipped up to date"')
+    o.append('}')
+    o.append('')
+    o.append('# simulate specified run (defaults to first run)')
+    o.append('proc sim {{r ""}} {')
+    o.append('  global runs vsim_args')
+    o.append('  if {$r == ""} {set r [lindex [lindex $runs 0] 0]}')
+    o.append('  set runs_dict [dict create]')
+    o.append('  foreach run $runs {dict set runs_dict [lindex $run 0] [lrange $run 1 3]}')
+    o.append('  if {[dict exists $runs_dict $r]} {')
+    o.append('    set l [dict get $runs_dict $r]')
+    o.append('    set top [lindex $l 0]')
+    o.append('    set gen [lindex $l 1]')
+    o.append('    set sdf [lindex $l 2]')
+    o.append('    set vsim_run_gen [join [lmap g $gen {string cat "-g[lindex $g 0]=[lindex $g 1]"}]]')
+    o.append('    set vsim_run_sdf [join [lmap m $sdf {string cat "-sdf[lindex $m 0] [lindex $m 1]=[lindex $m 2]"}]]')
+    o.append('    vsim {*}$vsim_args {*}$vsim_run_gen {*}$vsim_run_sdf $top')
+    o.append('  } else {')
+    o.append('    throw {run not found} {run $s not found}')
+    o.append('  }')
+    o.append('}')
+    o.append('')
+    o.append('# resimulate')
+    o.append('proc resim {} {')
+    o.append('  restart -f; run -all; noview .main_pane.source; view wave')
+    o.append('}')
+    o.append('')
+    o.append('# compile sources with given indices (from watch_vsim.py), in order')
+    o.append('proc com_list {l} {')
+    o.append('  global srcs')
+    o.append('  foreach i [lsort -integer -unique $l] {com_src $i}')
+    o.append('  puts "compiled [llength $l] of [llength $srcs] source(s)"')
+    o.append('}')
+    o.append('')
+    o.append('# serve requests from watch_vsim.py on a local socket: the port and a')
+    o.append('# token are written to a file for watch_vsim.py to read')
+    o.append('# requests (one per line): token recompile {i j ...} | token resim')
+    o.append('proc serve {{file .watch_vsim}} {')
+    o.append('  global serve_token')
+    o.append('  set serve_token [format %08x%08x [expr {int(rand()*0x7fffffff)}] [clock microseconds]]')
+    o.append('  set s [socket -server serve_accept -myaddr 127.0.0.1 0]')
+    o.append('  set f [open $file w]')
+    o.append('  puts $f "[lindex [fconfigure $s -sockname] 2] $serve_token"')
+    o.append('  close $f')
+    o.append('  puts "serving watch_vsim.py requests on port [lindex [fconfigure $s -sockname] 2]"')
+    o.append('}')
+    o.append('proc serve_accept {ch addr port} {')
+    o.append('  fconfigure $ch -buffering line')
+    o.append('  fileevent $ch readable [list serve_read $ch]')
+    o.append('}')
+    o.append('proc serve_read {ch} {')
+    o.append('  global serve_token')
+    o.append('  if {[gets $ch line] < 0} {close $ch; return}')
+    o.append('  if {[lindex $line 0] != $serve_token} {')
+    o.append('    set e 1; set m "bad token"')
+    o.append('  } else {')
+    o.append('    switch -- [lindex $line 1] {')
+    o.append('      recompile {set e [catch {com_list [lindex $line 2]; resim} m]}')
+    o.append('      resim     {set e [catch {resim} m]}')
+    o.append('      default   {set e 1; set m "unknown request: [lindex $line 1]"}')
+    o.append('    }')
+    o.append('  }')
+    o.append('  puts $ch "[expr {$e ? "error" : "ok"}] [string map {"\\n" " "} $m]"')
+    o.append('}')
+    o.append('')
+    o.append('# when this script is executed: initialise and compile all')
+    o.append('init')
+    o.append('com')
+    if serve:
+        o.append('serve')
+    return '\n'.join(o)+'\n'
 
-args=parser.parse_args()
-c,d=process_src(args.src,args.work)
-runs=process_run(flatten(args.run))
-args.lib=flatten(args.lib)
-args.gen=process_gen(flatten(args.gen))
-args.sdf=process_sdf(flatten(args.sdf))
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='do_vsim.py',
+        description='Create makefiles for simulating FPGA designs with ModelSim/Questa/etc',
+        epilog=help_run,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    parser.add_argument(
+        '--path',
+        help='path to tool binaries'
+       )
+    parser.add_argument(
+        '--lib',
+        nargs='+',
+        action='append',
+        help='precompiled libraries'
+       )
+    parser.add_argument(
+        '--lib_defs',
+        help='shared library cache definitions: precompiled libraries defined here are taken from the cache (see libcache_fpga.py)'
+       )
+    parser.add_argument(
+        '--vhdl',
+        choices=['1987','1993','2002','2008'],
+        help='VHDL LRM version (defaults to 2008)',
+        default='2008'
+       )
+    parser.add_argument(
+        '--work',
+        help='work library (defaults to "work")',
+        default='work'
+       )
+    parser.add_argument(
+        '--src',
+        required=True,
+        nargs='+',
+        action='append',
+        help='source(s) in compile order, globs or directories (append =LIB to specify library name)'
+       )
+    parser.add_argument(
+        '--run',
+        required=True,
+        nargs='+',
+        action='append',
+        help='simulation run specification(s) (see below)'
+       )
+    parser.add_argument(
+        '--gen',
+        nargs='+',
+        action='append',
+        help='generics assignment(s) (applied to all runs)'
+       )
+    parser.add_argument(
+        '--sdf',
+        nargs='+',
+        action='append',
+        help='SDF mapping(s) (applied to all runs)'
+       )
+    parser.add_argument(
+        '--no_scan',
+        action='store_true',
+        help='do not scan sources for dependencies (recompile all later sources)'
+       )
+    parser.add_argument(
+        '--scan_cache',
+        help='source scan cache file (defaults to %s)' % scan_cache_file,
+        default=scan_cache_file
+       )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='serve recompile/restart requests from watch_vsim.py once compiled'
+       )
+    args = parser.parse_args(argv)
+    p = make_project(
+        flatten(args.src),
+        work=args.work,
+        run=flatten(args.run),
+        gen=flatten(args.gen),
+        sdf=flatten(args.sdf),
+        vhdl=args.vhdl,
+        lib=flatten(args.lib),
+        lib_defs=args.lib_defs or '',
+        scan=not args.no_scan,
+        scan_cache=args.scan_cache
+        )
+    sys.stdout.write(emit(p,serve=args.serve))
 
-# output
-
-print('# TCL script generated by do_vsim.py (see https://github.com/amb5l/make-fpga)')
-print('# for simulation using ModelSim/Questa/etc')
-
-print('################################################################################')
-print('# simulation specific definitions')
-print('')
-print('# list of source specs in compilation order')
-print('# each source spec is a list containing library name and source file')
-print('quietly set srcs {')
-for l,s in c:
-    print('  { '+l+' '+s+' '+'}')
-print('}')
-print('')
-print('# list of generic assignments applied to all runs')
-print('# each generic assignment is a list containing name and value')
-print('quietly set gens {')
-for n,v in args.gen:
-    print(' { %s {%s} }' % (n,v))
-print('}')
-print('')
-print('# list of SDF mappings applied to all runs')
-print('# each SDF mapping is a list containing delay, design unit path and filename')
-print('quietly set sdfs {')
-for t,p,f in args.sdf:
-    print(' { %s %s %s }' % (t,p,f))
-print('}')
-print('')
-print('# list of simulation run specs')
-print('# each run spec is a list containing name and run specifics:')
-print('#  top design unit, generic assignment list and SDF mapping list')
-print('quietly set runs {')
-for r in runs:
-    gen = ['{ '+n+' '+v+' }' for n,v in r[2]]
-    sdf = ['{ '+t+' '+p.replace('//','/')+' '+f+' }' for t,p,f in r[3]]
-    print(' { '+r[0]+' '+r[1]+' { '+' '.join(gen)+' } { '+' '+' '.join(sdf)+' } }')
-print('}')
-print('')
-print('# list of precompiled libraries to use')
-print('quietly set libs { '+' '.join(args.lib)+' }')
-print('')
-print('# work library name')
-print('quietly set work "'+args.work+'"')
-print('')
-print('# VHDL LRM version')
-print('quietly set vhdl "'+args.vhdl+'"')
-print('')
-print('# arguments for vcom')
-print('quietly set vcom_args "-modelsimini modelsim.ini -explicit -stats=none -work $work -$vhdl"')
-print('')
-print('# arguments for vlog')
-print('quietly set vlog_args "-modelsimini modelsim.ini -stats=none"')
-print('')
-print('# arguments for vsim')
-print('quietly set vsim_lib [join [lmap l $libs {string cat "-L $l"}]]')
-print('quietly set vsim_gen [join [lmap g $gens {string cat "-g[lindex $g 0]=[lindex $g 1]"}]]')
-print('quietly set vsim_sdf [join [lmap m $sdfs {string cat "-sdf[lindex $m 0] [lindex $m 1]=[lindex $m 2]"}]]')
-print('quietly set vsim_tcl "set NumericStdNoWarnings 1; if \[file exists wave.do\] {do wave.do}; run -all; noview .main_pane.source; view wave; wave zoom full"')
-print('quietly set vsim_args "$vsim_lib $vsim_gen -t ps -gui -onfinish stop -do \\"$vsim_tcl\\""')
-print('')
-print('################################################################################')
-print('# common section')
-print('')
-print('# initialise - create modelsim.ini, then create and map user libaries')
-print('proc init {} {')
-print('  global srcs ')
-print('  if {![file exists modelsim.ini]} {vmap -c}')
-print('  set srcs_dict [dict create]')
-print('  foreach src $srcs {dict set srcs_dict [lindex $src 0] [lindex $src 1]}')
-print('  foreach lib [dict keys $srcs_dict] {')
-print('    if {![file isdirectory $lib]} {')
-print('      vlib $lib')
-print('      vmap -modelsimini modelsim.ini $lib $lib')
-print('    }')
-print('  }')
-print('}')
-print('')
-print('# compile all (skips up to date sources)')
-print('proc com {{force ""}} {')
-print('  global srcs vcom_args vlog_args')
-print('  set compile_needed [expr ! [string equal $force ""]]')
-print('  foreach s $srcs {')
-print('    set lib [lindex $s 0]')
-print('    set src [lindex $s 1]')
-print('    set com "$lib/[file tail $src].com"')
-print('    if {![file exist $com]} {')
-print('      set compile_needed 1')
-print('    } else {')
-print('      if {[file mtime $src] > [file mtime $com]} {')
-print('        set compile_needed 1')
-print('      }')
-print('    }')
-print('    if {$compile_needed} {')
-print('      if {[string range [file extension $src] 0 3] == ".vhd"} {')
-print('        vcom {*}$vcom_args -work $lib $src')
-print('      } else {')
-print('        vlog {*}$vlog_args -work $lib $src')
-print('      }')
-print('      close [open $com w]')
-print('    } else {')
-print('      puts "skipping compilation of $src"')
-print('    }')
-print('  }')
-print('}')
-print('')
-print('# simulate specified run (defaults to first run)')
-print('proc sim {{r ""}} {')
-print('  global runs vsim_args')
-print('  if {$r == ""} {set r [lindex [lindex $runs 0] 0]}')
-print('  set runs_dict [dict create]')
-print('  foreach run $runs {dict set runs_dict [lindex $run 0] [lrange $run 1 3]}')
-print('  if {[dict exists $runs_dict $r]} {')
-print('    set l [dict get $runs_dict $r]')
-print('    set top [lindex $l 0]')
-print('    set gen [lindex $l 1]')
-print('    set sdf [lindex $l 2]')
-print('    set vsim_run_gen [join [lmap g $gen {string cat "-g[lindex $g 0]=[lindex $g 1]"}]]')
-print('    set vsim_run_sdf [join [lmap m $sdf {string cat "-sdf[lindex $m 0] [lindex $m 1]=[lindex $m 2]"}]]')
-print('    vsim {*}$vsim_args {*}$vsim_run_gen {*}$vsim_run_sdf $top')
-print('  } else {')
-print('    throw {run not found} {run $s not found}')
-print('  }')
-print('}')
-print('')
-print('# resimulate')
-print('proc resim {} {')
-print('  restart -f; run -all; noview .main_pane.source; view wave')
-print('}')
-print('')
-print('# when this script is executed: initialise and compile all')
-print('init')
-print('com')
+if __name__ == '__main__':
+    main()
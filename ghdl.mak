@@ -11,10 +11,23 @@
 #                    name=<lib:>unit<;generic=value<,generic=value...>>
 #                  For a single run, name= may be omitted and defaults to 'sim='
 # GHDL_EDIT        Set to 0 to disable Visual Studio Code 'edit' goal.
+# GHDL_ELAB        Set to 0 to elaborate for every run (--elab-run) instead of
+#                  once per top (default: 0 for the mcode backend, else 1).
+# STAMP            Set to 0 to track compilation by mtime only (no content hash).
+# BUILTIN_RULES    Set to 0 to disable make's built-in implicit rules (speeds up make
+#                  start up for large designs, but applies to your whole makefile).
 ################################################################################
 
 include $(dir $(lastword $(MAKEFILE_LIST)))/common.mak
 
+# built-in implicit rules are not used here, and searching them for every
+# source file dominates make start up time for large designs, but turning them
+# off affects the whole makefile (and sub-makes), so this is left to the user
+ifeq (0,$(BUILTIN_RULES))
+MAKEFLAGS+=--no-builtin-rules
+.SUFFIXES:
+endif
+
 # defaults
 .PHONY: ghdl_default ghdl_force
 ghdl_default: ghdl
@@ -27,6 +40,10 @@ GHDL_VENDOR_LIB_PATH?=$(subst /,$(if $(filter Windows_NT,$(OS)),\,/),$(dir $(she
 GHDL_AOPTS?=-fsynopsys -frelaxed -Wno-hide -Wno-shared $(addprefix -P$(GHDL_VENDOR_LIB_PATH),$(GHDL_VENDOR_LIB))
 GHDL_EOPTS?=-fsynopsys -frelaxed $(addprefix -P$(GHDL_VENDOR_LIB_PATH),$(GHDL_VENDOR_LIB))
 GHDL_ROPTS?=--max-stack-alloc=0 --ieee-asserts=disable
+ifndef GHDL_ELAB
+GHDL_ELAB:=$(if $(findstring mcode,$(shell $(GHDL) --version)),0,1)
+endif
+GHDL_EXE=$(if $(filter Windows_NT,$(OS)),.exe)
 
 # checks
 $(if $(strip $(GHDL_SRC)),,$(error GHDL_SRC not defined))
@@ -39,8 +56,15 @@ endif
 $(if $(filter 1987 1993 2002 2008 2019,$(GHDL_LRM)),,$(error GHDL_LRM value is unsupported: $(GHDL_LRM)))
 $(foreach s,$(GHDL_SRC),$(if $(filter 1987 1993 2002 2008 2019,$(call get_src_lrm,$s,$(GHDL_LRM))),,$(error source file LRM is unsupported: $s)))
 
-# compilation dependencies enforce compilation order
-dep:=$(firstword $(GHDL_SRC))<= $(if $(word 2,$(GHDL_SRC)),$(call pairmap,src_dep,$(call rest,$(GHDL_SRC)),$(call chop,$(GHDL_SRC))),)
+# compilation dependencies: each source depends on the sources providing the
+# units it uses, as scanned by make_fpga.py (so that make -j compiles in parallel)
+GHDL_COM:=$(call src_stamps,$(GHDL_SRC),$(GHDL_DIR),$(GHDL_WORK))
+GHDL_DEPS:=$(GHDL_DIR)/deps.mk
+$(GHDL_DEPS): $(call get_src_file,$(GHDL_SRC)) $(MAKEFILE_LIST)
+	@$(PYTHON) $(MAKE_FPGA_PY) deps --dir $(GHDL_DIR) --work $(GHDL_WORK) --out $@ $(foreach s,$(GHDL_SRC),'$s')
+ifneq (,$(filter-out clean help,$(or $(MAKECMDGOALS),default)))
+-include $(GHDL_DEPS)
+endif
 
 # extract libraries from sources
 GHDL_LIB=$(call nodup,$(call get_src_lib,$(GHDL_SRC),$(GHDL_WORK)))
@@ -59,32 +83,58 @@ $(foreach l,$(GHDL_LIB),$(eval $(call rr_touchdir,$l)))
 # $1 = source path/file
 # $2 = source library
 # $3 = LRM
-# $4 = dependency source path/file
-# $5 = dependency source library
+# GHDL rewrites a library's index file on each analysis, so analyses into the
+# same library hold its lock
 define rr_com
-$(GHDL_DIR)/$(strip $2)/.touch/$(notdir $(strip $1)): $(strip $1) $(if $(strip $4),$(GHDL_DIR)/$(strip $5)/.touch/$(notdir $(strip $4))) | $(GHDL_DIR)/$(strip $2)/.touch
-	@cd $(GHDL_DIR) && $(GHDL) -a --work=$(strip $2) --std=$(strip $3) $$(GHDL_AOPTS) $$<
-	@touch $$@
+$(GHDL_DIR)/$(strip $2)/.touch/$(notdir $(strip $1)): $(strip $1) | $(GHDL_DIR)/$(strip $2)/.touch
+	@$$(call stamp,$$@,$$^,$(GHDL_DIR),$(PYTHON) $(MAKE_FPGA_PY) lock $(strip $2)/.lock -- $(GHDL) -a --work=$(strip $2) --std=$(strip $3) $$(GHDL_AOPTS) $$<)
 endef
-$(foreach d,$(dep),$(eval $(call rr_com, \
-	$(call get_src_file, $(word 1,$(subst <=, ,$d))), \
-	$(call get_src_lib,  $(word 1,$(subst <=, ,$d)),$(GHDL_WORK)), \
-	$(call get_src_lrm2, $(word 1,$(subst <=, ,$d)),$(GHDL_LRM)), \
-	$(call get_src_file, $(word 2,$(subst <=, ,$d))), \
-	$(call get_src_lib,  $(word 2,$(subst <=, ,$d)),$(GHDL_WORK))  \
+$(foreach s,$(GHDL_SRC),$(eval $(call rr_com, \
+	$(call get_src_file, $s), \
+	$(call get_src_lib,  $s,$(GHDL_WORK)), \
+	$(call get_src_lrm2,$s,$(GHDL_LRM)) \
 )))
 
+# elaboration, once per top (generics are applied at run time)
+# the stamp records the compiled inputs and elaboration options, so the
+# executable is only rebuilt when one of these changes
+# $1 = design unit library
+# $2 = design unit
+define rr_elab
+$(GHDL_DIR)/.elab/$(strip $1)/$(strip $2).stamp: $(GHDL_COM)
+	$(call banner,GHDL: elaborate $(strip $1).$(strip $2))
+	@$(MKDIR) -p $$(@D) && test -f $(GHDL_DIR)/.elab/$(strip $1)/$(strip $2)$(GHDL_EXE) || rm -f $$@
+	@$$(call stamp,$$@,$$^,$(GHDL_DIR),$(GHDL) -e --work=$(strip $1) --std=08 $$(GHDL_EOPTS) -o .elab/$(strip $1)/$(strip $2)$(GHDL_EXE) $(strip $2))
+endef
+ifneq (0,$(GHDL_ELAB))
+$(foreach t,$(call nodup,$(foreach r,$(GHDL_RUN),$(call get_run_lib,$r,$(GHDL_WORK)):$(call get_run_unit,$r))),$(eval $(call rr_elab, \
+	$(word 1,$(subst :, ,$t)), \
+	$(word 2,$(subst :, ,$t))  \
+)))
+endif
+
 # simulation run
 # $1 = run name
 # $2 = design unit library
 # $3 = design unit
 # $4 = list of generic=value
 .PHONY: ghdl
+ifneq (0,$(GHDL_ELAB))
 define rr_run
 .PHONY: ghdl.$(strip $1)
-ghdl.$(strip $1):: $(GHDL_DIR)/$(call get_src_lib,$(lastword $(GHDL_SRC)),$(GHDL_WORK))/.touch/$(notdir $(call get_src_file,$(lastword $(GHDL_SRC))))
+ghdl.$(strip $1):: $(GHDL_DIR)/.elab/$(strip $2)/$(strip $3).stamp
 	$(call banner,GHDL: simulation run = $1)
-	@cd $(GHDL_DIR) && $(GHDL) \
+	@cd $(GHDL_DIR) && $$(STEP) .elab/$(strip $2)/$(strip $3)$(GHDL_EXE) \
+		$(GHDL_ROPTS) \
+		$(addprefix -g,$(strip $4))
+ghdl:: ghdl.$(strip $1)
+endef
+else
+define rr_run
+.PHONY: ghdl.$(strip $1)
+ghdl.$(strip $1):: $(GHDL_COM)
+	$(call banner,GHDL: simulation run = $1)
+	@cd $(GHDL_DIR) && $$(STEP) $(GHDL) \
 		--elab-run \
 		--work=$(strip $2) \
 		--std=08 \
@@ -94,6 +144,7 @@ ghdl.$(strip $1):: $(GHDL_DIR)/$(call get_src_lib,$(lastword $(GHDL_SRC)),$(GHDL
 		$(addprefix -g,$(strip $4))
 ghdl:: ghdl.$(strip $1)
 endef
+endif
 $(foreach r,$(GHDL_RUN),$(eval $(call rr_run, \
 	$(call get_run_name, $r), \
 	$(call get_run_lib,  $r, $(GHDL_WORK)), \
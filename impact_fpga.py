@@ -0,0 +1,170 @@
+################################################################################
+# impact_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script selects the simulation runs affected by a change: given changed
+# files (or a git revision range), it uses the source dependency graph to find
+# the runs whose top level design units depend on them, and prints their names
+# (e.g. as goals for a makefile generated by make_nvc.py or make_vsim.py).
+################################################################################
+
+import sys,os,argparse,fnmatch,subprocess
+from make_fpga import *
+
+help_impact = \
+    'A run is affected if its top level design unit depends, directly or\n' \
+    'indirectly, on a changed source or include file. The sources a unit\n' \
+    'depends on are those providing it, their prerequisites and the sources\n' \
+    'of secondary units only (architectures, package bodies) that depend on\n' \
+    'them. All runs are affected if a changed file is an other prerequisite\n' \
+    '(--dep), matches --all_if, or is a source that cannot be scanned, and\n' \
+    'a run whose top is not found is always affected. Nothing is printed if no\n' \
+    'run is affected, so check for this before passing the names to make\n' \
+    '(which would otherwise do all runs).\n' \
+    'Example:\n' \
+    '  runs=$(python3 impact_fpga.py --src ... --run ... --git origin/main...)\n' \
+    '  [ -z "$runs" ] || make $runs\n'
+
+# changed files from git: between revisions (e.g. A..B, A...B) or between a
+# revision and the working tree
+def git_changed(rev):
+    try:
+        top = subprocess.run(['git','rev-parse','--show-toplevel'],capture_output=True,text=True,check=True).stdout.strip()
+        out = subprocess.run(['git','diff','--name-only',rev],capture_output=True,text=True,check=True).stdout
+    except (OSError,subprocess.CalledProcessError) as e:
+        error_exit('git: %s' % (getattr(e,'stderr','') or e).strip())
+    return [os.path.join(top,f) for f in out.splitlines() if f]
+
+# indices of the sources that unit top depends on, or None if no source
+# provides it
+def needed(c,deps,scan,top):
+    u = top.lower().rsplit('.',1)[-1]
+    start = [i for i,(_,s) in enumerate(c) if scan[s] and u in scan[s]['units']]
+    if not start:
+        return None
+    users = [[] for _ in c]
+    for j,(q,_) in enumerate(deps):
+        for i in q:
+            users[i].append(j)
+    seen = set()
+    stack = start
+    while stack:
+        i = stack.pop()
+        if i in seen:
+            continue
+        seen.add(i)
+        stack += deps[i][0]
+        stack += [j for j in users[i] if scan[c[j][1]] is not None and not scan[c[j][1]]['units']]
+    return seen
+
+# runs (of project p) affected by changed files, with the reason for each
+def affected(p,changed,all_if=()):
+    norm = lambda f: os.path.normcase(os.path.realpath(f))
+    changed = set(map(norm,changed))
+    deps = p.deps()
+    scan = scan_srcs(list(dict.fromkeys(s for _,s in p.src)),p.scan_cache if p.scan else '')
+    why = None
+    for f in changed:
+        if any(fnmatch.fnmatch(f,x) or fnmatch.fnmatch(os.path.basename(f),x) for x in all_if):
+            why = 'matches --all_if: %s' % f
+    for f in p.dep:
+        if norm(f) in changed:
+            why = 'prerequisite changed: %s' % f
+    for _,s in p.src:
+        if norm(s) in changed and scan[s] is None:
+            why = 'source cannot be scanned: %s' % s
+    if why:
+        return [(r,why) for r in p.runs]
+    r = []
+    for run in p.runs:
+        n = needed(p.src,deps,scan,run.top)
+        if n is None:
+            r.append((run,'top not found: %s' % run.top))
+            continue
+        hit = [p.src[i][1] for i in sorted(n) if norm(p.src[i][1]) in changed]
+        hit += [f for i in sorted(n) for f in deps[i][1] if norm(f) in changed]
+        if hit:
+            r.append((run,'depends on '+', '.join(dict.fromkeys(hit))))
+    return r
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='impact_fpga.py',
+        description='Select the simulation runs affected by changed files',
+        epilog=help_impact+'\n'+help_run,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    parser.add_argument(
+        '--work',
+        help='work library (defaults to "work")',
+        default='work'
+       )
+    parser.add_argument(
+        '--src',
+        required=True,
+        nargs='+',
+        action='append',
+        help='source(s) in compile order, globs or directories (append =LIB to specify library name)'
+       )
+    parser.add_argument(
+        '--dep',
+        nargs='+',
+        action='append',
+        help='other dependancies e.g. data files'
+       )
+    parser.add_argument(
+        '--run',
+        required=True,
+        nargs='+',
+        action='append',
+        help='simulation run specification(s) (see below)'
+       )
+    parser.add_argument(
+        '--scan_cache',
+        help='source scan cache file (defaults to %s)' % scan_cache_file,
+        default=scan_cache_file
+       )
+    parser.add_argument(
+        '--changed',
+        nargs='+',
+        action='append',
+        help='changed file(s)'
+       )
+    parser.add_argument(
+        '--git',
+        metavar='REV',
+        help='take changed files from git diff REV (e.g. origin/main...HEAD, or HEAD for uncommitted changes)'
+       )
+    parser.add_argument(
+        '--all_if',
+        nargs='+',
+        action='append',
+        help='changes to files matching these globs affect all runs (e.g. "*.mak")'
+       )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help='print the reason each run is affected (to stderr)'
+       )
+    args = parser.parse_args(argv)
+    changed = flatten(args.changed)
+    if args.git:
+        changed += git_changed(args.git)
+    elif not changed:
+        error_exit('no changes specified (use --changed or --git)')
+    p = make_project(
+        flatten(args.src),
+        work=args.work,
+        run=flatten(args.run),
+        dep=flatten(args.dep),
+        scan_cache=args.scan_cache
+        )
+    r = affected(p,changed,flatten(args.all_if))
+    for run,why in r:
+        print(run.name)
+        if args.verbose:
+            print('%s: %s' % (run.name,why),file=sys.stderr)
+    print('%d of %d run(s) affected by %d changed file(s)' % (len(r),len(p.runs),len(changed)),file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+################################################################################
+# ipcache_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script maintains a shared cache of Vivado IP and block design (BD)
+# builds: the generated products and out-of-context synthesis checkpoints of
+# each are stored once per hash of its TCL, the part and the Vivado version,
+# in a user or site level directory, and are restored into later builds and
+# other projects instead of being regenerated and resynthesised.
+# The least recently used entries are evicted when the cache is too big.
+################################################################################
+
+import sys,os,argparse,json,glob,time,shutil,shlex,subprocess
+from make_fpga import *
+from libcache_fpga import tool_version,read_meta,dir_size
+
+help_cache = \
+    'On a miss, the directories are deleted and the build command (which must\n' \
+    'create them, e.g. make-fpga.tcl "build ip_ooc") is run; the directories are\n' \
+    'then stored in the cache. On a hit, they are restored from the cache and\n' \
+    'the --hit command (e.g. make-fpga.tcl "build ip_add") is run.\n' \
+    'The cache directory is $MAKE_FPGA_IP_CACHE if set (e.g. a site wide\n' \
+    'shared directory), otherwise $XDG_CACHE_HOME/make-fpga/ip or\n' \
+    '~/.cache/make-fpga/ip. Its size limit is $MAKE_FPGA_IP_CACHE_SIZE\n' \
+    '(e.g. 20G, default 50G).\n' \
+    'Example:\n' \
+    '  ipcache_fpga.py get clk_wiz --key clk_wiz.tcl --part xc7a35t \\\n' \
+    '    --dirs fpga.srcs/sources_1/ip/clk_wiz fpga.gen/sources_1/ip/clk_wiz \\\n' \
+    '    --hit "vivado ... build ip_add ..." -- vivado ... build ip_ooc ...\n'
+
+# entries that are in use are not evicted within this time of their last use
+evict_grace = 3600
+
+def cache_root():
+    r = os.environ.get('MAKE_FPGA_IP_CACHE')
+    if not r:
+        r = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'),'.cache'),'make-fpga','ip')
+    return r
+
+def cache_max():
+    return parse_size(os.environ.get('MAKE_FPGA_IP_CACHE_SIZE','50G'))
+
+# cache key: name, part, Vivado version, options and key file contents
+def ip_key(name,part,version,opts,keys):
+    h = hashlib.sha1(json.dumps([name,part,version,opts]).encode())
+    for k in keys:
+        h.update((os.path.basename(k)+'\0'+file_hash(k)+'\0').encode())
+    return h.hexdigest()[:20]
+
+def copy_dir(src,dst):
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    shutil.copytree(src,dst,symlinks=True)
+
+# restore entry name into dirs (building it if it is not in the cache),
+# returns True on a cache hit
+def get(name,part,version,opts,keys,dirs,build,hit=None):
+    key = ip_key(name,part,version,opts,keys)
+    entry = os.path.join(cache_root(),name+'-'+key)
+    os.makedirs(cache_root(),exist_ok=True)
+    # build under an exclusive lock: concurrent builds wanting the same entry wait for it
+    with locked(entry+'.lock'):
+        meta = read_meta(entry)
+        if meta is None:
+            if os.path.isdir(entry):
+                shutil.rmtree(entry) # incomplete
+            for d in dirs:
+                if os.path.isdir(d):
+                    shutil.rmtree(d)
+            print('ip cache: building %s (key %s)' % (name,key),flush=True)
+            t0 = time.time()
+            if subprocess.call(build):
+                error_exit('build of %s failed: %s' % (name,' '.join(build)))
+            missing = [d for d in dirs if not os.path.isdir(d)]
+            if missing:
+                error_exit('build of %s did not create %s' % (name,' '.join(missing)))
+            os.makedirs(entry)
+            for i,d in enumerate(dirs):
+                copy_dir(d,os.path.join(entry,str(i)))
+            meta = {'name': name,'part': part,'version': version,'opts': opts,'keys': keys,'dirs': dirs,
+                'build_time': round(time.time()-t0,1),'size': dir_size(entry)}
+            r = False
+        else:
+            print('ip cache: restoring %s from %s' % (name,entry),flush=True)
+            for i,d in enumerate(dirs):
+                copy_dir(os.path.join(entry,str(i)),d)
+            r = True
+        meta['used'] = time.time()
+        write_if_changed(os.path.join(entry,'meta.json'),json.dumps(meta,indent=1)+'\n')
+    if r and hit and subprocess.call(hit):
+        error_exit('%s restored but command failed: %s' % (name,' '.join(hit)))
+    if not r:
+        prune(cache_max(),keep={entry})
+    return r
+
+# cache entries: list of (entry directory,meta), least recently used first
+def entries():
+    r = []
+    for e in glob.glob(os.path.join(cache_root(),'*')):
+        if os.path.isdir(e):
+            m = read_meta(e)
+            if m:
+                r.append((e,m))
+    return sorted(r,key=lambda x: x[1].get('used',0))
+
+# evict least recently used entries until the cache is no bigger than limit
+# (entries used recently or being built are kept)
+def prune(limit,keep=(),grace=evict_grace):
+    with locked(os.path.join(cache_root(),'.evict.lock')):
+        l = entries()
+        total = sum(m.get('size',0) for _,m in l)
+        now = time.time()
+        for e,m in l:
+            if total <= limit:
+                break
+            if e in keep or now-m.get('used',0) < grace:
+                continue
+            with locked(e+'.lock',wait=False) as ok:
+                if ok:
+                    shutil.rmtree(e,ignore_errors=True)
+                    os.remove(e+'.lock')
+                    total -= m.get('size',0)
+                    print('evicted %s (%.1f MB)' % (e,m.get('size',0)/(1<<20)),file=sys.stderr)
+        return total
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    cmd = []
+    if '--' in argv:
+        cmd = argv[argv.index('--')+1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser(
+        prog='ipcache_fpga.py',
+        description='Shared cache of Vivado IP and block design builds (generated products and out-of-context synthesis)',
+        epilog=help_cache,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    sub = parser.add_subparsers(dest='cmd',required=True)
+    p = sub.add_parser(
+        'get',
+        help='restore an IP or BD build from the cache, building and storing it if necessary',
+        usage='ipcache_fpga.py get NAME --key FILE [FILE ...] --part PART --dirs DIR [DIR ...] [--hit COMMAND] -- COMMAND ...'
+       )
+    p.add_argument(
+        'name',
+        help='IP or BD name'
+       )
+    p.add_argument(
+        '--key',
+        nargs='+',
+        required=True,
+        help='files whose contents the build depends on (e.g. the IP or BD TCL)'
+       )
+    p.add_argument(
+        '--part',
+        required=True,
+        help='FPGA part'
+       )
+    p.add_argument(
+        '--opts',
+        nargs='+',
+        default=[],
+        help='other settings the build depends on (e.g. BD synthesis checkpoint mode)'
+       )
+    p.add_argument(
+        '--vivado',
+        help='Vivado executable, run to find its version (defaults to "vivado")',
+        default='vivado'
+       )
+    p.add_argument(
+        '--dirs',
+        nargs='+',
+        required=True,
+        help='directories created by the build (restored on a hit)'
+       )
+    p.add_argument(
+        '--hit',
+        help='command to run after restoring (e.g. to add the IP to a project)'
+       )
+    p = sub.add_parser(
+        'list',
+        help='list cached IP and BD builds, least recently used first'
+       )
+    p = sub.add_parser(
+        'prune',
+        help='evict least recently used entries until the cache is within its size limit'
+       )
+    p.add_argument(
+        '--size',
+        help='size limit (defaults to $MAKE_FPGA_IP_CACHE_SIZE or 50G)'
+       )
+    p.add_argument(
+        '--grace',
+        type=float,
+        help='keep entries used within this many seconds (defaults to %d)' % evict_grace,
+        default=evict_grace
+       )
+    args = parser.parse_args(argv)
+    if args.cmd == 'get':
+        if not cmd:
+            error_exit('no build command (give it after --)')
+        for k in args.key:
+            if not os.path.isfile(k):
+                error_exit('key file not found: %s' % k)
+        version = tool_version([args.vivado,'-version'])
+        get(args.name,args.part,version,args.opts,args.key,args.dirs,cmd,shlex.split(args.hit) if args.hit else None)
+    elif args.cmd == 'list':
+        total = 0
+        for e,m in entries():
+            total += m.get('size',0)
+            print('%s  %8.1f MB  %6.1fs  %s' % (time.strftime('%Y-%m-%d %H:%M',time.localtime(m.get('used',0))),
+                m.get('size',0)/(1<<20),m.get('build_time',0),e))
+        print('total %.1f MB (limit %.1f MB) in %s' % (total/(1<<20),cache_max()/(1<<20),cache_root()))
+    elif args.cmd == 'prune':
+        total = prune(parse_size(args.size) if args.size else cache_max(),grace=args.grace)
+        print('cache size %.1f MB' % (total/(1<<20)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+################################################################################
+# libcache_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script maintains a shared cache of precompiled simulation libraries
+# (e.g. UNISIM, XPM, OSVVM, UVVM). Each library is compiled once per
+# simulator and version, LRM, options and source content, into a user or site
+# level directory, and is shared by all workspaces and CI jobs that use it.
+# The least recently used libraries are evicted when the cache is too big.
+################################################################################
+
+import sys,os,argparse,json,glob,time,shutil,subprocess
+from make_fpga import *
+
+help_defs = \
+    'Libraries are defined by a JSON file as follows:\n' \
+    '  {\n' \
+    '    "name": {\n' \
+    '      "src":  [ source, ... ],          in compile order, globs allowed\n' \
+    '      "lrm":  "2008",                   VHDL LRM (defaults to 2008)\n' \
+    '      "deps": [ name, ... ],            libraries this library uses\n' \
+    '      "opts": { "nvc": [ option, ... ], "ghdl": [...], "vsim": [...] }\n' \
+    '    },\n' \
+    '    ...\n' \
+    '  }\n' \
+    'Source paths are relative to the definitions file.\n' \
+    'The cache directory is $MAKE_FPGA_LIB_CACHE if set (e.g. a site wide\n' \
+    'shared directory), otherwise $XDG_CACHE_HOME/make-fpga/libs or\n' \
+    '~/.cache/make-fpga/libs. Its size limit is $MAKE_FPGA_LIB_CACHE_SIZE\n' \
+    '(e.g. 20G, default 50G).\n'
+
+# libraries that are in use are not evicted within this time of their last use
+evict_grace = 3600
+
+def cache_root():
+    r = os.environ.get('MAKE_FPGA_LIB_CACHE')
+    if not r:
+        r = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'),'.cache'),'make-fpga','libs')
+    return r
+
+def cache_max():
+    return parse_size(os.environ.get('MAKE_FPGA_LIB_CACHE_SIZE','50G'))
+
+################################################################################
+# simulator specifics
+# each simulator provides:
+#   version(path)                 version string (part of the cache key)
+#   com(path,name,lrm,opts,deps,srcs)
+#                                 commands to compile library name into the
+#                                 current directory, where deps are the cache
+#                                 directories of the libraries it uses
+# a compiled library is used with -L DIR (nvc), -PDIR (ghdl) or is mapped
+# to DIR/name (vsim), where DIR is its cache directory
+
+def tool_version(cmd):
+    try:
+        r = subprocess.run(cmd,capture_output=True,text=True)
+        return (r.stdout or r.stderr).strip().splitlines()[0]
+    except (OSError,IndexError):
+        error_exit('cannot run %s' % cmd[0])
+
+def nvc_com(path,name,lrm,opts,deps,srcs):
+    return [[path+'nvc','--std='+lrm]+flatten([['-L',d] for d in deps.values()])+['--work=%s:%s' % (name,name),'-a']+opts+srcs]
+
+def ghdl_com(path,name,lrm,opts,deps,srcs):
+    return [[path+'ghdl','-a','--std='+lrm[2:],'--work='+name,'--workdir=.']+['-P'+d for d in deps.values()]+opts+srcs]
+
+def vsim_com(path,name,lrm,opts,deps,srcs):
+    r = [[path+'vmap','-c']]
+    r += [[path+'vmap','-modelsimini','modelsim.ini',n,os.path.join(d,n)] for n,d in deps.items()]
+    r += [[path+'vlib',name],[path+'vmap','-modelsimini','modelsim.ini',name,name]]
+    vhd = [s for s in srcs if s.lower().endswith(ext_vhdl)]
+    vlg = [s for s in srcs if not s.lower().endswith(ext_vhdl)]
+    if vhd:
+        r.append([path+'vcom','-modelsimini','modelsim.ini','-work',name,'-'+lrm,'-explicit','-stats=none']+opts+vhd)
+    if vlg:
+        r.append([path+'vlog','-modelsimini','modelsim.ini','-work',name,'-stats=none']+opts+vlg)
+    return r
+
+sims = {
+    'nvc':  (lambda path: tool_version([path+'nvc','--version']),nvc_com),
+    'ghdl': (lambda path: tool_version([path+'ghdl','--version']),ghdl_com),
+    'vsim': (lambda path: tool_version([path+'vsim','-version']),vsim_com)
+    }
+
+################################################################################
+
+def read_defs(path):
+    try:
+        with open(path,'r') as f:
+            defs = json.load(f)
+    except (OSError,ValueError) as e:
+        error_exit('cannot read library definitions: %s' % e)
+    base = os.path.dirname(os.path.abspath(path))
+    for n,d in defs.items():
+        srcs = []
+        for s in d.get('src',[]):
+            s = os.path.join(base,s)
+            g = sorted(glob.glob(s)) if glob.has_magic(s) else [s]
+            if not g:
+                error_exit('library %s: no sources match %s' % (n,s))
+            srcs += [x for x in g if x not in srcs]
+        d['src'] = srcs
+        for x in d.get('deps',[]):
+            if x not in defs:
+                error_exit('library %s uses undefined library %s' % (n,x))
+    return defs
+
+# libraries in dependency order ending with name
+def lib_order(defs,name,r=None,seen=()):
+    r = [] if r is None else r
+    if name in seen:
+        error_exit('circular library dependency: %s' % ' -> '.join(seen+(name,)))
+    for x in defs[name].get('deps',[]):
+        lib_order(defs,x,r,seen+(name,))
+    if name not in r:
+        r.append(name)
+    return r
+
+# all sources of library name, including those of the libraries it uses
+def lib_srcs(defs,name):
+    return list(dict.fromkeys(flatten([defs[n]['src'] for n in lib_order(defs,name)])))
+
+# cache key: simulator and version, LRM, options, sources and dependency keys
+def lib_key(sim,version,name,d,dep_keys):
+    h = hashlib.sha1(json.dumps([sim,version,name,d.get('lrm','2008'),d.get('opts',{}).get(sim,[]),dep_keys]).encode())
+    for s in d['src']:
+        h.update((os.path.basename(s)+'\0'+file_hash(s)+'\0').encode())
+    return h.hexdigest()[:20]
+
+def read_meta(entry):
+    try:
+        with open(os.path.join(entry,'meta.json'),'r') as f:
+            return json.load(f)
+    except (OSError,ValueError):
+        return None
+
+def dir_size(d):
+    n = 0
+    for root,_,files in os.walk(d):
+        for f in files:
+            try:
+                n += os.lstat(os.path.join(root,f)).st_size
+            except OSError:
+                pass
+    return n
+
+# cache directory of library name (and the libraries it uses), compiling
+# any that are not yet in the cache
+def get(defs,sim,name,path='',quiet=False):
+    version = sims[sim][0](path)
+    root = os.path.join(cache_root(),sim)
+    dirs = {}
+    built = False
+    for n in lib_order(defs,name):
+        d = defs[n]
+        deps = {x: dirs[x] for x in d.get('deps',[])}
+        key = lib_key(sim,version,n,d,[os.path.basename(x) for x in deps.values()])
+        entry = os.path.join(root,n+'-'+key)
+        # build under an exclusive lock: concurrent jobs wanting the same library wait for it
+        with locked(entry+'.lock'):
+            meta = read_meta(entry)
+            if meta is None:
+                if os.path.isdir(entry):
+                    shutil.rmtree(entry) # incomplete
+                os.makedirs(entry)
+                if not quiet:
+                    print('compiling %s library %s into %s' % (sim,n,entry),flush=True)
+                t0 = time.time()
+                for cmd in sims[sim][1](path,n,d.get('lrm','2008'),d.get('opts',{}).get(sim,[]),deps,d['src']):
+                    if subprocess.call(cmd,cwd=entry,stdout=sys.stderr if quiet else None):
+                        shutil.rmtree(entry,ignore_errors=True)
+                        error_exit('compilation of library %s failed: %s' % (n,' '.join(cmd)))
+                meta = {'name': n,'sim': sim,'version': version,'lrm': d.get('lrm','2008'),
+                    'src': d['src'],'deps': list(deps),'build_time': round(time.time()-t0,1),'size': dir_size(entry)}
+                built = True
+            meta['used'] = time.time()
+            write_if_changed(os.path.join(entry,'meta.json'),json.dumps(meta,indent=1)+'\n')
+        dirs[n] = entry
+    if built:
+        prune(cache_max(),keep=set(dirs.values()))
+    return dirs[name]
+
+# cache entries: list of (entry directory,meta), least recently used first
+def entries():
+    r = []
+    for sim in sims:
+        for e in glob.glob(os.path.join(cache_root(),sim,'*')):
+            if os.path.isdir(e):
+                m = read_meta(e)
+                if m:
+                    r.append((e,m))
+    return sorted(r,key=lambda x: x[1].get('used',0))
+
+# evict least recently used entries until the cache is no bigger than limit
+# (entries used recently or being built are kept)
+def prune(limit,keep=(),grace=evict_grace):
+    with locked(os.path.join(cache_root(),'.evict.lock')):
+        l = entries()
+        total = sum(m.get('size',0) for _,m in l)
+        now = time.time()
+        for e,m in l:
+            if total <= limit:
+                break
+            if e in keep or now-m.get('used',0) < grace:
+                continue
+            with locked(e+'.lock',wait=False) as ok:
+                if ok:
+                    shutil.rmtree(e,ignore_errors=True)
+                    os.remove(e+'.lock')
+                    total -= m.get('size',0)
+                    print('evicted %s (%.1f MB)' % (e,m.get('size',0)/(1<<20)),file=sys.stderr)
+        return total
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='libcache_fpga.py',
+        description='Shared cache of precompiled simulation libraries',
+        epilog=help_defs,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    sub = parser.add_subparsers(dest='cmd',required=True)
+    p = sub.add_parser(
+        'get',
+        help='print the cache directory of a library, compiling it (and the libraries it uses) if necessary'
+       )
+    p.add_argument(
+        '--sim',
+        choices=list(sims),
+        required=True,
+        help='simulator'
+       )
+    p.add_argument(
+        '--path',
+        help='path to simulator binaries'
+       )
+    p.add_argument(
+        '--defs',
+        required=True,
+        help='library definitions file (JSON, see below)'
+       )
+    p.add_argument(
+        '--out',
+        help='write the directory to this file rather than printing it'
+       )
+    p.add_argument(
+        '--vmap',
+        metavar='INI',
+        help='vsim: also map the library (and the libraries it uses) in this modelsim.ini'
+       )
+    p.add_argument(
+        'name',
+        help='library'
+       )
+    p = sub.add_parser(
+        'list',
+        help='list cached libraries, least recently used first'
+       )
+    p = sub.add_parser(
+        'prune',
+        help='evict least recently used libraries until the cache is within its size limit'
+       )
+    p.add_argument(
+        '--size',
+        help='size limit (defaults to $MAKE_FPGA_LIB_CACHE_SIZE or 50G)'
+       )
+    p.add_argument(
+        '--grace',
+        type=float,
+        help='keep libraries used within this many seconds (defaults to %d)' % evict_grace,
+        default=evict_grace
+       )
+    args = parser.parse_args(argv)
+    if args.cmd == 'get':
+        path = args.path or ''
+        if path:
+            path += '/' if path[-1] != '/' else ''
+        defs = read_defs(args.defs)
+        if args.name not in defs:
+            error_exit('library %s is not defined in %s' % (args.name,args.defs))
+        d = get(defs,args.sim,args.name,path,quiet=bool(args.out))
+        if args.vmap:
+            # map each library from its own cache directory
+            for n in lib_order(defs,args.name):
+                e = get(defs,args.sim,n,path,quiet=True)
+                if subprocess.call([path+'vmap','-modelsimini',args.vmap,n,os.path.join(e,n)],stdout=subprocess.DEVNULL):
+                    error_exit('vmap failed for library %s' % n)
+        if args.out:
+            # touch if unchanged, so that make sees it as up to date
+            if not write_if_changed(args.out,d+'\n'):
+                os.utime(args.out)
+        else:
+            print(d)
+    elif args.cmd == 'list':
+        total = 0
+        for e,m in entries():
+            total += m.get('size',0)
+            print('%s  %8.1f MB  %6.1fs  %s' % (time.strftime('%Y-%m-%d %H:%M',time.localtime(m.get('used',0))),
+                m.get('size',0)/(1<<20),m.get('build_time',0),e))
+        print('total %.1f MB (limit %.1f MB) in %s' % (total/(1<<20),cache_max()/(1<<20),cache_root()))
+    elif args.cmd == 'prune':
+        total = prune(parse_size(args.size) if args.size else cache_max(),grace=args.grace)
+        print('cache size %.1f MB' % (total/(1<<20)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -115,6 +115,9 @@ endif
 
 ifneq (,$(filter vivado,$(FPGA_TOOL)))
 VIVADO_TARGETS:=all xpr bd bit prog bd_update prj elf run
+ifeq (nonproject,$(VIVADO_FLOW))
+VIVADO_TARGETS+=synth opt place route
+endif
 ifneq (,$(filter $(VIVADO_TARGETS),$(MAKECMDGOALS)))
 
 vivado:: bit
@@ -158,9 +161,30 @@ VIVADO_EXE:=vivado
 VIVADO_PROJ?=fpga
 VIVADO_PART?=$(FPGA_DEVICE)
 VIVADO_JOBS?=$(shell expr $(CPU_CORES) / 2)
+# project: synthesis and implementation runs in the project
+# nonproject: a checkpoint per stage (synth, opt, place, route), so a change
+# restarts from the first stage it affects (IP and BDs are still built in the project)
+VIVADO_FLOW?=project
+ifeq (nonproject,$(VIVADO_FLOW))
+ifdef VITIS_APP
+$(error VIVADO_FLOW=nonproject does not support VITIS_APP)
+endif
+VIVADO_SYNTH_FILE?=$(VIVADO_ABS_DIR)/$(VIVADO_DSN_TOP)_synth.dcp
+VIVADO_OPT_FILE?=$(VIVADO_ABS_DIR)/$(VIVADO_DSN_TOP)_opt.dcp
+VIVADO_PLACE_FILE?=$(VIVADO_ABS_DIR)/$(VIVADO_DSN_TOP)_placed.dcp
+VIVADO_ROUTE_FILE?=$(VIVADO_ABS_DIR)/$(VIVADO_DSN_TOP)_routed.dcp
+VIVADO_BIT_FILE?=$(VIVADO_ABS_DIR)/$(VIVADO_DSN_TOP).bit
+# reference for incremental implementation (empty to disable): defaults to the
+# last routed checkpoint, which is only overwritten once routing completes
+VIVADO_INCR_FILE?=$(VIVADO_ROUTE_FILE)
+else ifneq (project,$(VIVADO_FLOW))
+$(error VIVADO_FLOW must be project or nonproject)
+endif
 
 #VIVADO_VER:=$(shell $(VIVADO_EXE) -version | grep -Po '(?<=Vivado\sv)[^\s]+')
 VIVADO_TCL:=$(VIVADO_EXE) -mode tcl -notrace -nolog -nojournal -source $(MAKE_FPGA_TCL) -tclargs vivado $(VIVADO_PROJ)
+# as VIVADO_TCL, also writing console output to the non-project stage log $(VIVADO_DSN_TOP)_$1.log
+VIVADO_TCL_LOG=$(VIVADO_EXE) -mode tcl -notrace -log $(VIVADO_DSN_TOP)_$1.log -nojournal -source $(MAKE_FPGA_TCL) -tclargs vivado $(VIVADO_PROJ)
 VIVADO_ABS_DIR:=$(MAKE_DIR)/$(VIVADO_DIR)
 VIVADO_PROJ_FILE?=$(VIVADO_ABS_DIR)/$(VIVADO_PROJ).xpr
 VIVADO_BIT_FILE?=$(VIVADO_ABS_DIR)/$(VIVADO_PROJ).runs/impl_1/$(VIVADO_DSN_TOP).bit
@@ -169,6 +193,12 @@ VIVADO_XSA_FILE?=$(VIVADO_ABS_DIR)/$(VIVADO_DSN_TOP).xsa
 VIVADO_DSN_IP_PATH?=$(VIVADO_ABS_DIR)/$(VIVADO_PROJ).srcs/sources_1/ip
 VIVADO_BD_PATH?=$(VIVADO_ABS_DIR)/$(VIVADO_PROJ).srcs/sources_1/bd
 VIVADO_BD_SCP_MODE?=Hierarchical
+# IP and BD cache: set to 1 to restore generated products and out-of-context synthesis
+# results from a cache shared by later builds and other projects (see ipcache_fpga.py),
+# keyed by a hash of the IP/BD TCL, the part and the Vivado version
+VIVADO_IP_CACHE?=
+PYTHON?=python3
+VIVADO_IP_CACHE_GET=$(PYTHON) $(MAKE_FPGA_DIR)/ipcache_fpga.py get --part $(VIVADO_PART) --vivado $(VIVADO_EXE)
 VIVADO_BD_HWDEF_PATH?=$(VIVADO_ABS_DIR)/$(VIVADO_PROJ).gen/sources_1/bd
 VIVADO_SIM_PATH?=$(VIVADO_ABS_DIR)/$(VIVADO_PROJ).sim/sim_1/behav/xsim
 VIVADO_SIM_IP_PATH?=$(VIVADO_ABS_DIR)/$(VIVADO_PROJ).gen/sources_1/ip
@@ -234,6 +264,7 @@ $(VIVADO_PROJ_FILE): $(VIVADO_PROJ_RECIPE_FILE) | $(VIVADO_PROJ_RECIPE_SOURCES)
 		sim_gen:        $(VIVADO_SIM_GENERICS)
 
 # BD files depend on BD TCL scripts and existence of project
+# (with the cache, BD products are generated and synthesised here, or restored)
 .PHONY: bd
 define RR_VIVADO_BD
 bd:: $1
@@ -241,7 +272,14 @@ $1: $2 | $(VIVADO_PROJ_FILE)
 	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
 	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU) Vivado: build block diagrams from TCL                                         $(COL_RST)'"
 	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+ifeq (1,$(VIVADO_IP_CACHE))
+	cd $(VIVADO_DIR) && $(VIVADO_IP_CACHE_GET) $(basename $(notdir $1)) --key $2 --opts bd $(VIVADO_BD_SCP_MODE) \
+		--dirs $(VIVADO_BD_PATH)/$(basename $(notdir $1)) $(VIVADO_BD_HWDEF_PATH)/$(basename $(notdir $1)) \
+		--hit "$(VIVADO_TCL) build bd_add $1 $(VIVADO_BD_SCP_MODE)" \
+		-- $(VIVADO_TCL) build bd_ooc $1 $2 $(VIVADO_BD_SCP_MODE) $(VIVADO_JOBS)
+else
 	cd $(VIVADO_DIR) && $(VIVADO_TCL) build bd $1 $2 $(VIVADO_BD_SCP_MODE)
+endif
 endef
 $(foreach X,$(VIVADO_DSN_BD_TCL),$(eval $(call RR_VIVADO_BD,$(VIVADO_BD_PATH)/$(basename $(notdir $X))/$(basename $(notdir $X)).bd,$X)))
 
@@ -273,15 +311,100 @@ $(VIVADO_XSA_FILE): $(VIVADO_BIT_FILE)
 endif
 
 # IP XCI files and simulation models depend on IP TCL scripts and existence of project
+# (with the cache, IP products are generated and synthesised here, or restored)
 define RR_VIVADO_IP_XCI
 $1 $(foreach X,$(VIVADO_SIM_IP_$(basename $(notdir $2))),$(VIVADO_SIM_IP_PATH)/$X) &: $2 | $(VIVADO_PROJ_FILE)
 	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
 	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU) Vivado: build IP XCI file and simulation model(s)                             $(COL_RST)'"
 	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+ifeq (1,$(VIVADO_IP_CACHE))
+	cd $(VIVADO_DIR) && $(VIVADO_IP_CACHE_GET) $(basename $(notdir $1)) --key $2 --opts ip \
+		--dirs $(VIVADO_DSN_IP_PATH)/$(basename $(notdir $1)) $(VIVADO_SIM_IP_PATH)/$(basename $(notdir $1)) \
+		--hit "$(VIVADO_TCL) build ip_add $1 $(foreach X,$(VIVADO_SIM_IP_$(basename $(notdir $2))),$(VIVADO_SIM_IP_PATH)/$X)" \
+		-- $(VIVADO_TCL) build ip_ooc $1 $2 $(VIVADO_JOBS) $(foreach X,$(VIVADO_SIM_IP_$(basename $(notdir $2))),$(VIVADO_SIM_IP_PATH)/$X)
+else
 	cd $(VIVADO_DIR) && $(VIVADO_TCL) build ip $1 $2 $(foreach X,$(VIVADO_SIM_IP_$(basename $(notdir $2))),$(VIVADO_SIM_IP_PATH)/$X)
+endif
 endef
 $(foreach X,$(VIVADO_DSN_IP_TCL),$(eval $(call RR_VIVADO_IP_XCI,$(VIVADO_DSN_IP_PATH)/$(basename $(notdir $X))/$(basename $(notdir $X)).xci,$X)))
 
+ifeq (nonproject,$(VIVADO_FLOW))
+
+# non-project flow: each stage opens the previous checkpoint and writes its own
+# NOTE: generating BD targets changes BD timestamps, so we force them backwards
+.PHONY: synth opt place route bit
+synth: $(VIVADO_SYNTH_FILE)
+opt: $(VIVADO_OPT_FILE)
+place: $(VIVADO_PLACE_FILE)
+route: $(VIVADO_ROUTE_FILE)
+bit: $(VIVADO_BIT_FILE)
+tmp=touch --date=\"$$(date -r $2 -R) - 1 second\" $1 &&
+
+# synthesis checkpoint depends on design sources, IP, BDs and synthesis constraints
+$(VIVADO_SYNTH_FILE): $(VIVADO_DSN_IP_XCI) $(VIVADO_DSN_BD_HWDEF) $(VIVADO_DSN_VHDL) $(VIVADO_DSN_VHDL_2008) $(VIVADO_DSN_XDC_SYNTH) $(VIVADO_DSN_XDC) | $(VIVADO_DIR)
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU) Vivado: synthesis (non-project)                                               $(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	cd $(VIVADO_DIR) && $(call VIVADO_TCL_LOG,synth) np synth \
+		top:       $(VIVADO_DSN_TOP) \
+		part:      $(VIVADO_PART) \
+		gen:       $(VIVADO_DSN_GENERICS) \
+		vhdl:      $(VIVADO_DSN_VHDL) \
+		vhdl_2008: $(VIVADO_DSN_VHDL_2008) \
+		ip:        $(VIVADO_DSN_IP_XCI) \
+		bd:        $(VIVADO_DSN_BD) \
+		xdc:       $(VIVADO_DSN_XDC) \
+		xdc_synth: $(VIVADO_DSN_XDC_SYNTH) \
+		dcp:       $@
+ifneq (,$(VIVADO_DSN_BD))
+	bash -c "$(call pairmap,tmp,$(VIVADO_DSN_BD),$(VIVADO_DSN_BD_HWDEF)) :"
+endif
+
+# optimised checkpoint depends on synthesis checkpoint and implementation constraints
+$(VIVADO_OPT_FILE): $(VIVADO_SYNTH_FILE) $(VIVADO_DSN_XDC_IMPL)
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU) Vivado: optimisation (non-project)                                            $(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	cd $(VIVADO_DIR) && $(call VIVADO_TCL_LOG,opt) np opt \
+		top: $(VIVADO_DSN_TOP) \
+		in:  $< \
+		xdc: $(VIVADO_DSN_XDC_IMPL) \
+		dcp: $@
+
+# placed checkpoint depends on optimised checkpoint
+$(VIVADO_PLACE_FILE): $(VIVADO_OPT_FILE)
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU) Vivado: placement (non-project)                                               $(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	cd $(VIVADO_DIR) && $(call VIVADO_TCL_LOG,place) np place \
+		top:  $(VIVADO_DSN_TOP) \
+		in:   $< \
+		incr: $(abspath $(VIVADO_INCR_FILE)) \
+		dcp:  $@
+
+# routed checkpoint depends on placed checkpoint
+$(VIVADO_ROUTE_FILE): $(VIVADO_PLACE_FILE)
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU) Vivado: routing (non-project)                                                 $(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	cd $(VIVADO_DIR) && $(call VIVADO_TCL_LOG,route) np route \
+		top:  $(VIVADO_DSN_TOP) \
+		in:   $< \
+		incr: $(abspath $(VIVADO_INCR_FILE)) \
+		dcp:  $@
+
+# bit file depends on routed checkpoint
+$(VIVADO_BIT_FILE): $(VIVADO_ROUTE_FILE)
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU) Vivado: bitstream generation (non-project)                                    $(COL_RST)'"
+	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
+	cd $(VIVADO_DIR) && $(call VIVADO_TCL_LOG,bit) np bit \
+		in:  $< \
+		bit: $@
+	cp $@ $(MAKE_DIR)
+
+else
+
 # synthesis file depends on design sources, relevant constraints and existence of project
 $(VIVADO_SYNTH_FILE): $(VIVADO_DSN_IP_XCI) $(VIVADO_DSN_BD_HWDEF) $(VIVADO_DSN_VHDL) $(VIVADO_DSN_VHDL_2008) $(VIVADO_DSN_XDC_SYNTH) $(VIVADO_DSN_XDC) | $(VIVADO_PROJ_FILE)
 	@bash -c "echo -e '$(COL_BG_WHT)$(COL_FG_BLU)-------------------------------------------------------------------------------$(COL_RST)'"
@@ -316,6 +439,8 @@ ifneq (,$(VIVADO_DSN_BD))
 	bash -c "$(call pairmap,tmp,$(VIVADO_DSN_BD),$(VIVADO_DSN_BD_HWDEF)) :"
 endif
 
+endif
+
 # program FPGA
 ifndef hw
 ifdef HW
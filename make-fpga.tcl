@@ -58,6 +58,29 @@ switch $tool {
 				return $d
 			}
 
+			# synthesise the IP or BD in file f out-of-context (unless it is already)
+			proc ooc_synth {f jobs} {
+				if {[get_property synth_checkpoint_mode [get_files $f]] == "None"} {
+					return
+				}
+				create_ip_run [get_files $f]
+				set runs []
+				foreach r [get_runs -filter {IS_SYNTHESIS}] {
+					if {$r != "synth_1" && [get_property PROGRESS $r] != "100%"} {
+						lappend runs $r
+					}
+				}
+				if {[llength $runs] > 0} {
+					launch_runs $runs -jobs $jobs
+					foreach r $runs {
+						wait_on_run $r
+						if {[get_property PROGRESS $r] != "100%"} {
+							error_exit [list "out-of-context synthesis did not complete ($r)"]
+						}
+					}
+				}
+			}
+
 			set proj_name [lindex $args 0]
 			set cmd [lindex $args 1]
 			set args [lrange $args 2 end]
@@ -173,6 +196,36 @@ switch $tool {
 								add_files -norecurse -fileset [get_filesets sim_1] $args
 							}
 						}
+						ip_ooc {
+							# build ip_ooc xci_file tcl_file jobs [simulation models]
+							# (as ip, then generate products and synthesise out-of-context)
+							set xci_file [lindex $args 1]
+							set tcl_file [lindex $args 2]
+							set jobs [lindex $args 3]
+							set args [lrange $args 4 end]
+							if {$xci_file in [get_files $xci_file]} {
+								remove_files $xci_file
+							}
+							source $tcl_file
+							if {[llength $args] > 0} {
+								add_files -norecurse -fileset [get_filesets sim_1] $args
+							}
+							generate_target all [get_files $xci_file]
+							ooc_synth $xci_file $jobs
+						}
+						ip_add {
+							# build ip_add xci_file [simulation models]
+							# (add IP restored with its products, e.g. from a cache)
+							set xci_file [lindex $args 1]
+							set args [lrange $args 2 end]
+							if {$xci_file in [get_files $xci_file]} {
+								remove_files $xci_file
+							}
+							add_files -norecurse -fileset [get_filesets sources_1] $xci_file
+							if {[llength $args] > 0} {
+								add_files -norecurse -fileset [get_filesets sim_1] $args
+							}
+						}
 						bd {
 							# build bd bd_file tcl_file scp_mode
 							set bd_file [lindex $args 1]
@@ -186,6 +239,32 @@ switch $tool {
                                 set_property synth_checkpoint_mode $scp_mode [get_files $bd_file]
                             }
 						}
+						bd_ooc {
+							# build bd_ooc bd_file tcl_file scp_mode jobs
+							# (as bd, then generate products and synthesise out-of-context)
+							set bd_file [lindex $args 1]
+							set tcl_file [lindex $args 2]
+							set scp_mode [lindex $args 3]
+							set jobs [lindex $args 4]
+							if {$bd_file in [get_files $bd_file]} {
+								remove_files $bd_file
+							}
+							source $tcl_file
+							set_property synth_checkpoint_mode $scp_mode [get_files $bd_file]
+							generate_target all [get_files $bd_file]
+							ooc_synth $bd_file $jobs
+						}
+						bd_add {
+							# build bd_add bd_file scp_mode
+							# (add BD restored with its products, e.g. from a cache)
+							set bd_file [lindex $args 1]
+							set scp_mode [lindex $args 2]
+							if {$bd_file in [get_files $bd_file]} {
+								remove_files $bd_file
+							}
+							add_files -norecurse -fileset [get_filesets sources_1] $bd_file
+							set_property synth_checkpoint_mode $scp_mode [get_files $bd_file]
+						}
 						hwdef {
 							# build hwdef filename
 							set filename [lindex $args 1]
@@ -255,6 +334,94 @@ switch $tool {
 					}
 				}
 
+				np {
+					# np stage [cat: cat_items]... - non-project flow: each stage opens
+					# the checkpoint written by the previous one (in:) and writes its own
+					# (dcp:), so a change restarts from the first stage it affects
+					#   synth  top: part: gen: vhdl: vhdl_2008: ip: bd: xdc: xdc_synth:
+					#   opt    top: in: xdc:
+					#   place  top: in: [incr: reference_dcp]
+					#   route  top: in: [incr: reference_dcp]
+					#   bit    in: bit:
+					set stage [lindex $args 0]
+					set d [params_to_dict [lrange $args 1 end]]
+					foreach key {top part gen vhdl vhdl_2008 ip bd xdc xdc_synth in incr dcp bit} {
+						if {![dict exist $d $key]} {
+							dict set d $key {}
+						}
+					}
+					set top [lindex [dict get $d top] 0]
+					if {$stage in {opt place route bit}} {
+						open_checkpoint [dict get $d in]
+					}
+					switch $stage {
+						synth {
+							foreach f [dict get $d vhdl] {
+								read_vhdl $f
+							}
+							foreach f [dict get $d vhdl_2008] {
+								read_vhdl -vhdl2008 $f
+							}
+							foreach f [dict get $d ip] {
+								read_ip $f
+							}
+							foreach f [dict get $d bd] {
+								read_bd $f
+								generate_target all [get_files $f]
+							}
+							foreach f [dict get $d xdc] {
+								read_xdc $f
+							}
+							foreach f [dict get $d xdc_synth] {
+								read_xdc $f
+								set_property used_in_implementation false [get_files $f]
+							}
+							set g [dict get $d gen]
+							set s "synth_design -top $top -part [dict get $d part]"
+							while {[llength $g] >= 2} {
+								append s " -generic [lindex $g 0]=[lindex $g 1]"
+								set g [lrange $g 2 end]
+							}
+							eval $s
+							report_utilization -file ${top}_utilization_synth.rpt
+						}
+						opt {
+							foreach f [dict get $d xdc] {
+								read_xdc $f
+							}
+							opt_design
+						}
+						place {
+							# reuse placement and routing from the reference (normally the
+							# last routed checkpoint) where the design has not changed
+							set incr [dict get $d incr]
+							if {$incr != "" && [file exists $incr]} {
+								read_checkpoint -incremental $incr
+							}
+							place_design
+							phys_opt_design
+							report_utilization -file ${top}_utilization_placed.rpt
+						}
+						route {
+							route_design
+							report_timing_summary -file ${top}_timing_summary_routed.rpt
+							set incr [dict get $d incr]
+							if {$incr != "" && [file exists $incr]} {
+								report_incremental_reuse -file ${top}_incremental_reuse_routed.rpt
+							}
+						}
+						bit {
+							write_bitstream -force [dict get $d bit]
+						}
+						default {
+							error_exit "np - unknown stage ($stage)"
+						}
+					}
+					if {[dict get $d dcp] != ""} {
+						write_checkpoint -force [dict get $d dcp]
+					}
+				}
+
 				simprep {
 					# simprep [gen: generic value] [elf: proc_inst proc_ref proc_elf]
 					set d [params_to_dict $args]
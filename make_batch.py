@@ -0,0 +1,130 @@
+################################################################################
+# make_batch.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script generates the makefiles/scripts for many designs, as described
+# by a manifest, in parallel. Outputs are only written if their content changes.
+################################################################################
+
+import sys,os,argparse,json
+import concurrent.futures
+from make_fpga import *
+
+help_manifest = \
+    'The manifest is a JSON file as follows:\n' \
+    '  {\n' \
+    '    "defaults": { key: value, ... },\n' \
+    '    "designs": [\n' \
+    '      { key: value, ..., "outputs": [ { key: value, ... }, ... ] },\n' \
+    '      ...\n' \
+    '    ]\n' \
+    '  }\n' \
+    'Each output is generated from the defaults, updated by its design and then\n' \
+    'by the output itself. A design without outputs is itself a single output.\n' \
+    'Keys:\n' \
+    '  kind  = generator: %s\n' \
+    '  out   = output file, in dir (paths in the output are relative to dir)\n' \
+    '  dir   = directory (relative to manifest) to generate in, other paths\n' \
+    '          are relative to this (defaults to manifest directory, created\n' \
+    '          if necessary)\n' \
+    '  src, run, gen, sdf, work, path, vhdl, lib, lib_defs, dep, top, aux, scan,\n' \
+    '  scan_cache, wave\n' \
+    '        = project (as per generator command line options, lists for\n' \
+    '          repeatable options, scan=false for --no_scan)\n' \
+    '  other keys are generator specific e.g. flow, arch, dev (radiant)\n' \
+    'Example:\n' \
+    '  {\n' \
+    '    "defaults": { "src": ["../src/pkg.vhd", "../src/top.vhd", "../src/tb.vhd"] },\n' \
+    '    "designs": [\n' \
+    '      { "dir": "nvc", "kind": "nvc", "out": "makefile", "run": ["tb"] },\n' \
+    '      { "dir": "vsim", "run": ["tb"], "outputs": [\n' \
+    '        { "kind": "vsim", "out": "makefile" },\n' \
+    '        { "kind": "do_vsim", "out": "vsim.do" } ] },\n' \
+    '      { "dir": "fpga", "kind": "radiant", "out": "makefile",\n' \
+    '        "arch": "ice40up", "dev": "iCE40UP5K-SG48I", "top": "top" }\n' \
+    '    ]\n' \
+    '  }\n' % ', '.join(emitters)
+
+# keys that describe the project rather than the output or generator options
+project_keys = ('src','run','gen','sdf','work','path','vhdl','lib','lib_defs','dep','top','aux','scan','scan_cache','wave')
+
+# list of outputs, each a dict of keys (see help_manifest)
+def read_manifest(path):
+    try:
+        with open(path,'r') as f:
+            m = json.load(f)
+    except (OSError,ValueError) as e:
+        error_exit('cannot read manifest: %s' % e)
+    r = []
+    for d in m.get('designs',[]):
+        for o in d.get('outputs',[{}]):
+            e = dict(m.get('defaults',{}))
+            e.update({k: v for k,v in d.items() if k != 'outputs'})
+            e.update(o)
+            for k in ('kind','out','src'):
+                if k not in e:
+                    error_exit('manifest output without "%s": %s' % (k,json.dumps(o or d)))
+            if e['kind'] not in emitters:
+                error_exit('unknown generator in manifest: %s' % e['kind'])
+            r.append(e)
+    return r
+
+# generate one output (in a worker process), return (path,status,message)
+def build(base,e):
+    e = dict(e)
+    d = os.path.normpath(os.path.join(base,e.pop('dir','.')))
+    kind = e.pop('kind')
+    out = e.pop('out')
+    path = os.path.join(d,out)
+    try:
+        os.makedirs(d,exist_ok=True)
+        os.chdir(d)
+        kw = {k: e.pop(k) for k in project_keys if k in e}
+        for k in ('src','run','gen','sdf','lib','dep','top','aux'):
+            if isinstance(kw.get(k),str):
+                kw[k] = [kw[k]]
+        s = generate(kind,make_project(kw.pop('src'),**kw),**e)
+        return path,'written' if write_if_changed(out,s) else 'unchanged',''
+    except SystemExit as x:
+        return path,'error',str(x)
+    except Exception as x:
+        return path,'error','%s: %s' % (type(x).__name__,x)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='make_batch.py',
+        description='Generate makefiles/scripts for many designs from a manifest',
+        epilog=help_manifest,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    parser.add_argument(
+        'manifest',
+        help='manifest file (JSON)'
+       )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='number of outputs to generate concurrently (defaults to CPU count)',
+        default=os.cpu_count()
+       )
+    parser.add_argument(
+        '--quiet',
+        action='store_true',
+        help='only report outputs that are written or fail'
+       )
+    args = parser.parse_args(argv)
+    outputs = read_manifest(args.manifest)
+    base = os.path.dirname(os.path.abspath(args.manifest))
+
+    # worker processes: generation is CPU bound (scanning, text) and each
+    # output is generated in its own directory
+    n = {'written': 0,'unchanged': 0,'error': 0}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1,args.jobs)) as pool:
+        for path,status,msg in pool.map(build,[base]*len(outputs),outputs):
+            n[status] += 1
+            if status != 'unchanged' or not args.quiet:
+                print('%-9s %s%s' % (status,os.path.relpath(path),(': '+msg) if msg else ''))
+    print('%d output(s): %d written, %d unchanged, %d failed' % (len(outputs),n['written'],n['unchanged'],n['error']))
+    return 1 if n['error'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
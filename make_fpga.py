@@ -1,15 +1,25 @@
 ################################################################################
 # make_fpga.py
 # A part of make-fpga - see https://github.com/amb5l/make-fpga
-# Shared functions.
+# Shared functions, project model and helper commands.
 ################################################################################
 
-import sys,os,argparse
+import sys,os,argparse,re,json,hashlib,heapq,subprocess,importlib,itertools,time
+import contextlib
+from dataclasses import dataclass,field
+from typing import NamedTuple,List,Tuple
 
 def error_exit(s):
     sys.exit(sys.argv[0]+': error: '+s)
 
-def process_src(src,work):
+# sources (list of (lib,src)) and libraries (dict of lib: sources) from source
+# specs: files, globs or directories, each optionally followed by =lib
+# (globs and directories are expanded in sorted order using a persistent
+# directory index; when any are present the sources are then ordered by their
+# dependencies, unless order is False)
+def process_src(src,work,order=True,scan_cache=None,find_cache=None):
+    index = find_index(find_cache or find_cache_file)
+    expanded = False
     l=[] # list of tuples, each comprising lib and source
     d={} # dict of libraries, each containing all sources
     s=[]
@@ -25,7 +35,9 @@ def process_src(src,work):
                 is_lib=False
             elif '=' in i: # src=lib,=lib or =
                 if i.split('=')[0]: # src specified
-                    s.append(i.split('=')[0])
+                    x = expand_src(i.split('=')[0],index)
+                    expanded |= x != [i.split('=')[0]]
+                    s += x
                 if i.split('=')[1]: # lib specified
                     if i.split('=')[1] not in d:
                         d[i.split('=')[1]]=[]
@@ -35,118 +47,633 @@ def process_src(src,work):
                 else:
                     is_lib=True # defer
             else:
-                s.append(i)
+                x = expand_src(i,index)
+                expanded |= x != [i]
+                s += x
     if s:
         if work not in d:
             d[work]=[]
         l+=[(work,e) for e in s]
         d[work]+=s
+    write_index(index)
+    if expanded and order:
+        l = order_srcs(l,scan_cache or scan_cache_file)
+        d = {k: [e for x,e in l if x == k] for k in d}
     return l,d
 
-# run spec: top[,gen][;sdf] for single run or name:top[,gen][;sdf]
-#   [name:]top[,gen][;sdf]
-def process_run(run):
-    # list of runs, each comprising [name,top,gen,sdf]
-    #  where gen = list of tuples (name,value)
-    #  sdf = list of triplets (delay,path,file)
-    r=[]
-    for s in run:
-        # get name and top (or default to 'sim')
-        l = len(s)
-        if ';' in s:
-            l = s.index(';') # first semicolon demarks SDF or is part of generic
-        if ',' in s[:l]:
-            l = s[:l].index(',') # first comma before first semicolon must demark generics
-        if ':' in s[:l]:
-            name = s[:l].split(':')[0]
-            top  = s[:l].split(':')[1]
-        else:
-            name = 'sim'
-            top = s[:l]
-        r.append([name,top,[],[]])
-        s = s[l:]
-        # generic section: ,name=value[,name=value...]
-        if s:
-            while s[0] == ',' and s.find('=') != -1:
-                s = s[1:]
-                n = s[:s.find('=')]
-                v = s[s.find('=')+1:]
-                sq = False # inside single quotes
-                dq = False # inside double quotes
-                for i in range(len(v)):
-                    if i == len(v)-1:
-                        s = ""
-                    elif (v[i] == ',' or v[i] == ';') and not sq and not dq:
-                        s = v[i:]
-                        v = v[:i]
-                        break
-                    elif v[i] == "'":
-                        sq = not sq
-                    elif v[i] == '"':
-                        dq = not dq
-                # ensure double quotes around strings
-                if ' ' in v and v[0] != '"':
-                    v = '"'+v+'"'
-                r[-1][2].append((n,v))
-                if not s:
-                    break
-        # SDF section: ;sdfxxx:path=file
-        while s and s[0] == ';':
-            s = s[1:]
-            if ':' not in s:
-                error_exit('bad SDF section in run spec:\n  %s' % s)
-            delay = s.split(':')[0]
-            if delay != 'typ' and delay != 'min' and delay != 'max':
-                error_exit('bad SDF delay in run spec: %s' % delay)
-            path,file = s[s.index(':')+1:].split('=')
-            if ';' in file:
-                file = file.split(';')[0]
-                s = file[file.index(';'):]
+################################################################################
+# content hash compile stamps
+
+# paths to this file and the library cache script, for use in generated recipes
+make_fpga_py = os.path.abspath(__file__).replace('\\','/')
+libcache_py = make_fpga_py.rsplit('/',1)[0]+'/libcache_fpga.py'
+
+# first line of a stamp file is this magic followed by the stamp key
+stamp_magic = 'make_fpga stamp '
+
+# key of stamp file, None if path is not a stamp file
+def stamp_key(path):
+    try:
+        with open(path,'r',errors='replace') as f:
+            s = f.readline(80)
+    except OSError:
+        return None
+    return s[len(stamp_magic):].strip() if s.startswith(stamp_magic) else None
+
+# run command (list) in directory cwd to bring stamp up to date w.r.t. inputs
+# - the stamp key hashes the command plus the content of each input (or the key
+#   of each input that is itself a stamp, so unchanged results do not cascade)
+# - input content is only hashed when its mtime/size differs from that recorded
+# - the command is skipped if the key is unchanged, the stamp is always rewritten
+def stamp_run(stamp,inputs,cmd,cwd=None):
+    key,files = None,{}
+    try:
+        with open(stamp,'r') as f:
+            key = f.readline()[len(stamp_magic):].strip()
+            files = json.loads(f.read() or '{}')
+    except (OSError,ValueError):
+        pass
+    h = hashlib.sha1(json.dumps([cwd or '']+cmd).encode())
+    new_files = {}
+    for i in inputs:
+        k = stamp_key(i)
+        if k is None:
+            st = os.stat(i)
+            e = files.get(i)
+            if e and e[0] == st.st_mtime and e[1] == st.st_size:
+                k = e[2]
             else:
-                s = ''
-            r[-1][3].append((delay,path,file))
-        # finale
-        if s:
-            error_exit('unexpected text in run spec:\n  %s' % s)
+                k = file_hash(i)
+            new_files[i] = [st.st_mtime,st.st_size,k]
+        h.update((i+'\0'+k+'\0').encode())
+    new_key = h.hexdigest()
+    if new_key == key:
+        print('%s: up to date (content and options unchanged)' % stamp)
+    else:
+        r = subprocess.call(cmd,cwd=cwd)
+        if r:
+            return r
+    d = os.path.dirname(stamp)
+    if d:
+        os.makedirs(d,exist_ok=True)
+    with open(stamp,'w') as f:
+        f.write(stamp_magic+new_key+'\n'+json.dumps(new_files)+'\n')
+    return 0
+
+################################################################################
+# source dependency scanning
+
+# file extensions by language
+ext_vhdl = ('.vhd','.vhdl')
+ext_vlog = ('.v','.vh','.sv','.svh')
+
+# default scan cache file
+scan_cache_file = '.make_fpga_scan.json'
+
+################################################################################
+# source discovery
+
+# default directory index file
+find_cache_file = '.make_fpga_find.json'
+
+# sources found by recursing directories
+ext_src = ext_vhdl+('.v','.sv')
+
+re_glob_magic = re.compile(r'[*?[]')
+
+def find_index(path):
+    index = {'path': path,'dirty': False,'dirs': {}}
+    if path and os.path.isfile(path):
+        try:
+            with open(path,'r') as f:
+                index['dirs'] = json.load(f)
+        except (OSError,ValueError):
+            pass
+    return index
+
+def write_index(index):
+    if index['path'] and index['dirty']:
+        write_if_changed(index['path'],json.dumps(index['dirs'],indent=1,sort_keys=True)+'\n')
+
+# files below directory top (to the given depth, or all), sorted; directory
+# listings come from the index unless a directory's mtime has changed, so only
+# changed directories are listed again (hidden entries are ignored)
+def find_files(top,index,depth=None):
+    r = []
+    stack = [(top,0)]
+    while stack:
+        d,n = stack.pop()
+        try:
+            mt = os.stat(d).st_mtime_ns
+        except OSError:
+            continue
+        e = index['dirs'].get(d)
+        if not e or e[0] != mt:
+            files,dirs = [],[]
+            with os.scandir(d) as it:
+                for x in it:
+                    if not x.name.startswith('.'):
+                        (dirs if x.is_dir() else files).append(x.name)
+            e = [mt,sorted(files),sorted(dirs)]
+            index['dirs'][d] = e
+            index['dirty'] = True
+        join = (lambda x: x) if d == '.' else (lambda x: os.path.join(d,x))
+        r += map(join,e[1])
+        if depth is None or n < depth:
+            stack += [(join(x),n+1) for x in e[2]]
+    return sorted(r)
+
+# regex for glob pattern p: ** matches any number of directories
+def glob_re(p):
+    r = ''
+    i = 0
+    while i < len(p):
+        if p.startswith('**/',i):
+            r += '(?:.*/)?'
+            i += 3
+        elif p.startswith('**',i):
+            r += '.*'
+            i += 2
+        elif p[i] == '*':
+            r += '[^/]*'
+            i += 1
+        elif p[i] == '?':
+            r += '[^/]'
+            i += 1
+        elif p[i] == '[' and ']' in p[i+2:]:
+            j = p.index(']',i+2)
+            r += '['+('^'+p[i+2:j] if p[i+1] == '!' else p[i+1:j])+']'
+            i = j+1
+        else:
+            r += re.escape(p[i])
+            i += 1
     return r
 
-def process_gen(gen):
-    if gen:
-        for i in range(len(gen)):
-            s = gen[i]
-            n,v = s.split('=')
-            sq = False # inside single quotes
-            dq = False # inside double quotes
-            for j in range(len(v)):
-                if (v[j] == ',' or v[j] == ';') and not sq and not dq:
-                    v = v[:j]
-                    s = v[j:]
+# source spec: a file, glob (e.g. src/**/*.vhd) or directory (all VHDL and
+# Verilog/SystemVerilog sources below it)
+def expand_src(s,index):
+    if re_glob_magic.search(s):
+        parts = s.replace('\\','/').split('/')
+        k = next(i for i,x in enumerate(parts) if re_glob_magic.search(x))
+        base = '/'.join(parts[:k]) or ('/' if s.startswith('/') else '.')
+        rest = parts[k:]
+        rx = re.compile(glob_re('/'.join(rest)))
+        n = 0 if base == '.' else len(base.rstrip('/'))+1
+        r = [f for f in find_files(base,index,None if '**' in s else len(rest)-1)
+            if rx.fullmatch(f[n:].replace('\\','/'))]
+        if not r:
+            error_exit('no sources match %s' % s)
+        return r
+    if os.path.isdir(s):
+        return [f for f in find_files(s.rstrip('/\\') or '/',index) if f.lower().endswith(ext_src)]
+    return [s]
+
+# sources (list of (lib,src)) reordered so that each follows the sources that
+# provide the units it uses, otherwise keeping the given order (on a cycle the
+# earliest remaining source goes next)
+def order_srcs(c,cache_file=scan_cache_file):
+    scan = scan_srcs(list(dict.fromkeys(s for _,s in c)),cache_file)
+    by_lib = {} # (lib,unit) -> indices of providers
+    by_unit = {} # unit -> indices of providers
+    for i,(l,s) in enumerate(c):
+        for u in (scan[s] or {}).get('units',[]):
+            by_lib.setdefault((l,u),[]).append(i)
+            by_unit.setdefault(u,[]).append(i)
+    users = [[] for _ in c]
+    n = [0]*len(c)
+    for i,(l,s) in enumerate(c):
+        x = scan[s]
+        if x is None:
+            continue
+        p = set()
+        for ul,u in x['uses']:
+            p.update(by_lib.get((ul or l,u),[]))
+        for u in x['refs']:
+            p.update([k for k in by_unit.get(u,[]) if c[k][0] == l] or by_unit.get(u,[]))
+        p.discard(i)
+        for j in p:
+            users[j].append(i)
+        n[i] = len(p)
+    ready = [i for i in range(len(c)) if not n[i]]
+    heapq.heapify(ready)
+    done = [False]*len(c)
+    r = []
+    k = 0 # earliest source possibly not done
+    while len(r) < len(c):
+        if ready:
+            i = heapq.heappop(ready)
+        else:
+            while done[k]:
+                k += 1
+            i = k
+        if done[i]:
+            continue
+        done[i] = True
+        r.append(c[i])
+        for j in users[i]:
+            n[j] -= 1
+            if n[j] == 0 and not done[j]:
+                heapq.heappush(ready,j)
+    return r
+
+# VHDL
+re_vhdl_strip = re.compile(r'--[^\n]*|/\*.*?\*/|"[^"\n]*"',re.S)
+re_vhdl_unit  = re.compile(r'\b(?:entity|context)\s+(\w+)\s+is\b|\bpackage\s+(?!body\b)(\w+)\s+is\b|\bconfiguration\s+(\w+)\s+of\s+(\w+)\s+is\b')
+re_vhdl_body  = re.compile(r'\bpackage\s+body\s+(\w+)\s+is\b|\barchitecture\s+\w+\s+of\s+(\w+)\s+is\b')
+re_vhdl_use   = re.compile(r'\b(?:use|context|is\s+new|entity|configuration)\s+(\w+)\.(\w+)')
+re_vhdl_comp  = re.compile(r'\w+\s*:\s*(?:component\s+)?(\w+)\s+(?:generic|port)\s+map\b')
+
+# Verilog/SystemVerilog
+re_vlog_strip = re.compile(r'//[^\n]*|/\*.*?\*/',re.S)
+re_vlog_inc   = re.compile(r'`include\s+"([^"]+)"')
+re_vlog_unit  = re.compile(r'\b(?:module|macromodule|interface|program|package)\s+(?:automatic\s+|static\s+)?(\w+)')
+re_vlog_inst  = re.compile(r'\b(\w+)\s*(?:#\s*\((?:[^()]|\([^()]*\))*\)\s*)?(\w+)\s*(?:\[[^\]]*\]\s*)?\(')
+re_vlog_pkg   = re.compile(r'\b(\w+)::')
+vlog_keywords = {
+    'always','always_comb','always_ff','always_latch','and','assert','assign',
+    'assume','begin','case','casex','casez','cover','default','else','end',
+    'for','forever','function','generate','if','initial','module','nand','nor',
+    'not','or','repeat','return','task','while','wait','xnor','xor'
+    }
+
+# scan one HDL source file, return dict of:
+#   units = design units declared
+#   uses  = [lib,unit] pairs referenced by selected name (lib '' = own library)
+#   refs  = units referenced by simple name (bound in any library)
+#   incs  = included files
+def scan_hdl(path):
+    with open(path,'r',errors='replace') as f:
+        t = f.read()
+    units,uses,refs,incs = [],[],[],[]
+    if path.lower().endswith(ext_vhdl):
+        t = re_vhdl_strip.sub(' ',t).lower()
+        for m in re_vhdl_unit.finditer(t):
+            units.append(m.group(1) or m.group(2) or m.group(3))
+            if m.group(4):
+                uses.append(['',m.group(4)])
+        for m in re_vhdl_body.finditer(t):
+            uses.append(['',m.group(1) or m.group(2)])
+        for m in re_vhdl_use.finditer(t):
+            lib = '' if m.group(1) == 'work' else m.group(1)
+            if lib not in ('ieee','std'):
+                uses.append([lib,m.group(2)])
+        refs = [m.group(1) for m in re_vhdl_comp.finditer(t) if m.group(1) not in ('entity','configuration')]
+    elif path.lower().endswith(ext_vlog):
+        t = re_vlog_strip.sub(' ',t)
+        incs = [os.path.join(os.path.dirname(path),i) if not os.path.isfile(i) else i for i in re_vlog_inc.findall(t)]
+        t = t.lower()
+        units = re_vlog_unit.findall(t)
+        refs = [m.group(1) for m in re_vlog_inst.finditer(t) if m.group(1) not in vlog_keywords and m.group(2) not in vlog_keywords]
+        refs += re_vlog_pkg.findall(t)
+    else:
+        return None
+    return {
+        'units': sorted(set(units)),
+        'uses':  sorted(set(map(tuple,uses))),
+        'refs':  sorted(set(refs)-set(units)),
+        'incs':  sorted(set(incs))
+        }
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path,'rb') as f:
+        for b in iter(lambda: f.read(1<<20),b''):
+            h.update(b)
+    return h.hexdigest()
+
+# scan sources, reusing cached results: stat first, hash only on mtime/size
+# mismatch, rescan only on hash mismatch
+def scan_srcs(files,cache_file=scan_cache_file):
+    cache = {}
+    if cache_file and os.path.isfile(cache_file):
+        try:
+            with open(cache_file,'r') as f:
+                cache = json.load(f)
+        except (OSError,ValueError):
+            cache = {}
+    dirty = False
+    r = {}
+    for path in files:
+        try:
+            st = os.stat(path)
+        except OSError:
+            r[path] = None
+            continue
+        e = cache.get(path)
+        if e and e['mtime'] == st.st_mtime and e['size'] == st.st_size:
+            r[path] = e['scan']
+            continue
+        h = file_hash(path)
+        if not e or e['hash'] != h:
+            e = {'hash': h, 'scan': scan_hdl(path)}
+        e['mtime'] = st.st_mtime
+        e['size'] = st.st_size
+        cache[path] = e
+        r[path] = e['scan']
+        dirty = True
+    if cache_file and dirty:
+        write_if_changed(cache_file,json.dumps(cache,indent=1,sort_keys=True))
+    return r
+
+# compilation dependencies of sources given in compile order (list of (lib,src)
+# tuples from process_src), returns list of (prerequisite indices, include files)
+# - a source only depends on earlier sources that provide the units it uses
+# - a source that cannot be scanned depends on the one before it
+def src_deps(c,cache_file=scan_cache_file):
+    scan = scan_srcs(list(dict.fromkeys(s for _,s in c)),cache_file)
+    by_lib = {} # (lib,unit) -> index of latest provider so far
+    by_unit = {} # unit -> list of indices of providers so far
+    r = []
+    for i,(l,s) in enumerate(c):
+        x = scan[s]
+        if x is None:
+            r.append(([i-1] if i else [],[]))
+        else:
+            p = set()
+            for ul,u in x['uses']:
+                j = by_lib.get((ul or l,u))
+                if j is not None:
+                    p.add(j)
+            for u in x['refs']:
+                j = [k for k in by_unit.get(u,[]) if c[k][0] == l] or by_unit.get(u,[])
+                if j:
+                    p.add(j[-1])
+            r.append((sorted(p),x['incs']))
+            for u in x['units']:
+                by_lib[(l,u)] = i
+                by_unit.setdefault(u,[]).append(i)
+    return r
+
+# reverse of src_deps: for each source, sorted indices of all sources that
+# depend on it directly or indirectly
+def src_rdeps(deps):
+    r = [set() for _ in deps]
+    for i in reversed(range(len(deps))):
+        for j in deps[i][0]:
+            r[j].add(i)
+            r[j] |= r[i]
+    return [sorted(x) for x in r]
+
+# compilation dependencies of sources given as makefile source specs
+# (path/file<=lib><;language>), as a makefile of prerequisites between the
+# compile stamps (dir/lib/.touch/file) of nvc.mak, ghdl.mak and vsim.mak
+def deps_mk(src,work,d):
+    c = []
+    for x in src:
+        f,_,l = x.split(';')[0].partition('=')
+        c.append((l or work,f))
+    stamp = lambda i: '%s/%s/.touch/%s' % (d,c[i][0],os.path.basename(c[i][1]))
+    o = []
+    o.append('# generated by make_fpga.py deps - do not edit')
+    for i,(p,incs) in enumerate(src_deps(c,os.path.join(d,scan_cache_file))):
+        if p or incs:
+            o.append(stamp(i)+': '+' '.join([stamp(j) for j in p]+incs))
+    return '\n'.join(o)+'\n'
+
+# write file only if its content changes (atomic replace, leaves mtime alone otherwise)
+def write_if_changed(path,s):
+    try:
+        with open(path,'r',newline='') as f:
+            if f.read() == s:
+                return False
+    except OSError:
+        pass
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d,exist_ok=True)
+    tmp = '%s.%d.tmp' % (path,os.getpid())
+    with open(tmp,'w',newline='') as f:
+        f.write(s)
+    os.replace(tmp,path)
+    return True
+
+# exclusive (or shared) lock on path for the duration of a with block (yields
+# False if wait is False and the lock is held elsewhere)
+@contextlib.contextmanager
+def locked(path,shared=False,wait=True):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+    f = open(path,'a+')
+    try:
+        if os.name == 'posix':
+            import fcntl
+            op = (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if wait else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(f,op)
+            except BlockingIOError:
+                yield False
+                return
+        else:
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(),msvcrt.LK_NBLCK,1)
                     break
-                elif s[j] == "'":
-                    sq = not sq
-                elif s[j] == '"':
-                    dq = not dq
-            if ' ' in v and v[0] != '"': # ensure double quotes around strings
-                v = '"'+v+'"'
-            gen[i] = (n,v)
-        return gen
+                except OSError:
+                    if not wait:
+                        yield False
+                        return
+                    time.sleep(0.1)
+        yield True
+    finally:
+        f.close()
+
+# split spec string at top level separators (outside quotes and braces) in a
+# single pass, returns list of (separator,token), first separator is ''
+# (only quote, brace and separator characters are visited)
+re_spec_special = {}
+def split_spec(s,seps):
+    x = re_spec_special.get(seps)
+    if x is None:
+        x = re_spec_special[seps] = re.compile('[\'"{}'+re.escape(seps)+']')
+    r = []
+    sep = ''
+    i0 = 0
+    q = ''    # quote character when inside quotes
+    depth = 0 # brace depth
+    for m in x.finditer(s):
+        ch = m.group()
+        if q:
+            if ch == q:
+                q = ''
+        elif ch == '"' or ch == "'":
+            q = ch
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+        elif depth == 0:
+            r.append((sep,s[i0:m.start()]))
+            sep = ch
+            i0 = m.end()
+    r.append((sep,s[i0:]))
+    return r
+
+# generic value, double quoted if it contains spaces
+def gen_value(v):
+    if ' ' in v and v[0] != '"':
+        v = '"'+v+'"'
+    return v
+
+# sweep values: {a,b,...} or {lo..hi[..step]}, None if v is not a sweep
+re_sweep_range = re.compile(r'^(-?\d+)\.\.(-?\d+)(?:\.\.(\d+))?$')
+def sweep_values(v):
+    if len(v) < 2 or v[0] != '{' or v[-1] != '}':
+        return None
+    m = re_sweep_range.match(v[1:-1])
+    if m:
+        lo,hi,step = int(m.group(1)),int(m.group(2)),int(m.group(3) or 1)
+        if step < 1:
+            error_exit('bad sweep step: %s' % v)
+        return [str(x) for x in range(lo,hi+1 if hi >= lo else hi-1,step if hi >= lo else -step)]
+    return [gen_value(t.strip()) for _,t in split_spec(v[1:-1],',')]
+
+# delay:path=file
+def parse_sdf(s,what='SDF mapping'):
+    delay,c,pf = s.partition(':')
+    if not c or '=' not in pf:
+        error_exit('bad %s: %s' % (what,s))
+    if delay != 'typ' and delay != 'min' and delay != 'max':
+        error_exit('bad SDF delay in %s: %s' % (what,delay))
+    path,_,file = pf.partition('=')
+    return (delay,path,file)
+
+# waveform formats, and those each simulator supports
+wave_formats = ('off','fst','vcd','wlf','ghw')
+wave_sims = {
+    'nvc':  ('fst','vcd'),
+    'vsim': ('wlf','vcd'),
+    'ghdl': ('fst','vcd','ghw')
+    }
+
+# waveform spec: off, or format followed by any scopes to include (+) or
+# exclude (-) e.g. fst+/tb/dut-/tb/dut/ram, returns (format,[(+/-,scope)...])
+def parse_wave(s,what='waveform spec'):
+    t = re.split(r'([+-])',s)
+    if t[0] not in wave_formats:
+        error_exit('bad %s (format must be one of %s): %s' % (what,', '.join(wave_formats),s))
+    scopes = list(zip(t[1::2],t[2::2]))
+    if (t[0] == 'off' and scopes) or not all(x for _,x in scopes):
+        error_exit('bad %s: %s' % (what,s))
+    return (t[0],scopes)
+
+# waveform spec w (or None) checked for simulator sim, None if off
+def sim_wave(sim,w):
+    if not w or w[0] == 'off':
+        return None
+    if w[0] not in wave_sims[sim]:
+        error_exit('%s does not support %s waveforms (use %s)' % (sim,w[0],' or '.join(wave_sims[sim])))
+    return w
+
+# run limits: heap (nvc simulation heap), rss (peak memory), wall (elapsed
+# time), stop (simulated time)
+limit_names = ('heap','rss','wall','stop')
+re_sim_time = re.compile(r'^\d+(\.\d+)?(fs|ps|ns|us|ms|sec)$')
+
+# run limit name=value, added to dict limits
+def parse_limit(s,limits,what='run limit'):
+    n,c,v = s.partition('=')
+    if not c or n not in limit_names:
+        error_exit('bad %s (expected %s=value): %s' % (what,'|'.join(limit_names),s))
+    if n in ('heap','rss'):
+        limits[n] = parse_size(v)
+    elif n == 'wall':
+        limits[n] = parse_duration(v)
+    elif re_sim_time.match(v):
+        limits[n] = v
     else:
-        return []
+        error_exit('bad simulated time in %s: %s' % (what,s))
+    return limits
+
+# duration in seconds from e.g. "90", "90s", "10m", "2h"
+def parse_duration(s):
+    s = s.strip().lower()
+    m = {'s': 1,'m': 60,'h': 3600}
+    try:
+        return float(s[:-1])*m[s[-1]] if s[-1] in m else float(s)
+    except (ValueError,IndexError):
+        error_exit('bad duration: %s' % s)
+
+# size in bytes from e.g. "500M", "20G"
+def parse_size(s):
+    s = s.strip().upper()
+    m = {'K': 1<<10,'M': 1<<20,'G': 1<<30,'T': 1<<40}
+    try:
+        return int(float(s[:-1])*m[s[-1]]) if s[-1] in m else int(s)
+    except (ValueError,IndexError):
+        error_exit('bad size: %s' % s)
+
+# suffix for run name derived from a sweep value
+def sweep_suffix(v):
+    return re.sub(r'[^\w.+-]','',v) or 'x'
+
+# run specs (see help_run), expanded lazily: yields one Run per run, including
+# one for each combination of sweep values
+def iter_runs(run):
+    for s in run:
+        t = split_spec(s,',;@%')
+        name,c,top = t[0][1].partition(':')
+        if not c:
+            name,top = 'sim',name
+        gen = []
+        sdf = []
+        wave = None
+        limits = {}
+        sweeps = [] # (index into gen,values)
+        for sep,x in t[1:]:
+            if sep == ',':
+                n,c,v = x.partition('=')
+                if not c or not n:
+                    error_exit('unexpected text in run spec:\n  %s' % x)
+                w = sweep_values(v)
+                if w is None:
+                    gen.append((n,gen_value(v) if v else v))
+                else:
+                    sweeps.append((len(gen),w))
+                    gen.append((n,None))
+            elif sep == '@':
+                wave = parse_wave(x,'waveform section in run spec')
+            elif sep == '%':
+                parse_limit(x,limits,'limit section in run spec')
+            else:
+                sdf.append(parse_sdf(x,'SDF section in run spec'))
+        if not sweeps:
+            yield Run(name,top,gen,sdf,wave,limits)
+            continue
+        for vals in itertools.product(*[w for _,w in sweeps]):
+            g = list(gen)
+            for (i,_),v in zip(sweeps,vals):
+                g[i] = (g[i][0],v)
+            yield Run(name+'_'+'_'.join(map(sweep_suffix,vals)),top,g,sdf,wave,limits)
+
+# list of runs, each a Run (name,top,gen,sdf,wave,limits)
+#  where gen = list of tuples (name,value)
+#  sdf = list of triplets (delay,path,file)
+#  wave = (format,scopes) from parse_wave, or None
+#  limits = dict of limits from parse_limit
+# (run names must be unique, as each run has its own directory)
+def process_run(run):
+    runs = list(iter_runs(run))
+    names = set()
+    for r in runs:
+        if r.name in names:
+            error_exit('run names must be unique: %s' % r.name)
+        names.add(r.name)
+    return runs
+
+# generic assignments: name=value[,name=value...]
+def process_gen(gen):
+    r = []
+    for s in gen or []:
+        for _,x in split_spec(s,','):
+            n,c,v = x.partition('=')
+            if not c or not n:
+                error_exit('bad generic assignment: %s' % x)
+            r.append((n,gen_value(v) if v else v))
+    return r
 
 def process_sdf(sdf):
-    if sdf:
-        for i in range(len(sdf)):
-            s = sdf[i]
-            if ':' not in s:
-                error_exit('bad SDF mapping: %s' % s)
-            delay = s.split(':')[0]
-            if delay != 'typ' and delay != 'min' and delay != 'max':
-                error_exit('bad SDF delay: %s' % delay)
-            path,file = s[s.index(':')+1:].split('=')
-            sdf[i] = (delay,path,file)
-        return sdf
-    else:
-        return []
+    return [parse_sdf(s) for s in sdf or []]
 
 def flatten(ll):
     return [] if ll==None else [e for l in ll for e in l]
@@ -176,7 +703,7 @@ help_run = \
     '  file = path/name of SDF file\n' \
     '\n' \
     'A simulation run is specified as follow:\n' \
-    '  [name:]top[,gen][;sdf]\n' \
+    '  [name:]top[,gen][;sdf][@wave][%limit...]\n' \
     'where\n' \
     '  name = unique run name (defaults to sim)\n' \
     '  top  = top design unit\n' \
@@ -184,8 +711,199 @@ help_run = \
     '           name=value[,name=value...]\n' \
     '  sdf  = run specific SDF assignments:\n' \
     '           delay:unit=file[;delay=unit=file...]\n' \
+    '  wave = run specific waveform dump (overrides --wave):\n' \
+    '           off or format[+scope...][-scope...]\n' \
+    '         where format = fst, vcd (nvc, ghdl), wlf, vcd (vsim) or ghw (ghdl)\n' \
+    '         and scopes (in simulator syntax) are included (+) or excluded (-)\n' \
+    '         (each run dumps to its own file)\n' \
+    '  limit = run specific resource limit (enforced by the run monitor):\n' \
+    '           heap=size (nvc simulation heap), rss=size (peak memory),\n' \
+    '           wall=duration (elapsed time, e.g. 90s, 10m) or\n' \
+    '           stop=time (simulated time, e.g. 10ms)\n' \
     'Examples:\n' \
     ' run1:my_design1\n' \
     ' run2:my_design2,gen1=123,gen2="abc"\n' \
     ' run3:my_design3,gen1=123,gen2="abc";typ:/TOP/UNIT1=unit1.sdf\n' \
-    ' run4:my_design4,gen1=123;typ=/TOP/U1=unit1.sdf;min:/TOP/U2=unit2.sdf\n'
+    ' run4:my_design4,gen1=123;typ=/TOP/U1=unit1.sdf;min:/TOP/U2=unit2.sdf\n' \
+    ' run5:my_design5,gen1=123@fst+:my_design5:dut:*-:my_design5:dut:ram:*\n' \
+    ' run6:my_design6%rss=4G%wall=30m%stop=2ms\n' \
+    '\n' \
+    'A run specific generic value may be a sweep, expanding the run into one run\n' \
+    'per combination of sweep values (the cartesian product). A sweep is either\n' \
+    'a list or an integer range:\n' \
+    '  {value,value...}\n' \
+    '  {lo..hi[..step]}\n' \
+    'Each expanded run is named name_value[_value...], using the sweep values.\n' \
+    'Quote run specifications that contain sweeps: the shell expands an unquoted\n' \
+    '{a,b} or {lo..hi} into separate arguments.\n' \
+    'Example (2 x 3 x 100 = 600 runs, named fifo_8_16_1 ... fifo_32_64_100):\n' \
+    ' \'fifo:tb_fifo,width={8,32},depth={16,32,64},seed={1..100}\'\n'
+
+################################################################################
+# project model
+# generator scripts provide emit(p,...) returning their output for Project p,
+# so that many designs can be generated in one process (see generate())
+
+class Run(NamedTuple):
+    name: str
+    top: str
+    gen: List[Tuple[str,str]]     # run specific (generic,value)
+    sdf: List[Tuple[str,str,str]] # run specific (delay,path,file)
+    wave: Tuple = None            # run specific waveform spec (see parse_wave)
+    limits: dict = None           # run specific limits (see parse_limit)
+
+@dataclass
+class Project:
+    src: List[Tuple[str,str]]                                   # (library,source) in compile order
+    work: str = 'work'                                          # work library
+    vhdl: str = '2008'                                          # VHDL LRM
+    lib: List[str] = field(default_factory=list)                # precompiled libraries
+    runs: List[Run] = field(default_factory=list)               # simulation runs
+    gen: List[Tuple[str,str]] = field(default_factory=list)     # (generic,value) for all runs
+    sdf: List[Tuple[str,str,str]] = field(default_factory=list) # (delay,path,file) for all runs
+    dep: List[str] = field(default_factory=list)                # other prerequisites e.g. data files
+    top: List[str] = field(default_factory=list)                # top level design unit(s)
+    aux: List[str] = field(default_factory=list)                # auxiliary text files
+    path: str = ''                                              # path to tool binaries
+    scan: bool = True                                           # scan sources for dependencies
+    scan_cache: str = scan_cache_file
+    lib_defs: str = ''                                          # shared library cache definitions (see libcache_fpga.py)
+    wave: Tuple = None                                          # waveform spec for runs without their own
+
+    # libraries, each with its sources in compile order
+    def libs(self):
+        d = {}
+        for l,s in self.src:
+            d.setdefault(l,[]).append(s)
+        return d
+
+    # for each source: (indices of prerequisite sources, include files)
+    def deps(self):
+        if not self.scan:
+            return [([i-1] if i else [],[]) for i in range(len(self.src))]
+        return src_deps(self.src,self.scan_cache)
+
+# project from command line style specifications (source=lib, run specs etc)
+def make_project(src,work='work',run=None,gen=None,sdf=None,path=None,wave=None,**kw):
+    c,_ = process_src([src],work,kw.get('scan',True),kw.get('scan_cache'))
+    if path:
+        path += '/' if path[-1] != '/' else ''
+    return Project(
+        src=c,
+        work=work,
+        runs=process_run(run or []),
+        gen=process_gen(gen),
+        sdf=process_sdf(sdf),
+        path=path or '',
+        wave=parse_wave(wave) if wave else None,
+        **kw
+        )
+
+# precompiled libraries taken from the shared library cache (those defined in
+# p.lib_defs): list of (library,sources including those of libraries it uses)
+def cached_libs(p):
+    if not p.lib_defs:
+        return []
+    lc = importlib.import_module('libcache_fpga')
+    defs = lc.read_defs(p.lib_defs)
+    return [(l,lc.lib_srcs(defs,l)) for l in p.lib if l in defs]
+
+# makefile lines to get cached libraries for simulator sim: each library's
+# cache directory is written to .libcache/<library> (listed by LIBCACHE_DIRS),
+# vmap maps them in modelsim.ini as well (vsim)
+def libcache_mk(p,sim,cached,vmap=False):
+    o = []
+    o.append('# precompiled libraries from the shared library cache (see libcache_fpga.py)')
+    o.append('LIBCACHE_DEFS:='+os.path.abspath(p.lib_defs).replace('\\','/'))
+    o.append('LIBCACHE:=$(PYTHON) %s get --sim %s --defs $(LIBCACHE_DEFS)%s%s' % (
+        libcache_py,sim,' --path '+p.path if p.path else '',' --vmap modelsim.ini' if vmap else ''))
+    o.append('LIBCACHE_DIRS:='+' '.join(['.libcache/'+l for l,_ in cached]))
+    for l,s in cached:
+        o.append('.libcache/%s: $(LIBCACHE_DEFS) %s%s' % (l,' '.join(s),' | modelsim.ini' if vmap else ''))
+        o.append('\t$(LIBCACHE) --out $@ %s' % l)
+    return o
+
+# generator module for each kind of output
+emitters = {
+    'nvc':     'make_nvc',
+    'vsim':    'make_vsim',
+    'do_vsim': 'do_vsim',
+    'radiant': 'make_radiant',
+    'vscode':  'make_vscode'
+    }
+
+# generate output of given kind for project p (opts are emitter specific)
+def generate(kind,p,**opts):
+    if kind not in emitters:
+        error_exit('unknown generator: %s' % kind)
+    return importlib.import_module(emitters[kind]).emit(p,**opts)
+
+################################################################################
+# helper commands for use in generated recipes
+
+# modules providing further commands: each has add_commands(sub), adding their
+# subparsers, and command(args,cmd), performing them
+command_modules = {
+    'step':    'step_fpga',
+    'steps':   'step_fpga',
+    'prune':   'prune_fpga',
+    'monitor': 'monitor_fpga',
+    'tclsend': 'tcl_fpga'
+    }
+
+def main(argv):
+    cmd = []
+    if '--' in argv:
+        cmd = argv[argv.index('--')+1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser(
+        prog='make_fpga.py',
+        description='Helper commands for makefiles generated by make-fpga'
+       )
+    sub = parser.add_subparsers(dest='cmd',required=True)
+    p = sub.add_parser(
+        'stamp',
+        help='run a compile command unless its content hash stamp is up to date',
+        usage='make_fpga.py stamp [-C DIR] STAMP [INPUT ...] -- COMMAND ...'
+       )
+    p.add_argument('-C',dest='dir',help='directory to run command in')
+    p.add_argument('stamp',help='stamp file')
+    p.add_argument('inputs',nargs='*',help='input files (e.g. source, dependency stamps)')
+    p = sub.add_parser(
+        'lock',
+        help='run a command holding an exclusive lock (e.g. to serialize updates of a library)',
+        usage='make_fpga.py lock LOCK -- COMMAND ...'
+       )
+    p.add_argument('lock',help='lock file')
+    p = sub.add_parser(
+        'deps',
+        help='scan sources for compilation dependencies and write them as a makefile',
+        usage='make_fpga.py deps --dir DIR [--work LIB] --out FILE SRC [SRC ...]'
+       )
+    p.add_argument('--dir',required=True,help='simulation directory (compile stamps are DIR/lib/.touch/file)')
+    p.add_argument('--work',default='work',help='library of sources that do not specify one (defaults to work)')
+    p.add_argument('--out',required=True,help='makefile to write')
+    p.add_argument('src',nargs='+',help='source specs (path/file<=lib><;language>)')
+    for m in dict.fromkeys(command_modules.values()):
+        importlib.import_module(m).add_commands(sub)
+    args = parser.parse_args(argv)
+    if args.cmd in command_modules:
+        return importlib.import_module(command_modules[args.cmd]).command(args,cmd)
+    elif args.cmd == 'stamp':
+        if not cmd:
+            error_exit('stamp: no command specified')
+        return stamp_run(args.stamp,args.inputs,cmd,args.dir)
+    elif args.cmd == 'lock':
+        if not cmd:
+            error_exit('lock: no command specified')
+        with locked(args.lock):
+            return subprocess.call(cmd)
+    elif args.cmd == 'deps':
+        # touched if unchanged, so that make sees it up to date
+        mk = deps_mk(args.src,args.work,args.dir)
+        if not write_if_changed(args.out,mk):
+            os.utime(args.out)
+        return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
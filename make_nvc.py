@@ -6,140 +6,204 @@
 
 import sys,os,argparse
 from make_fpga import *
+from step_fpga import step_mk
+from monitor_fpga import sim_limits,heap_size,monitor_mk,monitor_opts
 
-# parse arguments
+# run options to dump waveforms for run r of project p (or '')
+def wave_opts(p,r):
+    w = sim_wave('nvc',r.wave or p.wave)
+    if not w:
+        return ''
+    return ' '.join(['--wave=$(WAVE_DIR)/%s.%s' % (r.name,w[0]),'--format='+w[0]]+
+        [('--include=' if c == '+' else '--exclude=')+x for c,x in w[1]])
 
-parser = argparse.ArgumentParser(
-    prog='make_nvc.py',
-    description='Create makefiles for simulating FPGA designs with NVC',
-    epilog=help_run,
-    formatter_class=argparse.RawDescriptionHelpFormatter
-   )
-parser.add_argument(
-    '--lib',
-    nargs='+',
-    action='append',
-    help='precompiled libraries'
-   )
-parser.add_argument(
-    '--vhdl',
-    choices=['1993','2000','2002','2008','2019'],
-    help='VHDL LRM version (defaults to 2008)',
-    default='2008'
-   )
-parser.add_argument(
-    '--work',
-    help='work library (defaults to "work")',
-    default='work'
-   )
-parser.add_argument(
-    '--src',
-    required=True,
-    nargs='+',
-    action='append',
-    help='source(s) in compile order (append =LIB to specify library name)'
-   )
-parser.add_argument(
-    '--dep',
-    nargs='+',
-    action='append',
-    help='other dependancies e.g. data files'
-   )
-parser.add_argument(
-    '--run',
-    required=True,
-    nargs='+',
-    action='append',
-    help='simulation run specification(s) (see below)'
-   )
-parser.add_argument(
-    '--gen',
-    nargs='+',
-    action='append',
-    help='generics assignment(s) (applied to all runs)'
-   )
+# makefile for project p
+def emit(p):
+    d = p.libs()
+    wave = {r.name: wave_opts(p,r) for r in p.runs}
+    cached = cached_libs(p)
+    deps = p.deps()
+    com = [l+'/'+os.path.basename(s)+'.com' for l,s in p.src]
+    o = []
+    o.append('# makefile generated by make_nvc.py (see https://github.com/amb5l/make-fpga)')
 
-args=parser.parse_args()
-c,d=process_src(args.src,args.work)
-args.dep=flatten(args.dep)
-runs=process_run(flatten(args.run))
-args.lib=flatten(args.lib)
-args.gen=process_gen(flatten(args.gen))
+    o.append('# for simulation using ModelSim/Questa/etc')
+    o.append('')
+    o.append('################################################################################')
+    o.append('# simulation specific definitions')
+    o.append('')
+    o.append('# libraries to compile source into')
+    o.append('LIB:='+' '.join(d))
+    o.append('')
+    o.append('# sources in compilation order (source=library)')
+    o.append('SRC:='+var_vals([s+'='+l for l,s in p.src]))
+    o.append('')
+    o.append('# other simulation prerequisites (e.g. data files)')
+    o.append('DEP:='+var_vals(p.dep))
+    o.append('')
+    o.append('# simulation runs (top plus any run specific generic/SDF assignments)')
+    o.append('RUNS:='+' '.join([r[0] for r in p.runs]))
+    for r in p.runs:
+        # generics precede the top: nvc takes options before the unit name
+        s = 'RUN.'+r[0]+':='+''.join(['-g'+g+'='+v+' ' for g,v in r[2]])+r[1]
+        if r[3]:        
+            s += ' '+' '.join(['-sdf'+t+' '+q+'='+f for t,q,f in r[3]])
+        o.append(s)
+        if wave[r.name]:
+            o.append('WAVE.%s=%s' % (r.name,wave[r.name]))
+    if any(wave.values()):
+        o.append('')
+        o.append('# waveform dumps: directory (one file per run), and disk budget above which')
+        o.append('# the oldest are deleted after each run (e.g. 20G, empty for no limit)')
+        o.append('WAVE_DIR?=waves')
+        o.append('WAVE_BUDGET?=')
+    o.append('')
+    o.append('# generic assignments (applied to all simulation runs)')
+    o.append('GEN:='+var_vals(list(map(lambda e: '-g'+e[0]+'='+e[1],p.gen))))
+    o.append('')
+    o.append('# global, analysis, elaboration and run options')
+    o.append('NVC_GOPTS+=--std='+p.vhdl+' -L.'+(' $(foreach x,$(LIBCACHE_DIRS),-L $(file <$x))' if cached else ''))
+    o.append('NVC_AOPTS+=--relaxed')
+    o.append('NVC_EOPTS+=')
+    o.append('NVC_ROPTS+=--ieee-warnings=off')
+    o.append('')
+    o.append('################################################################################')
+    o.append('')
+    o.append('# default goal')
+    o.append('all: nvc')
+    o.append('')
+    o.append('# no built-in implicit rules (speeds up make start up for large designs)')
+    o.append('MAKEFLAGS+=--no-builtin-rules')
+    o.append('.SUFFIXES:')
+    o.append('')
+    o.append('# default name for single run')
+    o.append('RUN:=$(if $(word 2,$(RUN)),$(RUN),$(if $(filter :,$(RUN)),$(RUN),sim:$(RUN)))')
+    o.append('')
+    o.append('# content hash compile stamps skip recompilation of unchanged sources')
+    o.append('PYTHON?=python3')
+    o.append('MAKE_FPGA_PY:='+make_fpga_py)
+    o.append('')
+    o += step_mk
+    o.append('')
+    o += monitor_mk('nvc')
+    o.append('')
+    if cached:
+        o += libcache_mk(p,'nvc',cached)
+        o.append('')
+    o.append('# compiled source stamps')
+    o.append('COM:='+var_vals(com))
+    o.append('')
+    o.append('# rule(s) and recipe(s) to compile source(s)')
+    o.append('# (dependencies from source scan allow parallel compilation)')
+    for k,((l,s),(q,i)) in enumerate(zip(p.src,deps)):
+        o.append('%s: %s $(DEP)%s' % (com[k],' '.join([s]+[com[j] for j in q]+i),' $(LIBCACHE_DIRS)' if cached else ''))
+        o.append('\t$(STEP) $(PYTHON) $(MAKE_FPGA_PY) stamp $@ $^ -- nvc $(NVC_GOPTS) --work=%s -a $(NVC_AOPTS) $<' % l)
+    o.append('')
+    o.append('# rule(s) and recipe(s) to run simulation(s)')
+    for r in p.runs:
+        o.append('%s: $(COM)' % r[0])
+        o.append('\t@bash -c \'echo -e "\033[0;32mRUN: %s (%s)  start at $$(date +%%T.%%2N)\033[0m"\'' % (r[0],r[1]))
+        l = sim_limits('nvc',r.limits)
+        h = ' -H '+heap_size(l['heap']) if 'heap' in l else ''
+        x = ' --stop-time='+l['stop'] if 'stop' in l else ''
+        m = monitor_opts(r)
+        if wave[r.name]:
+            o.append('\t@mkdir -p $(WAVE_DIR)')
+            x += ' $(WAVE.%s)' % r[0]
+        # elaborate and run in one invocation without saving the elaborated
+        # design, so that runs of the same top (e.g. a sweep) cannot race on it
+        o.append('\t$(STEP) %s nvc $(NVC_GOPTS)%s -e --jit --no-save $(NVC_EOPTS) $(GEN) $(RUN.%s) -r $(NVC_ROPTS)%s' % (
+            '$(call MONITOR,%s)' % m if m else '$(MONITOR)',h,r[0],x))
+        if wave[r.name]:
+            o.append('\t$(if $(WAVE_BUDGET),@$(PYTHON) $(MAKE_FPGA_PY) prune --budget $(WAVE_BUDGET) $(WAVE_DIR))')
+        o.append('\t@bash -c \'echo -e "\033[0;31mRUN: %s (%s)    end at $$(date +%%T.%%2N)\033[0m"\'' % (r[0],r[1]))
+        o.append('nvc:: %s' % r[0])
+    return '\n'.join(o)+'\n'
 
-# output
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='make_nvc.py',
+        description='Create makefiles for simulating FPGA designs with NVC',
+        epilog=help_run,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    parser.add_argument(
+        '--lib',
+        nargs='+',
+        action='append',
+        help='precompiled libraries'
+       )
+    parser.add_argument(
+        '--lib_defs',
+        help='shared library cache definitions: precompiled libraries defined here are taken from the cache (see libcache_fpga.py)'
+       )
+    parser.add_argument(
+        '--vhdl',
+        choices=['1993','2000','2002','2008','2019'],
+        help='VHDL LRM version (defaults to 2008)',
+        default='2008'
+       )
+    parser.add_argument(
+        '--work',
+        help='work library (defaults to "work")',
+        default='work'
+       )
+    parser.add_argument(
+        '--src',
+        required=True,
+        nargs='+',
+        action='append',
+        help='source(s) in compile order, globs or directories (append =LIB to specify library name)'
+       )
+    parser.add_argument(
+        '--dep',
+        nargs='+',
+        action='append',
+        help='other dependancies e.g. data files'
+       )
+    parser.add_argument(
+        '--run',
+        required=True,
+        nargs='+',
+        action='append',
+        help='simulation run specification(s) (see below)'
+       )
+    parser.add_argument(
+        '--gen',
+        nargs='+',
+        action='append',
+        help='generics assignment(s) (applied to all runs)'
+       )
+    parser.add_argument(
+        '--wave',
+        help='waveform dump for runs without their own (see below, defaults to off)'
+       )
+    parser.add_argument(
+        '--no_scan',
+        action='store_true',
+        help='do not scan sources for dependencies (compile strictly in order)'
+       )
+    parser.add_argument(
+        '--scan_cache',
+        help='source scan cache file (defaults to %s)' % scan_cache_file,
+        default=scan_cache_file
+       )
 
-print('# makefile generated by make_nvc.py (see https://github.com/amb5l/make-fpga)')
+    args = parser.parse_args(argv)
+    p = make_project(
+        flatten(args.src),
+        work=args.work,
+        run=flatten(args.run),
+        gen=flatten(args.gen),
+        vhdl=args.vhdl,
+        lib=flatten(args.lib),
+        lib_defs=args.lib_defs or '',
+        dep=flatten(args.dep),
+        wave=args.wave,
+        scan=not args.no_scan,
+        scan_cache=args.scan_cache
+        )
+    sys.stdout.write(emit(p))
 
-print('# for simulation using ModelSim/Questa/etc')
-print('')
-print('################################################################################')
-print('# simulation specific definitions')
-print('')
-print('# libraries to compile source into')
-print('LIB:='+' '.join(d))
-print('')
-print('# sources in compilation order (source=library)')
-print('SRC:='+var_vals([s+'='+l for l,s in c]))
-print('')
-print('# other simulation prerequisites (e.g. data files)')
-print('DEP:='+var_vals(args.dep))
-print('')
-print('# simulation runs (top plus any run specific generic/SDF assignments)')
-print('RUNS:='+' '.join([r[0] for r in runs]))
-for r in runs:
-    s = 'RUN.'+r[0]+':='+r[1]
-    if r[2]:
-        s += ' '+' '.join(['-g'+g+'='+v for g,v in r[2]])
-    if r[3]:        
-        s += ' '+' '.join(['-sdf'+t+' '+p+'='+f for t,p,f in r[3]])
-    print(s)
-print('')
-print('# generic assignments (applied to all simulation runs)')
-print('GEN:='+var_vals(list(map(lambda e: '-g'+e[0]+'='+e[1],args.gen))))
-print('')
-print('# global, analysis, elaboration and run options')
-print('NVC_GOPTS+=--std='+args.vhdl+' -L.')
-print('NVC_AOPTS+=--relaxed')
-print('NVC_EOPTS+=')
-print('NVC_ROPTS+=--ieee-warnings=off')
-print('')
-print('################################################################################')
-print('')
-print('# default goal')
-print('all: nvc')
-print('')
-print('# default name for single run')
-print('RUN:=$(if $(word 2,$(RUN)),$(RUN),$(if $(filter :,$(RUN)),$(RUN),sim:$(RUN)))')
-print('')
-print('# useful definitions')
-print('comma:=,')
-print('rest=$(wordlist 2,$(words $1),$1)')
-print('chop=$(wordlist 1,$(words $(call rest,$1)),$1)')
-print('src_dep=$1,$2')
-print('pairmap=$(and $(strip $2),$(strip $3),$(call $1,$(firstword $2),$(firstword $3)) $(call pairmap,$1,$(call rest,$2),$(call rest,$3)))')
-print('')
-print('# compilation dependencies enforce compilation order')
-print('dep:=$(firstword $(SRC)), $(if $(word 2,$(SRC)),$(call pairmap,src_dep,$(call rest,$(SRC)),$(call chop,$(SRC))),)')
-print('')
-print('# generate rule(s) and recipe(s) to compile source(s)')
-print('define rr_compile')
-print('$1/$(notdir $2).com: $2 $3 $(DEP)')
-print('\tnvc $(NVC_GOPTS) --work=$(strip $1) -a $(NVC_AOPTS) $$<')
-print('\ttouch $$@')
-print('endef')
-print('$(foreach d,$(dep),$(eval $(call rr_compile, \\')
-print('$(word 2,$(subst =, ,$(word 1,$(subst $(comma), ,$d)))), \\')
-print('$(word 1,$(subst =, ,$(word 1,$(subst $(comma), ,$d)))), \\')
-print('$(addsuffix .com,$(addprefix $(word 2,$(subst =, ,$(word 2,$(subst $(comma), ,$d))))/,$(notdir $(word 1,$(subst =, ,$(word 2,$(subst $(comma), ,$d))))))) \\')
-print(')))')
-print('')
-print('# generate rule(s) and recipe(s) to run simulation(s)')
-print('define rr_run')
-print('$1: $(word 2,$(subst =, ,$(lastword $(SRC))))/$(notdir $(word 1,$(subst =, ,$(lastword $(SRC))))).com')
-print('	@bash -c \'echo -e "\033[0;32mRUN: $1 ($(word 1,$(RUN.$1)))  start at $$$$(date +%T.%2N)\033[0m"\'')
-print('	nvc $(NVC_GOPTS) -e $(NVC_EOPTS) $(GEN) $(RUN.$1)')
-print('	nvc $(NVC_GOPTS) -r $(NVC_ROPTS) $(word 1,$(RUN.$1))')
-print('	@bash -c \'echo -e "\033[0;31mRUN: $1 ($(word 1,$(RUN.$1)))    end at $$$$(date +%T.%2N)\033[0m"\'')
-print('nvc:: $1')
-print('endef')
-print('$(foreach r,$(RUNS),$(eval $(call rr_run,$r)))')
\ No newline at end of file
+if __name__ == '__main__':
+    main()
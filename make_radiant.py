@@ -7,376 +7,466 @@
 
 import sys,os,argparse
 from make_fpga import *
+from tcl_fpga import tclserve_tcl
 
-# parse arguments
+# makefile for project p, flow and target device
+def emit(p,flow='cmd',proj='fpga',impl='impl_1',arch=None,dev=None,perf=None,freq=None,use_io_reg='Auto',ldc=(),pdc=(),session=False,par_seeds=None,par_jobs=None):
+    d = p.libs()
+    o = []
+    # goal that appends QoR and runtime metrics from the reports in directory r
+    qor = lambda r: [
+        '# QoR and runtime metrics (appended to trend database)',
+        'PYTHON?=python3',
+        'QOR_FPGA_PY:='+make_fpga_py.rsplit('/',1)[0]+'/qor_fpga.py',
+        'QOR_DB?=qor.jsonl',
+        'qor:',
+        '\t$(PYTHON) $(QOR_FPGA_PY) --design $(TOP) --db $(QOR_DB) '+r,
+        ''
+        ]
+    o.append('# makefile generated by make_radiant.py (see https://github.com/amb5l/make-fpga)')
+    o.append('# for building an FPGA design using Lattice Radiant.')
+    o.append('# FLOW: '+('IDE (project mode)' if flow == 'ide' else 'command line (batch mode)'))
+    o.append('')
+    o.append('.PHONY: all bin nvcm net ibis qor clean force')
+    o.append('all: bin')
+    o.append('force:')
+    o.append('')
+    o.append('################################################################################')
+    o.append('# design specific section')
+    o.append('')
+    if flow == 'ide':
+        o.append('# project')
+        o.append('PROJ:='+proj)
+        o.append('IMPL:='+impl)
+        o.append('')
+    o.append('# FPGA')
+    o.append('ARCH:='+arch)
+    o.append('DEV:='+dev)
+    o.append('PERF:='+(perf if perf else ''))
+    o.append('FREQ:='+(freq if freq else ''))
+    o.append('')
+    o.append('# sources in compilation order (source=library)')
+    o.append('VHDL:='+('2008' if p.vhdl else ''))
+    o.append('LIB:='+' '.join(d))
+    for l in d:
+        o.append('SRC.%s:=%s' % (l,var_vals(d[l])))
+    o.append('SRC:='+' '.join(['$(SRC.%s)' % l for l in d]))
+    o.append('')
+    o.append('# logical (pre-synthesis) constraints')
+    o.append('LDC:='+var_vals(ldc))
+    o.append('')
+    o.append('# physical (post-synthesis) constraints')
+    o.append('PDC:='+var_vals(pdc))
+    o.append('')
+    o.append('# other synthesis prerequisites (e.g. data files)')
+    o.append('DEP:='+var_vals(p.dep))
+    o.append('')
+    o.append('# top level design unit')
+    o.append('TOP:='+p.top[0])
+    o.append('')
+    o.append('# top level VHDL generics / Verilog parameters')
+    o.append('GEN:='+var_vals([n+'='+v for n,v in p.gen]))
+    o.append('')
+    o.append('# use I/O registers option (Auto, True or False)')
+    o.append('USE_IO_REG:='+use_io_reg)
+    o.append('')
+    if flow == 'cmd' and par_seeds:
+        o.append('# place and route starting cost tables (run concurrently, best result is kept)')
+        o.append('PAR_SEEDS:='+' '.join(par_seeds))
+        o.append('PAR_JOBS:='+(str(par_jobs) if par_jobs else ''))
+        o.append('')
+    o.append('################################################################################')
+    o.append('# flow specific section')
+    o.append('')
+    if flow == 'ide':
+        o.append('RDF:=$(PROJ).rdf')
+        o.append('VM_SYN:=$(IMPL)/$(PROJ)_$(IMPL).vm')
+        o.append('UDB_SYN:=$(IMPL)/$(PROJ)_$(IMPL)_syn.udb')
+        o.append('UDB_MAP:=$(IMPL)/$(PROJ)_$(IMPL)_map.udb')
+        o.append('UDB_PAR:=$(IMPL)/$(PROJ)_$(IMPL).udb')
+        o.append('BIN:=$(IMPL)/$(PROJ)_$(IMPL).bin')
+        o.append('NVCM:=$(IMPL)/$(PROJ)_$(IMPL).nvcm')
+        o.append('NET:=$(IMPL)/$(PROJ)_$(IMPL)_vo.vo')
+        o.append('SDF:=$(IMPL)/$(PROJ)_$(IMPL)_vo.sdf')
+        o.append('IBIS:=$(IMPL)/IBIS/$(PROJ)_$(IMPL).ibs')
+    if flow == 'cmd':
+        o.append('VM_SYN:=$(TOP)_syn.vm')
+        o.append('UDB_SYN:=$(TOP)_syn.udb')
+        o.append('UDB_MAP:=$(TOP)_map.udb')
+        o.append('UDB_PAR:=$(TOP).udb')
+        o.append('BIN:=$(TOP).bin')
+        o.append('NVCM:=$(TOP).nvcm')
+        o.append('NET:=$(TOP)_vo.vo')
+        o.append('SDF:=$(TOP)_vo.sdf')
+        o.append('IBIS:=IBIS/$(TOP).ibs')
+    o.append('')
+    o.append('bin: $(BIN)')
+    o.append('nvcm: $(NVCM)')
+    o.append('net: $(NET) $(SDF)')
+    o.append('ibis: $(IBIS)')
+    o.append('')
+    if flow == 'ide':
+        o.append('comma:=,')
+        o.append('space:=$(subst x, ,x)')
+        o.append('')
+        o.append('ifeq ($(OS),Windows_NT)')
+        o.append('TCLSH:=pnmainc')
+        o.append('else')
+        o.append('TCLSH:=radiantc')
+        o.append('endif')
+        o.append('')
+        o.append('TCLSHIM:=tclshim.tcl')
+        o.append('$(TCLSHIM): force')
+        o.append('\t@echo "puts [join \$$argv \\" \\"]; set e [catch {set r [eval [join \$$argv \\" \\"]]} m]; if \$$e {puts \$$m; exit \$$e} else {puts \$$r}" > $@')
+        o.append('')
+        o.append('TCLRUN:=$(TCLSH) $(TCLSHIM)')
+        o.append('')
+        if session:
+            # one Tcl shell serves all steps: the project is opened once
+            o.append('# persistent Tcl session: started by the first step, keeps the project open')
+            o.append('# between steps, exits after TCLSESSION_IDLE seconds idle or on "make session_stop"')
+            o.append('PYTHON?=python3')
+            o.append('MAKE_FPGA_PY:='+make_fpga_py)
+            o.append('TCLSERVE:='+tclserve_tcl)
+            o.append('TCLSESSION:=.tclsession')
+            o.append('TCLSESSION_IDLE?=600')
+            o.append('TCLSEND:=$(PYTHON) $(MAKE_FPGA_PY) tclsend $(TCLSESSION)')
+            o.append('TCLSTART:=--start "$(TCLSH) $(TCLSERVE) $(TCLSESSION) $(TCLSESSION_IDLE)"')
+            o.append('')
+            o.append('.PHONY: session_stop')
+            o.append('session_stop:')
+            o.append('\t-@$(TCLSEND) -- session_exit')
+            o.append('')
+            tcl_begin = '\t$(TCLSEND) $(TCLSTART) -- \\'
+            tcl_open = '\t\tsession_project prj_open prj_close $(RDF) \';\' \\'
+            tcl_close = '\t\tprj_close'
+            tcl_end = ['\t\tprj_save']
+        else:
+            tcl_begin = '\tbash -c "$(TCLRUN) \\'
+            tcl_open = '\t\tprj_open $(RDF) \';\' \\'
+            tcl_close = '\t\tprj_close"'
+            tcl_end = ['\t\tprj_save \';\' \\',tcl_close]
+        o.append('# project recipe')
+        o.append('RECIPE:=$(PROJ) $(DEV) $(IMPL) $(VHDL) $(SRC) $(LDC) $(PDC) $(TOP) $(GEN)')
+        o.append('RECIPE_FILE:=$(PROJ).txt')
+        o.append('$(RECIPE_FILE): force')
+        o.append('\t@bash -c \'[ -f $@ ] && r=$$(< $@) || r=""; if [[ $$r != "$(RECIPE)" ]]; then echo "$(RECIPE)" > $@; rm -f $(RDF); fi\'')
+        o.append('')
+        o.append('# create project, set VHDL standard, add source, set generics, set top')
+        o.append('$(RDF): $(RECIPE_FILE) $(SRC) $(LDC) $(PDC) | $(TCLSHIM)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mCREATE PROJECT\\033[0m"\'')
+        o.append(tcl_begin)
+        if session:
+            o.append('\t\tsession_close \';\' \\')
+        o.append('\t\tprj_create \\')
+        o.append('\t\t\t-name $(PROJ) \\')
+        o.append('\t\t\t-dev $(DEV) \\')
+        o.append('\t\t\t$(addprefix -performance ,$(PERF)) \\')
+        o.append('\t\t\t-impl $(IMPL) \\')
+        o.append('\t\t\t-synthesis LSE \';\' \\')
+        o.append('\t\tprj_set_strategy_value -strategy Strategy1 PROP_LST_VHDL2008=$(if $(filter 2008,$(VHDL)),True,False) \';\' \\')
+        o.append('\t\t$(foreach l,$(LIB), $(foreach s,$(SRC.$l), \\')
+        o.append('\t\t prj_add_source -impl $(IMPL) -work $l -format $(if $(filter .vhd,$(suffix $s)),vhd,ver) $s \';\' \\')
+        o.append('\t\t)) \\')
+        o.append('\t\t$(foreach s,$(LDC) $(PDC), \\')
+        o.append('\t\t prj_add_source -impl $(IMPL) $s \';\' \\')
+        o.append('\t\t) \\')
+        o.append('\t\tprj_set_impl_opt -impl $(IMPL) HDL_PARAM $(subst $(space),$(comma),$(GEN)) \';\' \\')
+        o.append('\t\tprj_set_impl_opt -impl $(IMPL) top $(TOP) \';\' \\')
+        o.append('\t\tprj_set_strategy_value -strategy Strategy1 lse_use_io_reg=$(USE_IO_REG) \';\' \\')
+        o.append('\t\tprj_save \';\' \\')
+        o.append(tcl_close)
+        o.append('')
+        o.append('# Synthesis (compile structural Verilog netlist from HDL source)')
+        o.append('# and Post Synthesis (combine .vm and IP into Unified Database)')
+        o.append('$(VM_SYN) $(UDB_SYN): $(SRC) $(LDC) $(PDC) $(DEP) | $(RDF)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mSYNTHESIZE\\033[0m"\'')
+        o.append(tcl_begin)
+        o.append(tcl_open)
+        o.append('\t\tprj_run Synthesis -impl $(IMPL) \';\' \\')
+        o += tcl_end
+        o.append('')
+        o.append('# Map (convert generic logic to device specific resources)')
+        o.append('$(UDB_MAP): $(UDB_SYN)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mMAP\\033[0m"\'')
+        o.append(tcl_begin)
+        o.append(tcl_open)
+        o.append('\t\tprj_run Map -impl $(IMPL) \';\' \\')
+        o += tcl_end
+        o.append('')
+        o.append('# Place and Route')
+        o.append('$(UDB_PAR): $(UDB_MAP)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mPLACE AND ROUTE\\033[0m"\'')
+        o.append(tcl_begin)
+        o.append(tcl_open)
+        o.append('\t\tprj_run PAR -impl $(IMPL) \';\' \\')
+        o += tcl_end
+        o.append('')
+        o.append('# Generate programming binary file')
+        o.append('$(BIN): $(UDB_PAR)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mGENERATE PROGRAMMING BINARY FILE\\033[0m"\'')
+        o.append(tcl_begin)
+        o.append(tcl_open)
+        o.append('\t\tprj_set_strategy_value -strategy Strategy1 bit_out_format=bin \';\' \\')
+        o.append('\t\tprj_run Export -impl $(IMPL) -task Bitgen\';\' \\')
+        o += tcl_end
+        o.append('')
+        o.append('# Generate NVCM programming file')
+        o.append('$(NVCM): $(UDB_PAR)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mGENERATE NVCM FILE\\033[0m"\'')
+        o.append(tcl_begin)
+        o.append(tcl_open)
+        o.append('\t\tprj_set_strategy_value -strategy Strategy1 bit_out_format=nvcm \';\' \\')
+        o.append('\t\tprj_run Export -impl $(IMPL) -task Bitgen\';\' \\')
+        o.append('\t\tprj_set_strategy_value -strategy Strategy1 bit_out_format=bin \';\' \\')
+        o += tcl_end
+        o.append('')
+        o.append('# Generate Verilog netlist and structured delay file for timing simulation')
+        o.append('$(NET) $(SDF): $(UDB_PAR)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mGENERATE TIMING NETLIST AND DELAY FILE\\033[0m"\'')
+        o.append(tcl_begin)
+        o.append(tcl_open)
+        o.append('\t\tprj_run Export -impl $(IMPL) -task TimingSimFileVlg\';\' \\')
+        o += tcl_end
+        o.append('\t\t')
+        o.append('# Generate IBIS model')
+        o.append('$(IBIS): $(UDB_PAR)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mGENERATE IBIS MODEL\\033[0m"\'')
+        o.append(tcl_begin)
+        o.append(tcl_open)
+        o.append('\t\tprj_run Export -impl $(IMPL) -task IBIS \';\' \\')
+        o += tcl_end
+        o.append('')
+        o += qor('$(IMPL)')
+        o.append('clean:')
+        if session:
+            o.append('\t-@$(TCLSEND) -- session_exit')
+            o.append('\trm -f $(TCLSESSION) $(TCLSESSION).log')
+        o.append('\trm -f *.tcl *.txt *.rdf *.sty hdr_log .recovery .setting.ini')
+        o.append('\trm -rf $(IMPL)')
+    if flow == 'cmd':
+        o.append('')
+        o.append('ifndef LATTICE_RADIANT')
+        o.append('$(error LATTICE_RADIANT environment variable is not defined)')
+        o.append('endif')
+        o.append('')
+        o.append('ifndef FOUNDRY')
+        o.append('$(error Lattice FOUNDRY environment variable is not defined)')
+        o.append('endif')
+        o.append('')
+        o.append('# Synthesis (compile structural Verilog netlist from HDL source)')
+        o.append('$(VM_SYN): $(SRC) $(LDC) $(DEP)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mSYNTHESIS\\033[0m"\'')
+        o.append('\tsynthesis \\')
+        o.append('\t\t-output_hdl $@ \\')
+        o.append('\t\t-a $(ARCH) \\')
+        o.append('\t\t-p $(word 1,$(subst -, ,$(DEV))) \\')
+        o.append('\t\t-t $(shell echo $(DEV)| grep -Po "(?<=-)(.+\d+)") \\')
+        o.append('\t\t$(addprefix -sp ,$(PERF)) \\')
+        o.append('\t\t$(addprefix -frequency ,$(FREQ)) \\')
+        o.append('\t\t$(addprefix -vh,$(VHDL)) \\')
+        o.append('\t\t$(foreach l,$(LIB), $(foreach s,$(SRC.$l), \\')
+        o.append('\t\t -lib $l -$(if $(filter .vhd,$(suffix $s)),vhd,ver) $s \\')
+        o.append('\t\t)) \\')
+        o.append('\t\t$(addprefix -sdc ,$(LDC)) \\')
+        o.append('\t\t-use_io_reg $(if $(filter Auto,$(USE_IO_REG)),auto,$(if $(filter True,$(USE_IO_REG)),1,0)) \\')
+        o.append('\t\t-top $(TOP) \\')
+        o.append('\t\t$(subst =, ,$(addprefix -hdl_param ,$(GEN))) \\')
+        o.append('\t\t-logfile $(basename $@).log')
+        o.append('')
+        o.append('# Post Synthesis (combine .vm and IP into Unified Database)')
+        o.append('$(UDB_SYN): $(VM_SYN) $(LDC)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mPOST SYNTHESIS\\033[0m"\'')
+        o.append('\tpostsyn \\')
+        o.append('\t\t-w \\')
+        o.append('\t\t-a $(ARCH) \\')
+        o.append('\t\t-p $(word 1,$(subst -, ,$(DEV))) \\')
+        o.append('\t\t-t $(shell echo $(DEV)| grep -Po "(?<=-)(.+\d+)") \\')
+        o.append('\t\t$(addprefix -sp ,$(PERF)) \\')
+        o.append('\t\t$(addprefix -ldc ,$(LDC)) \\')
+        o.append('\t\t-o $@ \\')
+        o.append('\t\t-top \\')
+        o.append('\t\t$(notdir $<)')
+        o.append('')
+        o.append('# Map (convert generic logic to device specific resources)')
+        o.append('$(UDB_MAP): $(UDB_SYN) $(PDC)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mMAP\\033[0m"\'')
+        o.append('\tmap $^ -o $@ -mp $(basename $@).mrp -xref_sig -xref_sym')
+        o.append('')
+        o.append('# Place and Route')
+        if par_seeds:
+            # PAR_BEST=n restricts a build to the n cost tables that did best so far
+            o.append('PYTHON?=python3')
+            o.append('PAR_RADIANT_PY:='+make_fpga_py.rsplit('/',1)[0]+'/par_radiant.py')
+            o.append('PAR_BEST?=')
+        o.append('$(UDB_PAR): $(UDB_MAP) $(PDC)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mPLACE AND ROUTE\\033[0m"\'')
+        if par_seeds:
+            o.append('\t$(PYTHON) $(PAR_RADIANT_PY) $< $@ --seeds $(PAR_SEEDS) $(addprefix --jobs ,$(PAR_JOBS)) $(addprefix --best ,$(PAR_BEST)) --stopzero')
+        else:
+            o.append('\tpar -w -n 1 -t 1 -stopzero $< $@')
+        o.append('')
+        o.append('# Generate programming binary file')
+        o.append('$(BIN): $(UDB_PAR)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mGENERATE PROGRAMMING BINARY FILE\\033[0m"\'')
+        o.append('\tbitgen -w $< $@')
+        o.append('')
+        o.append('# Generate NVCM programming file')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mGENERATE NVCM FILE\\033[0m"\'')
+        o.append('$(NVCM): $(UDB_PAR)')
+        o.append('\tbitgen -d -w -nvcm -nvcmsecurity $< $@')
+        o.append('')
+        o.append('# Generate Verilog netlist and structured delay file for timing simulation')
+        o.append('$(NET) $(SDF): $(UDB_PAR)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mGENERATE TIMING NETLIST AND DELAY FILE\\033[0m"\'')
+        o.append('\tbackanno -w -neg -x -o $(NET) -d $(SDF) $(addprefix -sp ,$(PERF)) $<')
+        o.append('')
+        o.append('# Generate IBIS model')
+        o.append('$(IBIS): $(UDB_PAR)')
+        o.append('\t@bash -c \'echo -e "\\033[0;32mGENERATE IBIS MODEL\\033[0m"\'')
+        o.append('\tibisgen $< $(LATTICE_RADIANT)/cae_library/ibis/$(ARCH).ibs')
+        o.append('')
+        o += qor('.')
+        o.append('clean:')
+        o.append('\trm -f *.udb *.par *.pad *.drc *.bgn *.bin *.nvcm *.vo *.sdf *_map.* *_postsyn.* *_synth.*')
+        o.append('\trm -rf *.dir/ .vdbs/')
+        if par_seeds:
+            o.append('\trm -rf par_seeds')
+    return '\n'.join(o)+'\n'
 
-parser = argparse.ArgumentParser(
-    prog='make_radiant.py',
-    description='Create makefiles for building FPGA designs with Lattice Radiant',
-   )
-parser.add_argument(
-    '--flow',
-    choices=['cmd','ide'],
-    help='tool flow (command line or IDE)',
-    default='cmd'
-   )
-parser.add_argument(
-    '--proj',
-    help='project name',
-    default='fpga'
-   )
-parser.add_argument(
-    '--impl',
-    help='implementation name',
-    default='impl_1'
-   )
-parser.add_argument(
-    '--arch',
-    required=True,
-    help='FPGA architecture e.g. ice40up'
-   )
-parser.add_argument(
-    '--dev',
-    required=True,
-    help='FPGA device e.g. iCE40UP5K-SG48I'
-   )
-parser.add_argument(
-    '--perf',
-    help='FPGA performance grade e.g. High-Performance_1.2V',
-   )
-parser.add_argument(
-    '--freq',
-    help='FPGA frequency target for synthesis e.g. 25.0MHz'
-   )
-parser.add_argument(
-    '--use_io_reg',
-    choices=['Auto','True','False'],
-    default='Auto',
-    help='control I/O register packing'
-   )
-parser.add_argument(
-    '--vhdl',
-    choices=['1993','2008'],
-    default='2008',
-    help='enable VHDL-2008 support'
-   )
-parser.add_argument(
-    '--work',
-    help='work library (defaults to "work")',
-    default='work'
-   )
-parser.add_argument(
-    '--src',
-    required=True,
-    nargs='+',
-    action='append',
-    help='source(s) in compile order (append =LIB to specify library name)'
-   )
-parser.add_argument(
-    '--ldc',
-    nargs='+',
-    action='append',
-    help='logical (pre-synthesis) design constraints'
-   )
-parser.add_argument(
-    '--pdc',
-    nargs='+',
-    action='append',
-    help='physical (post-synthesis) design constraints'
-   )
-parser.add_argument(
-    '--dep',
-    nargs='+',
-    action='append',
-    help='other dependancies e.g. data files'
-   )
-parser.add_argument(
-    '--top',
-    required=True,
-    help='top level design unit'
-   )
-parser.add_argument(
-    '--gen',
-    nargs='+',
-    action='append',
-    help='generic=value[,generic=value ...]'
-   )
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='make_radiant.py',
+        description='Create makefiles for building FPGA designs with Lattice Radiant',
+       )
+    parser.add_argument(
+        '--flow',
+        choices=['cmd','ide'],
+        help='tool flow (command line or IDE)',
+        default='cmd'
+       )
+    parser.add_argument(
+        '--proj',
+        help='project name',
+        default='fpga'
+       )
+    parser.add_argument(
+        '--impl',
+        help='implementation name',
+        default='impl_1'
+       )
+    parser.add_argument(
+        '--session',
+        action='store_true',
+        help='IDE flow: run all steps in one persistent Tcl session so the project is opened once'
+       )
+    parser.add_argument(
+        '--arch',
+        required=True,
+        help='FPGA architecture e.g. ice40up'
+       )
+    parser.add_argument(
+        '--dev',
+        required=True,
+        help='FPGA device e.g. iCE40UP5K-SG48I'
+       )
+    parser.add_argument(
+        '--perf',
+        help='FPGA performance grade e.g. High-Performance_1.2V',
+       )
+    parser.add_argument(
+        '--freq',
+        help='FPGA frequency target for synthesis e.g. 25.0MHz'
+       )
+    parser.add_argument(
+        '--use_io_reg',
+        choices=['Auto','True','False'],
+        default='Auto',
+        help='control I/O register packing'
+       )
+    parser.add_argument(
+        '--par_seeds',
+        nargs='+',
+        action='append',
+        help='command line flow: run place and route with these starting cost tables concurrently, keep the best (e.g. 1..8)'
+       )
+    parser.add_argument(
+        '--par_jobs',
+        type=int,
+        help='number of place and route runs to perform concurrently (defaults to CPU count)'
+       )
+    parser.add_argument(
+        '--vhdl',
+        choices=['1993','2008'],
+        default='2008',
+        help='enable VHDL-2008 support'
+       )
+    parser.add_argument(
+        '--work',
+        help='work library (defaults to "work")',
+        default='work'
+       )
+    parser.add_argument(
+        '--src',
+        required=True,
+        nargs='+',
+        action='append',
+        help='source(s) in compile order, globs or directories (append =LIB to specify library name)'
+       )
+    parser.add_argument(
+        '--ldc',
+        nargs='+',
+        action='append',
+        help='logical (pre-synthesis) design constraints'
+       )
+    parser.add_argument(
+        '--pdc',
+        nargs='+',
+        action='append',
+        help='physical (post-synthesis) design constraints'
+       )
+    parser.add_argument(
+        '--dep',
+        nargs='+',
+        action='append',
+        help='other dependancies e.g. data files'
+       )
+    parser.add_argument(
+        '--top',
+        required=True,
+        help='top level design unit'
+       )
+    parser.add_argument(
+        '--gen',
+        nargs='+',
+        action='append',
+        help='generic=value[,generic=value ...]'
+       )
+    args = parser.parse_args(argv)
+    p = Project(
+        src=process_src(args.src,args.work)[0],
+        work=args.work,
+        vhdl=args.vhdl,
+        gen=[tuple(g.split('=',1)) for g in flatten(args.gen)],
+        dep=flatten(args.dep),
+        top=[args.top]
+        )
+    sys.stdout.write(emit(
+        p,
+        flow=args.flow,
+        proj=args.proj,
+        impl=args.impl,
+        arch=args.arch,
+        dev=args.dev,
+        perf=args.perf,
+        freq=args.freq,
+        use_io_reg=args.use_io_reg,
+        ldc=flatten(args.ldc),
+        pdc=flatten(args.pdc),
+        session=args.session,
+        par_seeds=flatten(args.par_seeds),
+        par_jobs=args.par_jobs
+        ))
 
-args=parser.parse_args()
-c,d=process_src(args.src,args.work)
-args.ldc=flatten(args.ldc)
-args.pdc=flatten(args.pdc)
-args.dep=flatten(args.dep)
-args.gen=flatten(args.gen)
-
-# output
-
-print('# makefile generated by make_radiant.py (see https://github.com/amb5l/make-fpga)')
-print('# for building an FPGA design using Lattice Radiant.')
-print('# FLOW:', 'IDE (project mode)' if args.flow == 'ide' else 'command line (batch mode)')
-print('')
-print('.PHONY: all bin nvcm net ibis clean force')
-print('all: bin')
-print('force:')
-print('')
-print('################################################################################')
-print('# design specific section')
-print('')
-if args.flow == 'ide':
-    print('# project')
-    print('PROJ:='+args.proj)
-    print('IMPL:='+args.impl)
-    print('')
-print('# FPGA')
-print('ARCH:='+args.arch)
-print('DEV:='+args.dev)
-print('PERF:='+(args.perf if args.perf else ''))
-print('FREQ:='+(args.freq if args.freq else ''))
-print('')
-print('# sources in compilation order (source=library)')
-print('VHDL:='+('2008' if args.vhdl else ''))
-print('LIB:='+' '.join(d))
-for l in d:
-    print('SRC.%s:=%s' % (l,var_vals(d[l])))
-print('SRC:='+' '.join(['$(SRC.%s)' % l for l in d]))
-print('')
-print('# logical (pre-synthesis) constraints')
-print('LDC:='+var_vals(args.ldc))
-print('')
-print('# physical (post-synthesis) constraints')
-print('PDC:='+var_vals(args.pdc))
-print('')
-print('# other synthesis prerequisites (e.g. data files)')
-print('DEP:='+var_vals(args.dep))
-print('')
-print('# top level design unit')
-print('TOP:='+args.top)
-print('')
-print('# top level VHDL generics / Verilog parameters')
-print('GEN:='+var_vals(args.gen))
-print('')
-print('# use I/O registers option (Auto, True or False)')
-print('USE_IO_REG:='+args.use_io_reg)
-print('')
-print('################################################################################')
-print('# flow specific section')
-print('')
-if args.flow == 'ide':
-    print('RDF:=$(PROJ).rdf')
-    print('VM_SYN:=$(IMPL)/$(PROJ)_$(IMPL).vm')
-    print('UDB_SYN:=$(IMPL)/$(PROJ)_$(IMPL)_syn.udb')
-    print('UDB_MAP:=$(IMPL)/$(PROJ)_$(IMPL)_map.udb')
-    print('UDB_PAR:=$(IMPL)/$(PROJ)_$(IMPL).udb')
-    print('BIN:=$(IMPL)/$(PROJ)_$(IMPL).bin')
-    print('NVCM:=$(IMPL)/$(PROJ)_$(IMPL).nvcm')
-    print('NET:=$(IMPL)/$(PROJ)_$(IMPL)_vo.vo')
-    print('SDF:=$(IMPL)/$(PROJ)_$(IMPL)_vo.sdf')
-    print('IBIS:=$(IMPL)/IBIS/$(PROJ)_$(IMPL).ibs')
-if args.flow == 'cmd':
-    print('VM_SYN:=$(TOP)_syn.vm')
-    print('UDB_SYN:=$(TOP)_syn.udb')
-    print('UDB_MAP:=$(TOP)_map.udb')
-    print('UDB_PAR:=$(TOP).udb')
-    print('BIN:=$(TOP).bin')
-    print('NVCM:=$(TOP).nvcm')
-    print('NET:=$(TOP)_vo.vo')
-    print('SDF:=$(TOP)_vo.sdf')
-    print('IBIS:=IBIS/$(TOP).ibs')
-print('')
-print('bin: $(BIN)')
-print('nvcm: $(NVCM)')
-print('net: $(NET) $(SDF)')
-print('ibis: $(IBIS)')
-print('')
-if args.flow == 'ide':
-    print('comma:=,')
-    print('space:=$(subst x, ,x)')
-    print('')
-    print('ifeq ($(OS),Windows_NT)')
-    print('TCLSH:=pnmainc')
-    print('else')
-    print('TCLSH:=radiantc')
-    print('endif')
-    print('')
-    print('TCLSHIM:=tclshim.tcl')
-    print('$(TCLSHIM): force')
-    print('\t@echo "puts [join \$$argv \\" \\"]; set e [catch {set r [eval [join \$$argv \\" \\"]]} m]; if \$$e {puts \$$m; exit \$$e} else {puts \$$r}" > $@')
-    print('')
-    print('TCLRUN:=$(TCLSH) $(TCLSHIM)')
-    print('')
-    print('# project recipe')
-    print('RECIPE:=$(PROJ) $(DEV) $(IMPL) $(VHDL) $(SRC) $(LDC) $(PDC) $(TOP) $(GEN)')
-    print('RECIPE_FILE:=$(PROJ).txt')
-    print('$(RECIPE_FILE): force')
-    print('\t@bash -c \'[ -f $@ ] && r=$$(< $@) || r=""; if [[ $$r != "$(RECIPE)" ]]; then echo "$(RECIPE)" > $@; rm -f $(RDF); fi\'')
-    print('')
-    print('# create project, set VHDL standard, add source, set generics, set top')
-    print('$(RDF): $(RECIPE_FILE) $(SRC) $(LDC) $(PDC) | $(TCLSHIM)')
-    print('\t@bash -c \'echo -e "\\033[0;32mCREATE PROJECT\\033[0m"\'')
-    print('\tbash -c "$(TCLRUN) \\')
-    print('\t\tprj_create \\')
-    print('\t\t\t-name $(PROJ) \\')
-    print('\t\t\t-dev $(DEV) \\')
-    print('\t\t\t$(addprefix -performance ,$(PERF)) \\')
-    print('\t\t\t-impl $(IMPL) \\')
-    print('\t\t\t-synthesis LSE \';\' \\')
-    print('\t\tprj_set_strategy_value -strategy Strategy1 PROP_LST_VHDL2008=$(if $(filter 2008,$(VHDL)),True,False) \';\' \\')
-    print('\t\t$(foreach l,$(LIB), $(foreach s,$(SRC.$l), \\')
-    print('\t\t prj_add_source -impl $(IMPL) -work $l -format $(if $(filter .vhd,$(suffix $s)),vhd,ver) $s \';\' \\')
-    print('\t\t)) \\')
-    print('\t\t$(foreach s,$(LDC) $(PDC), \\')
-    print('\t\t prj_add_source -impl $(IMPL) $s \';\' \\')
-    print('\t\t) \\')
-    print('\t\tprj_set_impl_opt -impl $(IMPL) HDL_PARAM $(subst $(space),$(comma),$(GEN)) \';\' \\')
-    print('\t\tprj_set_impl_opt -impl $(IMPL) top $(TOP) \';\' \\')
-    print('\t\tprj_set_strategy_value -strategy Strategy1 lse_use_io_reg=$(USE_IO_REG) \';\' \\')
-    print('\t\tprj_save \';\' \\')
-    print('\t\tprj_close"')
-    print('')
-    print('# Synthesis (compile structural Verilog netlist from HDL source)')
-    print('# and Post Synthesis (combine .vm and IP into Unified Database)')
-    print('$(VM_SYN) $(UDB_SYN): $(SRC) $(LDC) $(PDC) $(DEP) | $(RDF)')
-    print('\t@bash -c \'echo -e "\\033[0;32mSYNTHESIZE\\033[0m"\'')
-    print('\tbash -c "$(TCLRUN) \\')
-    print('\t\tprj_open $(RDF) \';\' \\')
-    print('\t\tprj_run Synthesis -impl $(IMPL) \';\' \\')
-    print('\t\tprj_save \';\' \\')
-    print('\t\tprj_close"')
-    print('')
-    print('# Map (convert generic logic to device specific resources)')
-    print('$(UDB_MAP): $(UDB_SYN)')
-    print('\t@bash -c \'echo -e "\\033[0;32mMAP\\033[0m"\'')
-    print('\tbash -c "$(TCLRUN) \\')
-    print('\t\tprj_open $(RDF) \';\' \\')
-    print('\t\tprj_run Map -impl $(IMPL) \';\' \\')
-    print('\t\tprj_save \';\' \\')
-    print('\t\tprj_close"')
-    print('')
-    print('# Place and Route')
-    print('$(UDB_PAR): $(UDB_MAP)')
-    print('\t@bash -c \'echo -e "\\033[0;32mPLACE AND ROUTE\\033[0m"\'')
-    print('\tbash -c "$(TCLRUN) \\')
-    print('\t\tprj_open $(RDF) \';\' \\')
-    print('\t\tprj_run PAR -impl $(IMPL) \';\' \\')
-    print('\t\tprj_save \';\' \\')
-    print('\t\tprj_close"')
-    print('')
-    print('# Generate programming binary file')
-    print('$(BIN): $(UDB_PAR)')
-    print('\t@bash -c \'echo -e "\\033[0;32mGENERATE PROGRAMMING BINARY FILE\\033[0m"\'')
-    print('\tbash -c "$(TCLRUN) \\')
-    print('\t\tprj_open $(RDF) \';\' \\')
-    print('\t\tprj_set_strategy_value -strategy Strategy1 bit_out_format=bin \';\' \\')
-    print('\t\tprj_run Export -impl $(IMPL) -task Bitgen\';\' \\')
-    print('\t\tprj_save \';\' \\')
-    print('\t\tprj_close"')
-    print('')
-    print('# Generate NVCM programming file')
-    print('$(NVCM): $(UDB_PAR)')
-    print('\t@bash -c \'echo -e "\\033[0;32mGENERATE NVCM FILE\\033[0m"\'')
-    print('\tbash -c "$(TCLRUN) \\')
-    print('\t\tprj_open $(RDF) \';\' \\')
-    print('\t\tprj_set_strategy_value -strategy Strategy1 bit_out_format=nvcm \';\' \\')
-    print('\t\tprj_run Export -impl $(IMPL) -task Bitgen\';\' \\')
-    print('\t\tprj_set_strategy_value -strategy Strategy1 bit_out_format=bin \';\' \\')
-    print('\t\tprj_save \';\' \\')
-    print('\t\tprj_close"')
-    print('')
-    print('# Generate Verilog netlist and structured delay file for timing simulation')
-    print('$(NET) $(SDF): $(UDB_PAR)')
-    print('\t@bash -c \'echo -e "\\033[0;32mGENERATE TIMING NETLIST AND DELAY FILE\\033[0m"\'')
-    print('\tbash -c "$(TCLRUN) \\')
-    print('\t\tprj_open $(RDF) \';\' \\')
-    print('\t\tprj_run Export -impl $(IMPL) -task TimingSimFileVlg\';\' \\')
-    print('\t\tprj_save \';\' \\')
-    print('\t\tprj_close"')
-    print('\t\t')
-    print('# Generate IBIS model')
-    print('$(IBIS): $(UDB_PAR)')
-    print('\t@bash -c \'echo -e "\\033[0;32mGENERATE IBIS MODEL\\033[0m"\'')
-    print('\tbash -c "$(TCLRUN) \\')
-    print('\t\tprj_open $(RDF) \';\' \\')
-    print('\t\tprj_run Export -impl $(IMPL) -task IBIS \';\' \\')
-    print('\t\tprj_save \';\' \\')
-    print('\t\tprj_close"')
-    print('')
-    print('clean:')
-    print('\trm -f *.tcl *.txt *.rdf *.sty hdr_log .recovery .setting.ini')
-    print('\trm -rf $(IMPL)')
-if args.flow == 'cmd':
-    print('')
-    print('ifndef LATTICE_RADIANT')
-    print('$(error LATTICE_RADIANT environment variable is not defined)')
-    print('endif')
-    print('')
-    print('ifndef FOUNDRY')
-    print('$(error Lattice FOUNDRY environment variable is not defined)')
-    print('endif')
-    print('')
-    print('# Synthesis (compile structural Verilog netlist from HDL source)')
-    print('$(VM_SYN): $(SRC) $(LDC) $(DEP)')
-    print('\t@bash -c \'echo -e "\\033[0;32mSYNTHESIS\\033[0m"\'')
-    print('\tsynthesis \\')
-    print('\t\t-output_hdl $@ \\')
-    print('\t\t-a $(ARCH) \\')
-    print('\t\t-p $(word 1,$(subst -, ,$(DEV))) \\')
-    print('\t\t-t $(shell echo $(DEV)| grep -Po "(?<=-)(.+\d+)") \\')
-    print('\t\t$(addprefix -sp ,$(PERF)) \\')
-    print('\t\t$(addprefix -frequency ,$(FREQ)) \\')
-    print('\t\t$(addprefix -vh,$(VHDL)) \\')
-    print('\t\t$(foreach l,$(LIB), $(foreach s,$(SRC.$l), \\')
-    print('\t\t -lib $l -$(if $(filter .vhd,$(suffix $s)),vhd,ver) $s \\')
-    print('\t\t)) \\')
-    print('\t\t$(addprefix -sdc ,$(LDC)) \\')
-    print('\t\t-use_io_reg $(if $(filter Auto,$(USE_IO_REG)),auto,$(if $(filter True,$(USE_IO_REG)),1,0)) \\')
-    print('\t\t-top $(TOP) \\')
-    print('\t\t$(subst =, ,$(addprefix -hdl_param ,$(GEN))) \\')
-    print('\t\t-logfile $(basename $@).log')
-    print('')
-    print('# Post Synthesis (combine .vm and IP into Unified Database)')
-    print('$(UDB_SYN): $(VM_SYN) $(LDC)')
-    print('\t@bash -c \'echo -e "\\033[0;32mPOST SYNTHESIS\\033[0m"\'')
-    print('\tpostsyn \\')
-    print('\t\t-w \\')
-    print('\t\t-a $(ARCH) \\')
-    print('\t\t-p $(word 1,$(subst -, ,$(DEV))) \\')
-    print('\t\t-t $(shell echo $(DEV)| grep -Po "(?<=-)(.+\d+)") \\')
-    print('\t\t$(addprefix -sp ,$(PERF)) \\')
-    print('\t\t$(addprefix -ldc ,$(LDC)) \\')
-    print('\t\t-o $@ \\')
-    print('\t\t-top \\')
-    print('\t\t$(notdir $<)')
-    print('')
-    print('# Map (convert generic logic to device specific resources)')
-    print('$(UDB_MAP): $(UDB_SYN) $(PDC)')
-    print('\t@bash -c \'echo -e "\\033[0;32mMAP\\033[0m"\'')
-    print('\tmap $^ -o $@ -mp $(basename $@).mrp -xref_sig -xref_sym')
-    print('')
-    print('# Place and Route')
-    print('$(UDB_PAR): $(UDB_MAP) $(PDC)')
-    print('\t@bash -c \'echo -e "\\033[0;32mPLACE AND ROUTE\\033[0m"\'')
-    print('\tpar -w -n 1 -t 1 -stopzero $< $@')
-    print('')
-    print('# Generate programming binary file')
-    print('$(BIN): $(UDB_PAR)')
-    print('\t@bash -c \'echo -e "\\033[0;32mGENERATE PROGRAMMING BINARY FILE\\033[0m"\'')
-    print('\tbitgen -w $< $@')
-    print('')
-    print('# Generate NVCM programming file')
-    print('\t@bash -c \'echo -e "\\033[0;32mGENERATE NVCM FILE\\033[0m"\'')
-    print('$(NVCM): $(UDB_PAR)')
-    print('\tbitgen -d -w -nvcm -nvcmsecurity $< $@')
-    print('')
-    print('# Generate Verilog netlist and structured delay file for timing simulation')
-    print('$(NET) $(SDF): $(UDB_PAR)')
-    print('\t@bash -c \'echo -e "\\033[0;32mGENERATE TIMING NETLIST AND DELAY FILE\\033[0m"\'')
-    print('\tbackanno -w -neg -x -o $(NET) -d $(SDF) $(addprefix -sp ,$(PERF)) $<')
-    print('')
-    print('# Generate IBIS model')
-    print('$(IBIS): $(UDB_PAR)')
-    print('\t@bash -c \'echo -e "\\033[0;32mGENERATE IBIS MODEL\\033[0m"\'')
-    print('\tibisgen $< $(LATTICE_RADIANT)/cae_library/ibis/$(ARCH).ibs')
-    print('')
-    print('clean:')
-    print('\trm -f *.udb *.par *.pad *.drc *.bgn *.bin *.nvcm *.vo *.sdf *_map.* *_postsyn.* *_synth.*')
-    print('\trm -rf *.dir/ .vdbs/')
+if __name__ == '__main__':
+    main()
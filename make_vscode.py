@@ -8,108 +8,165 @@
 import sys,os,argparse
 from make_fpga import *
 
-# parse arguments
+# path to this file, for use in generated recipes
+make_vscode_py = os.path.abspath(__file__).replace('\\','/')
 
-parser = argparse.ArgumentParser(
-    prog='make_fpga.py',
-    description='Create makefiles for editing FPGA designs with Visual Studio Code and V4P',
-   )
-parser.add_argument(
-    '--work',
-    help='work library (defaults to "work")',
-    default='work'
-   )
-parser.add_argument(
-    '--src',
-    required=True,
-    nargs='+',
-    action='append',
-    help='source(s) (append =LIB to specify library name)'
-   )
-parser.add_argument(
-    '--top',
-    action='append',
-    help='top level design unit(s)'
-   )
-parser.add_argument(
-    '--aux',
-    nargs='+',
-    action='append',
-    help='auxiliary text file(s)'
-   )
+# links made by the last sync (in the workspace), so that stale ones are removed
+links_file = '.make_vscode_links.json'
 
-args=parser.parse_args()
-_,d=process_src(args.src,args.work)
-args.aux=flatten(args.aux)
+# link dst to src: hard link, or symbolic link on Windows (as mklink makes)
+def link(src,dst):
+    if os.name == 'nt':
+        os.symlink(os.path.abspath(src),dst)
+    else:
+        os.link(src,dst)
 
-# output
+def linked(src,dst):
+    try:
+        if os.name == 'nt':
+            return os.readlink(dst) == os.path.abspath(src)
+        return os.path.samefile(src,dst)
+    except OSError:
+        return False
 
-print('# makefile generated by make_vscode.py (see https://github.com/amb5l/make-fpga)')
-LIB=list(d)
-print('# for editing FPGA source code with Visual Studio Code and V4P.')
-print('')
-print('################################################################################')
-print('')
-print('# libraries')
-print('LIB:='+' '.join(d))
-print('')
-print('# path(s) to source(s) for each library')
-for l in d:
-    print('SRC.%s:=%s' % (l,var_vals(d[l])))
-print('')
-print('# top level design unit(s)')
-print('TOP:='+' '.join(args.top))
-print('')
-print('# auxiliary text file(s)')
-print('AUX:=%s' % var_vals(args.aux))
-print('')
-print('################################################################################')
-print('')
-print('# useful definitions')
-print('space:=$(subst x, ,x)')
-print('comma:=,')
-print('')
-print('# generate rules and recipes to create symbolic links to sources')
-print('ifeq ($(OS),Windows_NT)')
-print('define rr_srclink')
-print('$1/$(notdir $2): $2')
-print('\tbash -c "mkdir -p $$(dir $$@)"')
-print('\tbash -c "cmd.exe //C \\\"mklink $$(shell cygpath -w $$@) $$(shell cygpath -w -a $$<)\\\""')
-print('endef')
-print('else')
-print('define rr_srclink')
-print('$1/$(notdir $2): $2')
-print('\tmkdir -p $$(dir $$@)')
-print('\tln $$< $$@')
-print('endef')
-print('endif')
-print('$(foreach l,$(LIB),$(foreach s,$(SRC.$l),$(eval $(call rr_srclink,$l,$s))))')
-print('')
-print('# library directory(s) containing symbolic link(s) to source(s)')
-print('$(foreach l,$(LIB),$(eval $l: $(addprefix $l/,$(notdir $(SRC.$l)))))')
-print('')
-print('# generate rules and recipes to create symbolic links to auxiliary text files')
-print('ifeq ($(OS),Windows_NT)')
-print('define rr_auxlink')
-print('$(notdir $1): $1')
-print('\tbash -c "cmd.exe //C \\\"mklink $$(shell cygpath -w $$@) $$(shell cygpath -w -a $$<)\\\""')
-print('endef')
-print('else')
-print('define rr_srclink')
-print('$(notdir $1): $1')
-print('\tln $$< $$@')
-print('endef')
-print('endif')
-print('$(foreach a,$(AUX),$(eval $(call rr_auxlink,$a)))')
-print('')
-print('# editing session')
-print('.PHONY: vscode')
-print('vscode: config.v4p $(LIB) $(notdir $(AUX))')
-print('\tcode .')
-print('')
-print('# V4P configuration file')
-print('config.v4p: $(LIB)')
-print('\techo "[libraries]" > config.v4p')
-print('\t$(foreach l,$(LIB),$(foreach s,$(SRC.$l),echo "$l/$(notdir $s)=$l" >> config.v4p;))')
-print('\techo "[settings]" >> config.v4p')
-print('\techo "V4p.Settings.Basics.TopLevelEntities=$(subst $(space),$(comma),$(TOP))" >> config.v4p')
+# V4P configuration file for project p
+def v4p(p):
+    o = []
+    o.append('[libraries]')
+    for l,s in p.src:
+        o.append('%s/%s=%s' % (l,os.path.basename(s),l))
+    o.append('[settings]')
+    o.append('V4p.Settings.Basics.TopLevelEntities='+','.join(p.top))
+    return '\n'.join(o)+'\n'
+
+# sync workspace directory d for project p in one pass: links to sources (in
+# library directories) and auxiliary text files, and config.v4p; only missing
+# or stale links are made, links no longer wanted are removed, and config.v4p
+# is only written if it changes
+def sync(p,d='.'):
+    want = {l+'/'+os.path.basename(s): s for l,s in p.src}
+    want.update({os.path.basename(a): a for a in p.aux})
+    # a file already in place is not a link (e.g. auxiliary file in the workspace)
+    want = {x: s for x,s in want.items() if os.path.abspath(os.path.join(d,x)) != os.path.abspath(s)}
+    try:
+        with open(os.path.join(d,links_file),'r') as f:
+            old = json.load(f)
+    except (OSError,ValueError):
+        old = []
+    removed = 0
+    for x in old:
+        if x not in want and os.path.lexists(os.path.join(d,x)):
+            os.remove(os.path.join(d,x))
+            removed += 1
+            if '/' in x:
+                try:
+                    os.rmdir(os.path.join(d,x.rsplit('/',1)[0]))
+                except OSError:
+                    pass
+    added = 0
+    for x,s in want.items():
+        x = os.path.join(d,x)
+        if not linked(s,x):
+            if os.path.lexists(x):
+                os.remove(x)
+            os.makedirs(os.path.dirname(x),exist_ok=True)
+            link(s,x)
+            added += 1
+    write_if_changed(os.path.join(d,links_file),json.dumps(sorted(want),indent=1)+'\n')
+    changed = write_if_changed(os.path.join(d,'config.v4p'),v4p(p))
+    return added,removed,changed
+
+# makefile for project p
+def emit(p):
+    d = p.libs()
+    o = []
+    o.append('# makefile generated by make_vscode.py (see https://github.com/amb5l/make-fpga)')
+    LIB=list(d)
+    o.append('# for editing FPGA source code with Visual Studio Code and V4P.')
+    o.append('')
+    o.append('################################################################################')
+    o.append('')
+    o.append('# libraries')
+    o.append('LIB:='+' '.join(d))
+    o.append('')
+    o.append('# path(s) to source(s) for each library')
+    for l in d:
+        o.append('SRC.%s:=%s' % (l,var_vals(d[l])))
+    o.append('')
+    o.append('# top level design unit(s)')
+    o.append('TOP:='+' '.join(p.top))
+    o.append('')
+    o.append('# auxiliary text file(s)')
+    o.append('AUX:=%s' % var_vals(p.aux))
+    o.append('')
+    o.append('################################################################################')
+    o.append('')
+    o.append('# workspace: links to sources and auxiliary text files, and config.v4p,')
+    o.append('# synced in one pass by make_vscode.py (only changes are made)')
+    o.append('PYTHON?=python3')
+    o.append('MAKE_VSCODE_PY:='+make_vscode_py)
+    o.append('.PHONY: sync')
+    o.append('sync:')
+    o.append('\t$(file >.make_vscode.args,--sync . --src $(foreach l,$(LIB),$(addsuffix =$l,$(SRC.$l))) $(addprefix --top ,$(TOP)) $(if $(AUX),--aux $(AUX)))')
+    o.append('\t$(PYTHON) $(MAKE_VSCODE_PY) @.make_vscode.args')
+    o.append('')
+    o.append('# editing session')
+    o.append('.PHONY: vscode')
+    o.append('vscode: sync')
+    o.append('\tcode .')
+    return '\n'.join(o)+'\n'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='make_fpga.py',
+        description='Create makefiles for editing FPGA designs with Visual Studio Code and V4P',
+        epilog='Arguments may be read from a file given as @file.',
+        fromfile_prefix_chars='@'
+       )
+    parser.convert_arg_line_to_args = lambda s: s.split()
+    parser.add_argument(
+        '--sync',
+        nargs='?',
+        const='.',
+        metavar='DIR',
+        help='sync the workspace in DIR (defaults to the current directory) rather than create a makefile'
+       )
+    parser.add_argument(
+        '--work',
+        help='work library (defaults to "work")',
+        default='work'
+       )
+    parser.add_argument(
+        '--src',
+        required=True,
+        nargs='+',
+        action='append',
+        help='source(s), globs or directories (append =LIB to specify library name)'
+       )
+    parser.add_argument(
+        '--top',
+        action='append',
+        help='top level design unit(s)'
+       )
+    parser.add_argument(
+        '--aux',
+        nargs='+',
+        action='append',
+        help='auxiliary text file(s)'
+       )
+    args = parser.parse_args(argv)
+    p = Project(
+        src=process_src(args.src,args.work,order=False)[0],
+        work=args.work,
+        top=args.top or [],
+        aux=flatten(args.aux)
+        )
+    if args.sync:
+        added,removed,changed = sync(p,args.sync)
+        print('%s: %d link(s) added, %d removed, config.v4p %s' % (
+            args.sync,added,removed,'updated' if changed else 'unchanged'))
+    else:
+        sys.stdout.write(emit(p))
+
+if __name__ == '__main__':
+    main()
@@ -6,177 +6,242 @@
 
 import sys,os,argparse
 from make_fpga import *
+from step_fpga import step_mk
+from monitor_fpga import sim_limits,monitor_mk,monitor_opts
 
-# parse arguments
+# Tcl to dump waveforms for run r of project p (or '')
+def wave_tcl(p,r):
+    w = sim_wave('vsim',r.wave or p.wave)
+    if not w:
+        return ''
+    inc = [x for c,x in w[1] if c == '+'] or ['/*']
+    exc = [x for c,x in w[1] if c == '-']
+    if w[0] == 'wlf':
+        return ' '.join(['log -r %s;' % x for x in inc]+['nolog -r %s;' % x for x in exc])
+    if exc:
+        error_exit('vsim cannot exclude scopes from VCD dumps (use wlf): run %s' % r.name)
+    return ' '.join(['vcd file $(WAVE_DIR)/%s.vcd;' % r.name]+['vcd add -r %s;' % x for x in inc])
 
-parser = argparse.ArgumentParser(
-    prog='make_vsim.py',
-    description='Create makefiles for simulating FPGA designs with ModelSim/Questa/etc',
-    epilog=help_run,
-    formatter_class=argparse.RawDescriptionHelpFormatter
-   )
-parser.add_argument(
-    '--path',
-    help='path to tool binaries'
-   )
-parser.add_argument(
-    '--lib',
-    nargs='+',
-    action='append',
-    help='precompiled libraries'
-   )
-parser.add_argument(
-    '--vhdl',
-    choices=['1987','1993','2002','2008'],
-    help='VHDL LRM version (defaults to 2008)',
-    default='2008'
-   )
-parser.add_argument(
-    '--work',
-    help='work library (defaults to "work")',
-    default='work'
-   )
-parser.add_argument(
-    '--src',
-    required=True,
-    nargs='+',
-    action='append',
-    help='source(s) in compile order (append =LIB to specify library name)'
-   )
-parser.add_argument(
-    '--dep',
-    nargs='+',
-    action='append',
-    help='other dependancies e.g. data files'
-   )
-parser.add_argument(
-    '--run',
-    required=True,
-    nargs='+',
-    action='append',
-    help='simulation run specification(s) (see below)'
-   )
-parser.add_argument(
-    '--gen',
-    nargs='+',
-    action='append',
-    help='generics assignment(s) (applied to all runs)'
-   )
-parser.add_argument(
-    '--sdf',
-    nargs='+',
-    action='append',
-    help='SDF mapping(s) (applied to all runs)'
-   )
+# makefile for project p
+def emit(p):
+    d = p.libs()
+    wave = {r.name: wave_tcl(p,r) for r in p.runs}
+    cached = cached_libs(p)
+    deps = p.deps()
+    com = [l+'/'+os.path.basename(s)+'.com' for l,s in p.src]
+    o = []
+    o.append('# makefile generated by make_vsim.py (see https://github.com/amb5l/make-fpga)')
 
-args=parser.parse_args()
-if args.path:
-    args.path += '/' if args.path[-1] != '/' else ''
-else:
-    args.path = ''
-c,d=process_src(args.src,args.work)
-args.dep=flatten(args.dep)
-runs=process_run(flatten(args.run))
-args.lib=flatten(args.lib)
-args.gen=process_gen(flatten(args.gen))
-args.sdf=process_sdf(flatten(args.sdf))
+    o.append('# for simulation using ModelSim/Questa/etc')
+    o.append('')
+    o.append('# path to simulator binaries')
+    o.append('VMAP:=%svmap' % p.path)
+    o.append('VLIB:=%svlib' % p.path)
+    o.append('VCOM:=%svcom' % p.path)
+    o.append('VLOG:=%svlog' % p.path)
+    o.append('VSIM:=%svsim' % p.path)
+    o.append('')
+    o.append('################################################################################')
+    o.append('# simulation specific definitions')
+    o.append('')
+    o.append('# libraries to compile source into')
+    o.append('LIB:='+' '.join(d))
+    o.append('')
+    o.append('# sources in compilation order (source=library)')
+    o.append('SRC:='+var_vals([s+'='+l for l,s in p.src]))
+    o.append('')
+    o.append('# other simulation prerequisites (e.g. data files)')
+    o.append('DEP:='+var_vals(p.dep))
+    o.append('')
+    o.append('# simulation runs (top plus any run specific generic/SDF assignments)')
+    o.append('RUNS:='+' '.join([r[0] for r in p.runs]))
+    for r in p.runs:
+        s = 'RUN.'+r[0]+':='+r[1]
+        if r[2]:
+            s += ' '+' '.join(['-g'+g+'='+v for g,v in r[2]])
+        if r[3]:        
+            s += ' '+' '.join(['-sdf'+t+' '+q+'='+f for t,q,f in r[3]])
+        o.append(s)
+    if any(wave.values()):
+        o.append('')
+        o.append('# waveform dumps: directory (one file per run), and disk budget above which')
+        o.append('# the oldest are deleted after each run (e.g. 20G, empty for no limit)')
+        o.append('WAVE_DIR?=waves')
+        o.append('WAVE_BUDGET?=')
+    o.append('')
+    o.append('# generic assignments (applied to all simulation runs)')
+    o.append('GEN:='+var_vals(list(map(lambda e: '-g'+e[0]+'='+e[1],p.gen))))
+    o.append('')
+    o.append('# SDF mappings (applied to all simulation runs)')
+    o.append('SDF:='+var_vals(['-sdf'+t+' '+q+'='+f for t,q,f in p.sdf]))
+    o.append('')
+    o.append('# compilation and simulation options')
+    o.append('VCOM_OPTS:=-'+p.vhdl+' -explicit -stats=none')
+    o.append('VLOG_OPTS:=-stats=none')
+    o.append('VSIM_TCL:=set NumericStdNoWarnings 1; onfinish exit; run -all; exit')
+    o.append('VSIM_OPTS=-t ps -c -onfinish stop -do "$(VSIM_TCL)"')
+    o.append('')
+    o.append('# precompiled libraries')
+    o.append('VSIM_LIB:='+var_vals(p.lib))
+    o.append('')
+    o.append('################################################################################')
+    o.append('')
+    o.append('# default goal')
+    o.append('all: vsim')
+    o.append('')
+    o.append('# no built-in implicit rules (speeds up make start up for large designs)')
+    o.append('MAKEFLAGS+=--no-builtin-rules')
+    o.append('.SUFFIXES:')
+    o.append('')
+    o.append('# create modelsim.ini')
+    o.append('modelsim.ini:')
+    o.append('\t$(VMAP) -c')
+    o.append('')
+    o.append('# rule(s) and recipe(s) to create library directory(s)')
+    for l in d:
+        o.append('%s: | modelsim.ini' % l)
+        o.append('\t$(VLIB) $@')
+        o.append('\t$(VMAP) -modelsimini modelsim.ini $@ $@')
+    o.append('')
+    o.append('# content hash compile stamps skip recompilation of unchanged sources')
+    o.append('PYTHON?=python3')
+    o.append('MAKE_FPGA_PY:='+make_fpga_py)
+    o.append('')
+    o += step_mk
+    o.append('')
+    o += monitor_mk('vsim')
+    o.append('')
+    if cached:
+        o += libcache_mk(p,'vsim',cached,vmap=True)
+        o.append('')
+    o.append('# compiled source stamps')
+    o.append('COM:='+var_vals(com))
+    o.append('')
+    o.append('# rule(s) and recipe(s) to compile source(s)')
+    o.append('# (dependencies from source scan allow parallel compilation)')
+    for k,((l,s),(q,i)) in enumerate(zip(p.src,deps)):
+        o.append('%s: %s $(DEP)%s | %s' % (com[k],' '.join([s]+[com[j] for j in q]+i),' $(LIBCACHE_DIRS)' if cached else '',l))
+        o.append('\t$(STEP) $(PYTHON) $(MAKE_FPGA_PY) stamp $@ $^ -- %s -modelsimini modelsim.ini -work %s $<' % (
+            '$(VCOM) $(VCOM_OPTS)' if s.lower().endswith(ext_vhdl) else '$(VLOG) $(VLOG_OPTS)',l))
+    o.append('')
+    o.append('# rule(s) and recipe(s) to run simulation(s)')
+    for r in p.runs:
+        l = sim_limits('vsim',r.limits)
+        m = monitor_opts(r)
+        mon = '$(call MONITOR,%s)' % m if m else '$(MONITOR)'
+        if wave[r.name] or 'stop' in l:
+            # run specific Tcl (VSIM_OPTS expands it): waveforms, simulated time limit
+            tcl = '$(VSIM_TCL)' if 'stop' not in l else '$(subst run -all,run %s,$(VSIM_TCL))' % l['stop']
+            o.append('%s: VSIM_TCL:=%s' % (r[0],' '.join(filter(None,[wave[r.name],tcl]))))
+        if wave[r.name].startswith('log'):
+            o.append('%s: VSIM_WLF:=-wlf $(WAVE_DIR)/%s.wlf' % (r[0],r[0]))
+        o.append('%s: $(COM)' % r[0])
+        o.append('\t@bash -c \'echo -e "\\033[0;32mRUN: %s (%s)  start at $$(date +%%T.%%2N)\\033[0m"\'' % (r[0],r[1]))
+        if wave[r.name]:
+            o.append('\t@mkdir -p $(WAVE_DIR)')
+            o.append('\t$(STEP) %s $(VSIM) -batch -modelsimini modelsim.ini $(addprefix -L ,$(VSIM_LIB)) $(VSIM_WLF) $(VSIM_OPTS) $(GEN) $(SDF) $(RUN.%s)' % (mon,r[0]))
+            o.append('\t$(if $(WAVE_BUDGET),@$(PYTHON) $(MAKE_FPGA_PY) prune --budget $(WAVE_BUDGET) $(WAVE_DIR))')
+        else:
+            o.append('\t$(STEP) %s $(VSIM) -batch -modelsimini modelsim.ini $(addprefix -L ,$(VSIM_LIB)) $(VSIM_OPTS) $(GEN) $(SDF) $(RUN.%s)' % (mon,r[0]))
+        o.append('\t@bash -c \'echo -e "\\033[0;31mRUN: %s (%s)    end at $$(date +%%T.%%2N)\\033[0m"\'' % (r[0],r[1]))
+        o.append('vsim:: %s' % r[0])
+    return '\n'.join(o)+'\n'
 
-# output
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='make_vsim.py',
+        description='Create makefiles for simulating FPGA designs with ModelSim/Questa/etc',
+        epilog=help_run,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    parser.add_argument(
+        '--path',
+        help='path to tool binaries'
+       )
+    parser.add_argument(
+        '--lib',
+        nargs='+',
+        action='append',
+        help='precompiled libraries'
+       )
+    parser.add_argument(
+        '--lib_defs',
+        help='shared library cache definitions: precompiled libraries defined here are taken from the cache (see libcache_fpga.py)'
+       )
+    parser.add_argument(
+        '--vhdl',
+        choices=['1987','1993','2002','2008'],
+        help='VHDL LRM version (defaults to 2008)',
+        default='2008'
+       )
+    parser.add_argument(
+        '--work',
+        help='work library (defaults to "work")',
+        default='work'
+       )
+    parser.add_argument(
+        '--src',
+        required=True,
+        nargs='+',
+        action='append',
+        help='source(s) in compile order, globs or directories (append =LIB to specify library name)'
+       )
+    parser.add_argument(
+        '--dep',
+        nargs='+',
+        action='append',
+        help='other dependancies e.g. data files'
+       )
+    parser.add_argument(
+        '--run',
+        required=True,
+        nargs='+',
+        action='append',
+        help='simulation run specification(s) (see below)'
+       )
+    parser.add_argument(
+        '--gen',
+        nargs='+',
+        action='append',
+        help='generics assignment(s) (applied to all runs)'
+       )
+    parser.add_argument(
+        '--no_scan',
+        action='store_true',
+        help='do not scan sources for dependencies (compile strictly in order)'
+       )
+    parser.add_argument(
+        '--scan_cache',
+        help='source scan cache file (defaults to %s)' % scan_cache_file,
+        default=scan_cache_file
+       )
+    parser.add_argument(
+        '--wave',
+        help='waveform dump for runs without their own (see below, defaults to off)'
+       )
+    parser.add_argument(
+        '--sdf',
+        nargs='+',
+        action='append',
+        help='SDF mapping(s) (applied to all runs)'
+       )
+    args = parser.parse_args(argv)
+    p = make_project(
+        flatten(args.src),
+        work=args.work,
+        run=flatten(args.run),
+        gen=flatten(args.gen),
+        sdf=flatten(args.sdf),
+        path=args.path,
+        vhdl=args.vhdl,
+        lib=flatten(args.lib),
+        lib_defs=args.lib_defs or '',
+        dep=flatten(args.dep),
+        wave=args.wave,
+        scan=not args.no_scan,
+        scan_cache=args.scan_cache
+        )
+    sys.stdout.write(emit(p))
 
-print('# makefile generated by make_vsim.py (see https://github.com/amb5l/make-fpga)')
-
-print('# for simulation using ModelSim/Questa/etc')
-print('')
-print('# path to simulator binaries')
-print('VMAP:=%svmap' % args.path)
-print('VLIB:=%svlib' % args.path)
-print('VCOM:=%svcom' % args.path)
-print('VLOG:=%svlog' % args.path)
-print('VSIM:=%svsim' % args.path)
-print('')
-print('################################################################################')
-print('# simulation specific definitions')
-print('')
-print('# libraries to compile source into')
-print('LIB:='+' '.join(d))
-print('')
-print('# sources in compilation order (source=library)')
-print('SRC:='+var_vals([s+'='+l for l,s in c]))
-print('')
-print('# other simulation prerequisites (e.g. data files)')
-print('DEP:='+var_vals(args.dep))
-print('')
-print('# simulation runs (top plus any run specific generic/SDF assignments)')
-print('RUNS:='+' '.join([r[0] for r in runs]))
-for r in runs:
-    s = 'RUN.'+r[0]+':='+r[1]
-    if r[2]:
-        s += ' '+' '.join(['-g'+g+'='+v for g,v in r[2]])
-    if r[3]:        
-        s += ' '+' '.join(['-sdf'+t+' '+p+'='+f for t,p,f in r[3]])
-    print(s)
-print('')
-print('# generic assignments (applied to all simulation runs)')
-print('GEN:='+var_vals(list(map(lambda e: '-g'+e[0]+'='+e[1],args.gen))))
-print('')
-print('# SDF mappings (applied to all simulation runs)')
-print('SDF:='+var_vals(list(map(lambda e: '-sdf'+e,args.sdf))))
-print('')
-print('# compilation and simulation options')
-print('VCOM_OPTS:=-'+args.vhdl+' -explicit -stats=none')
-print('VLOG_OPTS:=-stats=none')
-print('VSIM_TCL:=set NumericStdNoWarnings 1; onfinish exit; run -all; exit')
-print('VSIM_OPTS:=-t ps -c -onfinish stop -do "$(VSIM_TCL)"')
-print('')
-print('# precompiled libraries')
-print('VSIM_LIB:='+var_vals(args.lib))
-print('')
-print('################################################################################')
-print('')
-print('# default goal')
-print('all: vsim')
-print('')
-print('# useful definitions')
-print('comma:=,')
-print('rest=$(wordlist 2,$(words $1),$1)')
-print('chop=$(wordlist 1,$(words $(call rest,$1)),$1)')
-print('src_dep=$1,$2')
-print('pairmap=$(and $(strip $2),$(strip $3),$(call $1,$(firstword $2),$(firstword $3)) $(call pairmap,$1,$(call rest,$2),$(call rest,$3)))')
-print('')
-print('# create modelsim.ini')
-print('modelsim.ini:')
-print('\t$(VMAP) -c')
-print('')
-print('# generate rule(s) and recipe(s) to create library directory(s)')
-print('define rr_libdir')
-print('$1: | modelsim.ini')
-print('\t$(VLIB) $$@')
-print('\t$(VMAP) -modelsimini modelsim.ini $$@ $$@')
-print('endef')
-print('$(foreach l,$(LIB),$(eval $(call rr_libdir,$l)))')
-print('')
-print('# compilation dependencies enforce compilation order')
-print('dep:=$(firstword $(SRC)), $(if $(word 2,$(SRC)),$(call pairmap,src_dep,$(call rest,$(SRC)),$(call chop,$(SRC))),)')
-print('')
-print('# generate rule(s) and recipe(s) to compile source(s)')
-print('define rr_compile')
-print('$1/$(notdir $2).com: $2 $3 $(DEP) | $1')
-print('\t$(if $(filter .vhd,$(suffix $2)),$(VCOM) $(VCOM_OPTS),$(VLOG) $(VLOG_OPTS)) \\')
-print('\t\t-modelsimini modelsim.ini -work $1 $$<')
-print('\ttouch $$@')
-print('endef')
-print('$(foreach d,$(dep),$(eval $(call rr_compile, \\')
-print('$(word 2,$(subst =, ,$(word 1,$(subst $(comma), ,$d)))), \\')
-print('$(word 1,$(subst =, ,$(word 1,$(subst $(comma), ,$d)))), \\')
-print('$(addsuffix .com,$(addprefix $(word 2,$(subst =, ,$(word 2,$(subst $(comma), ,$d))))/,$(notdir $(word 1,$(subst =, ,$(word 2,$(subst $(comma), ,$d))))))) \\')
-print(')))')
-print('')
-print('# generate rule(s) and recipe(s) to run simulation(s)')
-print('define rr_run')
-print('$1: $(word 2,$(subst =, ,$(lastword $(SRC))))/$(notdir $(word 1,$(subst =, ,$(lastword $(SRC))))).com')
-print('\t@bash -c \'echo -e "\\033[0;32mRUN: $1 ($(word 1,$(RUN.$1)))  start at $$$$(date +%T.%2N)\\033[0m"\'')
-print('\t$(VSIM) -batch -modelsimini modelsim.ini $(addprefix -L ,$(VSIM_LIB)) $(VSIM_OPTS) $(GEN) $(SDF) $(RUN.$1)')
-print('\t@bash -c \'echo -e "\\033[0;31mRUN: $1 ($(word 1,$(RUN.$1)))    end at $$$$(date +%T.%2N)\\033[0m"\'')
-print('vsim:: $1')
-print('endef')
-print('$(foreach r,$(RUNS),$(eval $(call rr_run,$r)))')
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+################################################################################
+# monitor_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# Simulation run monitor and limits: "make_fpga.py monitor" runs a simulation,
+# classifying its messages as they are output, aborting it early on errors or
+# when it exceeds its memory or time limits, and records the resources each
+# run used so that runs can be packed into a memory budget.
+################################################################################
+
+import sys,os,re,json,time,shlex,signal,subprocess,contextlib,threading
+from make_fpga import *
+
+# run limits l checked for simulator sim
+def sim_limits(sim,l):
+    if l and 'heap' in l and sim != 'nvc':
+        error_exit('%s has no heap limit (use rss)' % sim)
+    return l or {}
+
+# nvc heap size option value for n bytes
+def heap_size(n):
+    return '%dm' % (n>>20) if n % (1<<20) == 0 else '%dk' % -(-n>>10)
+
+# simulator messages: regex whose first matching group is the severity
+monitor_sims = {
+    'nvc':  re.compile(r'\*\* (Note|Warning|Error|Failure|Fatal)\b'),
+    'vsim': re.compile(r'^# \*\* (Note|Warning|Error|Failure|Fatal)\b'),
+    'ghdl': re.compile(r'\((?:assertion|report) (note|warning|error|failure)\)|^ghdl\S*:(error)')
+    }
+severities = ('note','warning','error','failure','fatal')
+re_ansi = re.compile(r'\x1b\[[0-9;]*m')
+
+# run history: peak RSS and wall time of the latest monitored run of each name
+# (for an aborted run, what it reached), used to size runs when packing them
+# into a memory budget
+run_history_file = '.make_fpga_runs.json'
+
+def read_history(path):
+    try:
+        with open(path,'r') as f:
+            return json.load(f)
+    except (OSError,ValueError):
+        return {}
+
+def record_history(path,name,rss,wall):
+    with locked(path+'.lock'):
+        h = read_history(path)
+        h[name] = {'rss': rss,'wall': round(wall,3)}
+        write_if_changed(path,json.dumps(h,indent=1,sort_keys=True)+'\n')
+
+# memory (bytes) to allow for a run: its learned peak RSS plus a margin, capped
+# by its rss limit (which is used if it has not been measured), 0 if neither
+def run_need(name,cap,history,margin=1.25):
+    if name in history and history[name]['rss']:
+        n = int(history[name]['rss']*margin)
+        return min(n,cap) if cap else n
+    return cap or 0
+
+# resident memory (bytes) of process group g, None without /proc (not Linux)
+def group_rss(g):
+    if not os.path.isdir('/proc/self'):
+        return None
+    n = 0
+    for d in os.listdir('/proc'):
+        if d.isdigit():
+            try:
+                with open('/proc/%s/stat' % d,'rb') as f:
+                    x = f.read().rsplit(b')',1)[1].split()
+            except OSError:
+                continue
+            if int(x[2]) == g:
+                n += int(x[21])
+    return n*os.sysconf('SC_PAGE_SIZE')
+
+# memory reservations of runs in progress (see reserve_mem): one file per run,
+# named for the bytes it reserved and locked until it ends
+mem_dir = '.make_fpga_mem'
+
+# wait until need bytes fit in budget alongside the reservations of runs in
+# progress (a run always starts if there are none), then hold the reservation
+# for the duration of a with block
+@contextlib.contextmanager
+def reserve_mem(name,need,budget):
+    os.makedirs(mem_dir,exist_ok=True)
+    path = os.path.join(mem_dir,'%s.%d.%d' % (name.replace('/','_'),os.getpid(),need))
+    hold = contextlib.ExitStack()
+    waiting = False
+    while True:
+        with locked(os.path.join(mem_dir,'.lock')):
+            used = 0
+            for e in os.listdir(mem_dir):
+                if e.startswith('.'):
+                    continue
+                with locked(os.path.join(mem_dir,e),wait=False) as stale:
+                    pass
+                if stale: # holder has gone
+                    os.remove(os.path.join(mem_dir,e))
+                else:
+                    used += int(e.rsplit('.',1)[1])
+            if not used or used+need <= budget:
+                hold.enter_context(locked(path))
+                break
+        if not waiting:
+            print('monitor: %s: waiting for memory (%dM reserved, %dM needed, %dM budget)' % (
+                name,used>>20,need>>20,budget>>20),file=sys.stderr,flush=True)
+            waiting = True
+        time.sleep(1)
+    try:
+        yield
+    finally:
+        hold.close()
+        os.remove(path)
+
+# run simulator command (list), copying its output to stdout as it arrives and
+# counting messages by severity; the run is killed after max_errors errors (or
+# worse), on a line matching abort_on (regex), or when it exceeds max_rss bytes
+# of memory or max_wall seconds; a digest (message counts, the first keep
+# errors with the context lines that follow them, resources used and any abort
+# reason) is written to digest; with a name, the resources used are recorded
+# in history and, given mem_budget, the run first waits for its share of memory
+# (see reserve_mem), return exit code (1 if aborted, 124 if out of time, as the
+# timeout command)
+def monitor_run(sim,cmd,max_errors=None,abort_on=None,digest=None,max_rss=None,max_wall=None,
+    name=None,history=None,mem_budget=None,keep=10,context=3):
+    sev = monitor_sims[sim]
+    abort_on = re.compile(abort_on) if abort_on else None
+    counts = dict.fromkeys(severities,0)
+    errors = []
+    follow = 0
+    reason = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def abort(why,rc=1):
+        with lock:
+            if reason:
+                return
+            reason.extend([why,rc])
+            print('monitor: run aborted: %s' % why,file=sys.stderr,flush=True)
+            if os.name == 'posix':
+                os.killpg(p.pid,signal.SIGKILL)
+            else:
+                p.kill()
+
+    # wall time and memory limits are checked while output is read
+    def watch():
+        while not finished.wait(0.5):
+            if max_wall and time.time()-t0 > max_wall:
+                abort('wall time limit (%gs)' % max_wall,124)
+            if max_rss:
+                n = group_rss(p.pid) or 0
+                peak[0] = max(peak[0],n)
+                if n > max_rss:
+                    abort('memory limit (%dM)' % (max_rss>>20))
+
+    if mem_budget and name:
+        hold = reserve_mem(name,run_need(name,max_rss,read_history(history) if history else {}),mem_budget)
+    else:
+        hold = contextlib.nullcontext()
+    with hold:
+        kw = {'start_new_session': True} if os.name == 'posix' else {}
+        t0 = time.time()
+        try:
+            p = subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.STDOUT,**kw)
+        except OSError as e:
+            print('%s: %s' % (cmd[0],e),file=sys.stderr)
+            return 127
+        finished = threading.Event()
+        if max_wall or max_rss:
+            threading.Thread(target=watch,daemon=True).start()
+        for n,b in enumerate(iter(p.stdout.readline,b''),1):
+            sys.stdout.buffer.write(b)
+            sys.stdout.flush()
+            l = re_ansi.sub('',b.decode(errors='replace')).rstrip()
+            m = sev.search(l)
+            v = next(x for x in m.groups() if x).lower() if m else None
+            if v:
+                counts[v] += 1
+            if v in severities[2:]:
+                follow = 0
+                if len(errors) < keep:
+                    errors.append((n,[l]))
+                    follow = context
+            elif follow:
+                errors[-1][1].append(l)
+                follow -= 1
+            e = sum(counts[x] for x in severities[2:])
+            if max_errors and e >= max_errors:
+                abort('%d error(s)' % e)
+            elif abort_on and abort_on.search(l):
+                abort('line %d matches %s' % (n,abort_on.pattern))
+            if reason:
+                break
+        p.stdout.close()
+        finished.set()
+        if hasattr(os,'wait4'):
+            _,st,ru = os.wait4(p.pid,0)
+            p.returncode = os.waitstatus_to_exitcode(st)
+            # largest process, kB (bytes on macOS)
+            peak[0] = max(peak[0],ru.ru_maxrss if sys.platform == 'darwin' else ru.ru_maxrss*1024)
+        else:
+            p.wait()
+        wall = time.time()-t0
+    rc = reason[1] if reason else p.returncode
+    if name and history:
+        record_history(history,name,peak[0],wall)
+    if digest:
+        o = []
+        o.append('command: '+' '.join(map(shlex.quote,cmd)))
+        o.append('result: '+('aborted after '+reason[0] if reason else 'exit code %d' % rc))
+        o.append('messages: '+', '.join('%d %s' % (counts[x],x) for x in severities))
+        o.append('resources: %.1fs wall time, %dM peak memory' % (wall,peak[0]>>20))
+        for n,l in errors:
+            o.append('line %d: %s' % (n,l[0]))
+            o += ['  '+x for x in l[1:]]
+        e = sum(counts[x] for x in severities[2:])
+        if e > len(errors):
+            o.append('(%d more error(s))' % (e-len(errors)))
+        write_if_changed(digest,'\n'.join(o)+'\n')
+    return rc
+
+# monitor options enforcing the rss and wall limits of run r
+def monitor_opts(r):
+    l = r.limits or {}
+    return ' '.join((['--max_rss %d' % l['rss']] if 'rss' in l else [])+
+        (['--max_wall %g' % l['wall']] if 'wall' in l else []))
+
+# makefile lines defining MONITOR, the run recipe prefix that runs a simulation
+# through monitor_run when FAIL_FAST, ABORT_ON or MEM_BUDGET is set, or the run
+# has limits: $(MONITOR) or $(call MONITOR,options)
+def monitor_mk(sim):
+    return [
+        '# run monitor: set FAIL_FAST=n to abort a run after n errors, and/or ABORT_ON=regex',
+        '# to abort it on a matching output line (monitored runs leave a digest of their',
+        '# messages in <run>.digest, and their peak memory and wall time in RUN_HISTORY);',
+        '# set MEM_BUDGET (e.g. 64G) to hold runs back under make -j until the memory they',
+        '# are expected to need (learned from RUN_HISTORY) is free',
+        'FAIL_FAST?=',
+        'ABORT_ON?=',
+        'MEM_BUDGET?=',
+        'RUN_HISTORY?='+run_history_file,
+        'MONITOR=$(if $(FAIL_FAST)$(ABORT_ON)$(MEM_BUDGET)$1,$(PYTHON) $(MAKE_FPGA_PY) monitor --sim %s' % sim+
+        ' --name $@ --digest $@.digest --history $(RUN_HISTORY) $(if $(FAIL_FAST),--max_errors $(FAIL_FAST))'
+        ' $(if $(ABORT_ON),--abort_on \'$(ABORT_ON)\') $(if $(MEM_BUDGET),--mem_budget $(MEM_BUDGET)) $1 --)'
+        ]
+
+# make_fpga.py subcommands
+def add_commands(sub):
+    p = sub.add_parser(
+        'monitor',
+        help='run a simulation, classifying its messages as they are output and aborting it early on errors',
+        usage='make_fpga.py monitor --sim SIM [--max_errors N] [--abort_on REGEX] [--digest FILE] -- COMMAND ...'
+       )
+    p.add_argument('--sim',choices=list(monitor_sims),required=True,help='simulator (message format)')
+    p.add_argument('--max_errors',type=int,help='abort after this many errors (error, failure or fatal)')
+    p.add_argument('--abort_on',help='abort on an output line matching this regular expression')
+    p.add_argument('--digest',help='write a digest of messages (counts, first errors, abort reason) to this file')
+    p.add_argument('--max_rss',help='abort if the run uses more than this much memory (e.g. 4G, Linux only)')
+    p.add_argument('--max_wall',help='abort if the run takes longer than this (e.g. 90s, 10m)')
+    p.add_argument('--name',help='run name, under which resources used are recorded')
+    p.add_argument('--history',help='run history file to record resources used in (see --name)')
+    p.add_argument('--mem_budget',help='wait until the memory the run is expected to need fits in this budget alongside other runs (e.g. 64G)')
+
+def command(args,cmd):
+    if args.cmd == 'monitor':
+        if not cmd:
+            error_exit('monitor: no command specified')
+        return monitor_run(args.sim,cmd,args.max_errors,args.abort_on,args.digest,
+            parse_size(args.max_rss) if args.max_rss else None,
+            parse_duration(args.max_wall) if args.max_wall else None,
+            args.name,args.history,
+            parse_size(args.mem_budget) if args.mem_budget else None)
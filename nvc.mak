@@ -14,10 +14,21 @@
 # NVC_E_OPTS    elaboration options
 # NVC_R_OPTS    run options
 # NVC_EDIT      Set to 0 to disable Visual Studio Code 'edit' goal.
+# STAMP         Set to 0 to track compilation by mtime only (no content hash).
+# BUILTIN_RULES Set to 0 to disable make's built-in implicit rules (speeds up make
+#               start up for large designs, but applies to your whole makefile).
 ################################################################################
 
 include $(dir $(lastword $(MAKEFILE_LIST)))/common.mak
 
+# built-in implicit rules are not used here, and searching them for every
+# source file dominates make start up time for large designs, but turning them
+# off affects the whole makefile (and sub-makes), so this is left to the user
+ifeq (0,$(BUILTIN_RULES))
+MAKEFLAGS+=--no-builtin-rules
+.SUFFIXES:
+endif
+
 # defaults
 .PHONY: nvc_default nvc_force
 nvc_default: nvc
@@ -42,8 +53,15 @@ endif
 $(if $(filter 1993 2000 2002 2008 2019,$(NVC_VHDL_LRM)),,$(error NVC_VHDL_LRM value is unsupported: $(NVC_VHDL_LRM)))
 $(foreach s,$(NVC_SRC),$(if $(filter 1993 2000 2002 2008 2019,$(call get_src_lrm,$s,$(NVC_VHDL_LRM))),,$(error source file LRM is unsupported: $s)))
 
-# compilation dependencies enforce compilation order
-dep:=$(firstword $(NVC_SRC))<= $(if $(word 2,$(NVC_SRC)),$(call pairmap,src_dep,$(call rest,$(NVC_SRC)),$(call chop,$(NVC_SRC))),)
+# compilation dependencies: each source depends on the sources providing the
+# units it uses, as scanned by make_fpga.py (so that make -j compiles in parallel)
+NVC_COM:=$(call src_stamps,$(NVC_SRC),$(NVC_DIR),$(NVC_WORK))
+NVC_DEPS:=$(NVC_DIR)/deps.mk
+$(NVC_DEPS): $(call get_src_file,$(NVC_SRC)) $(MAKEFILE_LIST)
+	@$(PYTHON) $(MAKE_FPGA_PY) deps --dir $(NVC_DIR) --work $(NVC_WORK) --out $@ $(foreach s,$(NVC_SRC),'$s')
+ifneq (,$(filter-out clean help,$(or $(MAKECMDGOALS),default)))
+-include $(NVC_DEPS)
+endif
 
 # extract libraries from sources
 NVC_LIB=$(call nodup,$(call get_src_lib,$(NVC_SRC),$(NVC_WORK)))
@@ -62,25 +80,14 @@ $(foreach l,$(NVC_LIB),$(eval $(call rr_touchdir,$l)))
 # $1 = source path/file
 # $2 = source library
 # $3 = LRM
-# $4 = dependency source path/file
-# $5 = dependency source library
 define rr_com
-$(NVC_DIR)/$(strip $2)/.touch/$(notdir $(strip $1)): $(strip $1) $(if $(strip $4),$(NVC_DIR)/$(strip $5)/.touch/$(notdir $(strip $4))) | $(NVC_DIR)/$(strip $2)/.touch
-	@cd $(NVC_DIR) && $(NVC) \
-		$(NVC_G_OPTS) \
-		--std=$(strip $3) \
-		--work=$(strip $2):$(strip $2) \
-		-a \
-		$(NVC_A_OPTS)\
-		$(strip $1)
-	@touch $$@
+$(NVC_DIR)/$(strip $2)/.touch/$(notdir $(strip $1)): $(strip $1) | $(NVC_DIR)/$(strip $2)/.touch
+	@$$(call stamp,$$@,$$^,$(NVC_DIR),$(NVC) $(NVC_G_OPTS) --std=$(strip $3) --work=$(strip $2):$(strip $2) -a $(NVC_A_OPTS) $(strip $1))
 endef
-$(foreach d,$(dep),$(eval $(call rr_com, \
-	$(call get_src_file, $(word 1,$(subst <=, ,$d))), \
-	$(call get_src_lib,  $(word 1,$(subst <=, ,$d)),$(NVC_WORK)), \
-	$(call get_src_lrm,  $(word 1,$(subst <=, ,$d)),$(NVC_VHDL_LRM)), \
-	$(call get_src_file, $(word 2,$(subst <=, ,$d))), \
-	$(call get_src_lib,  $(word 2,$(subst <=, ,$d)),$(NVC_WORK))  \
+$(foreach s,$(NVC_SRC),$(eval $(call rr_com, \
+	$(call get_src_file, $s), \
+	$(call get_src_lib,  $s,$(NVC_WORK)), \
+	$(call get_src_lrm, $s,$(NVC_VHDL_LRM)) \
 )))
 
 # simulation run
@@ -91,9 +98,9 @@ $(foreach d,$(dep),$(eval $(call rr_com, \
 .PHONY: nvc
 define rr_run
 .PHONY: nvc.$(strip $1)
-nvc.$(strip $1):: $(NVC_DIR)/$(call get_src_lib,$(lastword $(NVC_SRC)),$(NVC_WORK))/.touch/$(notdir $(call get_src_file,$(lastword $(NVC_SRC))))
+nvc.$(strip $1):: $(NVC_COM)
 	$(call banner,NVC: simulation run = $(strip $1))
-	@cd $(NVC_DIR) && $(NVC) \
+	@cd $(NVC_DIR) && $$(STEP) $(NVC) \
 		$(NVC_G_OPTS) \
 		--work=$(strip $2):$(strip $2) \
 		-e \
@@ -0,0 +1,66 @@
+################################################################################
+# par_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This module holds what the multi-run place and route scripts (par_radiant.py
+# and par_vivado.py) have in common: running the tool with several settings
+# concurrently, keeping a results table and promoting the best result. Each
+# script supplies its own runs (par_one) and ranking (rank).
+################################################################################
+
+import os,json,time,shutil
+import concurrent.futures
+from make_fpga import *
+
+def read_results(path):
+    try:
+        with open(path,'r') as f:
+            return json.load(f)
+    except (OSError,ValueError):
+        return []
+
+# settings (key field of results, e.g. strategy) that ranked best in results
+def best_settings(results,key,rank,n):
+    return [r[key] for r in sorted(results,key=rank) if r['status'] == 'pass'][:n]
+
+# run f(setting) for each setting, jobs at a time, and return the results
+# report(r) is called as each result arrives, and returns True to cancel runs
+# that have not started (runs are tool processes, so a thread per worker just
+# waits on them)
+def run_all(f,settings,jobs,report):
+    new = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(f,s) for s in settings]
+        for x in concurrent.futures.as_completed(futures):
+            if x.cancelled():
+                continue
+            r = x.result()
+            new.append(r)
+            if report(r):
+                for y in futures:
+                    y.cancel()
+    return new
+
+# results table: this build's runs replace earlier ones with the same setting
+def update_results(path,results,new,key,rank):
+    stamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    for r in new:
+        r['date'] = stamp
+    done = set(r[key] for r in new)
+    results = sorted(new+[r for r in results if r[key] not in done],key=rank)
+    write_if_changed(path,json.dumps(results,indent=1)+'\n')
+    return results
+
+# copy results of run r alongside output (as if it had been run there): files
+# whose names start with one of prefixes, plus (source,destination) renames
+def promote(r,output,prefixes,renames=()):
+    out = os.path.dirname(output)
+    for f in os.listdir(r['dir']):
+        src = os.path.join(r['dir'],f)
+        if f.startswith(prefixes) and f != os.path.basename(output) and os.path.isfile(src):
+            shutil.copyfile(src,os.path.join(out,f))
+    for f,g in renames:
+        shutil.copyfile(os.path.join(r['dir'],f),os.path.join(out,g))
+    # output last (atomically) so that make never sees a partial result
+    tmp = '%s.%d.tmp' % (output,os.getpid())
+    shutil.copyfile(os.path.join(r['dir'],os.path.basename(output)),tmp)
+    os.replace(tmp,output)
@@ -0,0 +1,135 @@
+################################################################################
+# par_radiant.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script runs Lattice Radiant place and route with several starting cost
+# tables concurrently, each in its own directory, then promotes the result with
+# the best timing score. A results table is kept so that later builds can be
+# restricted to the cost tables that did best.
+################################################################################
+
+import sys,os,argparse,time,subprocess
+from make_fpga import *
+from par_fpga import read_results,best_settings,run_all,update_results,promote
+from qor_fpga import par_report
+
+# sort key: fully routed first, then setup score, hold score, worst slack
+def rank(r):
+    inf = float('inf')
+    if r.get('status') != 'pass':
+        return (1,inf,inf,inf,inf)
+    return (0,r['unrouted'],r['score'],r['score_hold'],-(r['wns'] if r['wns'] is not None else -inf))
+
+# cost tables: values, ranges (lo..hi[..step]) or lists ({a,b,...})
+def cost_tables(l):
+    r = []
+    for t in l:
+        for v in sweep_values(t if t.startswith('{') else '{%s}' % t) or []:
+            if not v.isdigit() or not 1 <= int(v) <= 100:
+                error_exit('cost tables must be 1..100: %s' % t)
+            if int(v) not in r:
+                r.append(int(v))
+    return r
+
+# run PAR with cost table t in its own directory, return result dict
+def par_one(args,t):
+    d = os.path.join(args.dir,'t%d' % t)
+    os.makedirs(d,exist_ok=True)
+    udb = os.path.join(d,os.path.basename(args.output))
+    cmd = ['par','-w','-n','1','-t',str(t)]+args.par_opts+[os.path.abspath(args.input),os.path.basename(udb)]
+    t0 = time.time()
+    with open(os.path.join(d,'par.log'),'w') as f:
+        f.write('# '+' '.join(cmd)+'\n')
+        f.flush()
+        rc = subprocess.call(cmd,cwd=d,stdout=f,stderr=subprocess.STDOUT)
+    r = {'cost_table': t,'status': 'fail','rc': rc,'time': round(time.time()-t0,3),'dir': d}
+    try:
+        with open(os.path.splitext(udb)[0]+'.par','r',errors='replace') as f:
+            s = par_report(f.read())
+    except OSError:
+        s = None
+    if rc == 0 and s and os.path.isfile(udb):
+        r['status'] = 'pass'
+        r.update(s)
+    return r
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='par_radiant.py',
+        description='Run Lattice Radiant PAR with several cost tables concurrently and keep the best result',
+        epilog='Results are ranked by unrouted connections, then setup timing score, hold timing score\nand worst slack. Cost tables are given as values, ranges (e.g. 1..8) or lists (e.g. {1,5,9}).',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    parser.add_argument(
+        'input',
+        help='mapped design (UDB)'
+       )
+    parser.add_argument(
+        'output',
+        help='placed and routed design (UDB)'
+       )
+    parser.add_argument(
+        '--seeds',
+        nargs='+',
+        action='append',
+        help='starting cost tables (defaults to 1..4)'
+       )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='number of PAR runs to perform concurrently (defaults to CPU count)',
+        default=os.cpu_count()
+       )
+    parser.add_argument(
+        '--best',
+        type=int,
+        help='only run the cost tables that ranked best in the results table (if it has entries)'
+       )
+    parser.add_argument(
+        '--stopzero',
+        action='store_true',
+        help='do not start further runs once one meets timing (timing score 0)'
+       )
+    parser.add_argument(
+        '--dir',
+        help='directory for PAR runs (defaults to "par_seeds")',
+        default='par_seeds'
+       )
+    parser.add_argument(
+        '--results',
+        help='results table (JSON), updated with each run (defaults to "par_results.json")',
+        default='par_results.json'
+       )
+    parser.add_argument(
+        '--par_opts',
+        nargs='+',
+        action='append',
+        help='further PAR options (e.g. "-exp parHold=1")'
+       )
+    args = parser.parse_args(argv)
+    args.par_opts = flatten([a.split() for a in flatten(args.par_opts)])
+    seeds = cost_tables(flatten(args.seeds) or ['1..4'])
+    results = read_results(args.results)
+    if args.best and results:
+        seeds = best_settings(results,'cost_table',rank,args.best) or seeds
+    print('PAR cost table(s) %s, %d at a time' % (' '.join(map(str,seeds)),max(1,args.jobs)),flush=True)
+
+    def report(r):
+        if r['status'] == 'pass':
+            print('cost table %3d: unrouted %d, score %d (hold %d), worst slack %s (%.1fs)' % (
+                r['cost_table'],r['unrouted'],r['score'],r['score_hold'],r['wns'],r['time']),flush=True)
+        else:
+            print('cost table %3d: failed (see %s)' % (r['cost_table'],os.path.join(r['dir'],'par.log')),flush=True)
+        return args.stopzero and r['status'] == 'pass' and r['unrouted'] == 0 and r['score'] == 0
+    new = run_all(lambda t: par_one(args,t),seeds,max(1,args.jobs),report)
+    update_results(args.results,results,new,'cost_table',rank)
+
+    best = min(new,key=rank)
+    if best['status'] != 'pass':
+        error_exit('all PAR runs failed')
+    stem = os.path.splitext(os.path.basename(args.output))[0]
+    promote(best,args.output,(stem+'.',stem+'_'))
+    print('promoted cost table %d (%s) to %s' % (best['cost_table'],best['dir'],args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+################################################################################
+# par_vivado.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script places and routes an optimised Vivado checkpoint with several
+# directive sets (strategies) concurrently, each in its own directory, then
+# promotes the routed checkpoint with the best timing. A results table of each
+# strategy's QoR and runtime is kept so that later builds can be restricted to
+# the strategies that did best.
+################################################################################
+
+import sys,os,argparse,time,subprocess
+from make_fpga import *
+from par_fpga import read_results,best_settings,run_all,update_results,promote
+from qor_fpga import vivado_timing,vivado_log
+
+help_strategy = \
+    'A strategy is a set of directives for place_design, phys_opt_design and\n' \
+    'route_design, given as PLACE[:PHYS_OPT[:ROUTE]] (omitted directives are\n' \
+    'Default), e.g. Explore:Explore:Explore, ExtraTimingOpt or\n' \
+    'AltSpreadLogic_high:AggressiveExplore. Results are ranked by worst negative\n' \
+    'slack, then total negative slack, then runtime. The job budget is shared\n' \
+    'between concurrent runs (as Vivado threads, at most 8 per run).\n'
+
+default_strategies = ['Default','Explore:Explore:Explore','ExtraTimingOpt','AltSpreadLogic_high']
+
+# sort key: completed first, then worst slack, total slack, runtime
+def rank(r):
+    inf = float('inf')
+    if r.get('status') != 'pass':
+        return (1,inf,inf,inf)
+    return (0,-r['wns'],-(r.get('tns') or 0),r['time'])
+
+# strategy (place,phys_opt,route directives) from specification
+def strategy(s):
+    d = s.split(':')
+    if len(d) > 3 or not all(d):
+        error_exit('bad strategy (expected PLACE[:PHYS_OPT[:ROUTE]]): %s' % s)
+    return tuple(d+['Default']*(3-len(d)))
+
+# strategy name with trailing Default directives dropped, so that specifications
+# of the same strategy (e.g. Default and Default:Default) have the same name
+def strategy_name(s):
+    d = list(strategy(s))
+    while len(d) > 1 and d[-1] == 'Default':
+        d.pop()
+    return ':'.join(d)
+
+# design name from routed checkpoint name (e.g. top_routed.dcp -> top)
+def design(output):
+    n = os.path.splitext(os.path.basename(output))[0]
+    return n[:-len('_routed')] if n.endswith('_routed') else n
+
+# place and route with strategy s in its own directory, return result dict
+def par_one(args,s,threads):
+    name = '_'.join(strategy(s))
+    d = os.path.join(args.dir,name)
+    os.makedirs(d,exist_ok=True)
+    top = design(args.output)
+    place,phys_opt,route = strategy(s)
+    tcl = [
+        'set_param general.maxThreads %d' % threads,
+        'open_checkpoint {%s}' % os.path.abspath(args.input),
+        'place_design -directive %s' % place,
+        'phys_opt_design -directive %s' % phys_opt,
+        'route_design -directive %s' % route,
+        'write_checkpoint -force {%s}' % os.path.basename(args.output),
+        'report_utilization -file %s_utilization_placed.rpt' % top,
+        'report_timing_summary -file %s_timing_summary_routed.rpt' % top
+        ]
+    with open(os.path.join(d,'par.tcl'),'w') as f:
+        f.write('\n'.join(tcl)+'\n')
+    cmd = [args.vivado,'-mode','batch','-notrace','-nolog','-nojournal','-source','par.tcl']
+    t0 = time.time()
+    with open(os.path.join(d,'vivado.log'),'w') as f:
+        f.write('# '+' '.join(cmd)+'\n')
+        f.flush()
+        rc = subprocess.call(cmd,cwd=d,stdout=f,stderr=subprocess.STDOUT)
+    r = {'strategy': s,'status': 'fail','rc': rc,'time': round(time.time()-t0,3),'dir': d}
+    try:
+        with open(os.path.join(d,'%s_timing_summary_routed.rpt' % top),'r',errors='replace') as f:
+            t = vivado_timing(f.read())['timing']
+        with open(os.path.join(d,'vivado.log'),'r',errors='replace') as f:
+            r['stages'] = {k: v['wall'] for k,v in vivado_log(f.read())['stages'].items()}
+    except OSError:
+        t = {}
+    if rc == 0 and t.get('wns') is not None and os.path.isfile(os.path.join(d,os.path.basename(args.output))):
+        r['status'] = 'pass'
+        r.update(t)
+    return r
+
+# summary table of results (best first)
+def print_results(results,best=None):
+    fmt = lambda v: '%.3f' % v if isinstance(v,(int,float)) else '-'
+    print('  %-48s %9s %11s %9s %11s %9s' % ('strategy','WNS(ns)','TNS(ns)','WHS(ns)','THS(ns)','time(s)'))
+    for r in results:
+        print('%s %-48s %9s %11s %9s %11s %9s' % ('*' if r is best else ' ',r['strategy'],
+            *map(fmt,[r.get('wns'),r.get('tns'),r.get('whs'),r.get('ths'),r['time']])))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='par_vivado.py',
+        description='Place and route a Vivado checkpoint with several strategies concurrently and keep the best result',
+        epilog=help_strategy,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    parser.add_argument(
+        'input',
+        help='optimised design (DCP)'
+       )
+    parser.add_argument(
+        'output',
+        help='placed and routed design (DCP)'
+       )
+    parser.add_argument(
+        '--strategies',
+        nargs='+',
+        action='append',
+        help='strategies (defaults to %s)' % ' '.join(default_strategies)
+       )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='number of CPU cores to share between concurrent runs (defaults to CPU count)',
+        default=os.cpu_count()
+       )
+    parser.add_argument(
+        '--best',
+        type=int,
+        help='only run the strategies that ranked best in the results table (if it has entries)'
+       )
+    parser.add_argument(
+        '--dir',
+        help='directory for strategy runs (defaults to "par_strategies")',
+        default='par_strategies'
+       )
+    parser.add_argument(
+        '--results',
+        help='results table (JSON), updated with each run (defaults to "par_strategies.json")',
+        default='par_strategies.json'
+       )
+    parser.add_argument(
+        '--vivado',
+        help='Vivado executable (defaults to "vivado")',
+        default='vivado'
+       )
+    args = parser.parse_args(argv)
+    strategies = list(dict.fromkeys(map(strategy_name,flatten(args.strategies) or default_strategies)))
+    results = read_results(args.results)
+    if args.best and results:
+        strategies = best_settings(results,'strategy',rank,args.best) or strategies
+    jobs = max(1,min(len(strategies),args.jobs))
+    threads = max(1,min(8,args.jobs//jobs))
+    print('strategies %s, %d at a time (%d thread(s) each)' % (' '.join(strategies),jobs,threads),flush=True)
+
+    def report(r):
+        if r['status'] == 'pass':
+            print('%s: WNS %.3f, TNS %.3f (%.1fs)' % (r['strategy'],r['wns'],r.get('tns') or 0,r['time']),flush=True)
+        else:
+            print('%s: failed (see %s)' % (r['strategy'],os.path.join(r['dir'],'vivado.log')),flush=True)
+    new = run_all(lambda s: par_one(args,s,threads),strategies,jobs,report)
+    update_results(args.results,results,new,'strategy',rank)
+
+    best = min(new,key=rank)
+    print_results(sorted(new,key=rank),best)
+    if best['status'] != 'pass':
+        error_exit('all strategy runs failed')
+    # its log as the placement and routing stage log (see qor_fpga.py)
+    top = design(args.output)
+    promote(best,args.output,top+'_',[('vivado.log',top+'_par.log')])
+    print('promoted strategy %s (%s) to %s' % (best['strategy'],best['dir'],args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+################################################################################
+# prune_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# Waveform disk budget: "make_fpga.py prune" deletes the oldest waveform files
+# of simulation runs until they fit.
+################################################################################
+
+import sys,os
+from make_fpga import *
+
+# waveform files below dirs: delete the oldest until their total size is within
+# budget (the newest keep files are always kept), return (deleted,total)
+def prune_waves(dirs,budget,keep=1):
+    l = []
+    for d in dirs:
+        for root,_,files in os.walk(d):
+            for f in files:
+                if os.path.splitext(f)[1][1:] in wave_formats:
+                    p = os.path.join(root,f)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    l.append((st.st_mtime,st.st_size,p))
+    l.sort()
+    total = sum(x[1] for x in l)
+    deleted = []
+    for _,n,p in l[:max(0,len(l)-keep)]:
+        if total <= budget:
+            break
+        try:
+            os.remove(p)
+        except OSError:
+            continue
+        total -= n
+        deleted.append(p)
+    return deleted,total
+
+# make_fpga.py subcommands
+def add_commands(sub):
+    p = sub.add_parser(
+        'prune',
+        help='delete the oldest waveform files below directories until they are within a disk budget'
+       )
+    p.add_argument('--budget',required=True,help='disk budget (e.g. 500M, 20G)')
+    p.add_argument('--keep',type=int,default=1,help='number of newest files always kept (defaults to 1)')
+    p.add_argument('dirs',nargs='+',help='directories')
+
+def command(args,cmd):
+    if args.cmd == 'prune':
+        deleted,total = prune_waves(args.dirs,parse_size(args.budget),args.keep)
+        for p in deleted:
+            print('deleted %s' % p)
+        return 0
@@ -0,0 +1,333 @@
+################################################################################
+# qor_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script extracts QoR (utilization, timing) and runtime (per stage wall
+# and CPU time, peak memory) metrics from the reports of Radiant and Vivado
+# builds into a JSON record, appended to a trend database (JSON lines).
+################################################################################
+
+import sys,os,argparse,re,json,time,subprocess
+from make_fpga import *
+
+# default trend database and report parse cache
+qor_db_file = 'qor.jsonl'
+qor_cache_file = '.qor_cache.json'
+
+# seconds from "hh:mm:ss", "1 hrs 2 mins 3 secs", "4.5 secs" etc.
+re_duration = re.compile(r'([\d.]+)\s*(h|m|s)',re.I)
+def duration(s):
+    s = s.strip()
+    if ':' in s:
+        t = 0.0
+        for x in s.split(':'):
+            t = 60*t+float(x)
+        return t
+    return sum(float(v)*{'h': 3600,'m': 60,'s': 1}[u.lower()] for v,u in re_duration.findall(s))
+
+def to_float(s):
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+################################################################################
+# Radiant
+
+re_rad_util = re.compile(r'^\s*Number of (.+?):\s+(\d+)\s+out of\s+(\d+)',re.M)
+re_rad_cpu  = re.compile(r'Total CPU [Tt]ime(?: to completion)?\s*:\s*(.+)')
+re_rad_real = re.compile(r'Total REAL [Tt]ime(?: to completion)?\s*:\s*(.+)')
+re_rad_peak = re.compile(r'[Pp]eak [Mm]emory(?: [Uu]sage)?\s*:\s*([\d.]+)\s*(?:MB|Mbytes)')
+# PAR report summary row:
+# Level/Cost [udb]  Unrouted  Worst Slack  Timing Score  Worst Slack(hold)  Timing Score(hold)  Run Time  Run Status
+re_par_row  = re.compile(r'^\s*\d+_(\d+)\s+\*?\s*(\d+)\s+(\S+)\s+(\d+)\s+(\S+)\s+(\d+)\s+(\S+)\s+(\S.*?)\s*$',re.M)
+# timing report clock summary: "From clk | Target | ... MHz" then "| Actual ... | ... MHz"
+re_twr_clk  = re.compile(r'^\s*From\s+(\S+)\s*\|\s*Target\b[^\n]*\n\s*\|\s*Actual[^|]*\|[^|]*\|\s*([\d.]+)\s*MHz',re.M)
+
+# stage runtime from a Radiant report/log
+def radiant_runtime(t):
+    r = {}
+    for k,x in (('cpu',re_rad_cpu),('wall',re_rad_real)):
+        m = x.findall(t)
+        if m:
+            r[k] = duration(m[-1])
+    m = re_rad_peak.findall(t)
+    if m:
+        r['peak_mb'] = max(map(float,m))
+    return r
+
+# map report: utilization and map runtime
+def radiant_mrp(t):
+    util = {}
+    for m in re_rad_util.finditer(t):
+        util.setdefault(m.group(1).strip(),{'used': int(m.group(2)),'avail': int(m.group(3))})
+    return {'utilization': util,'stages': {'map': radiant_runtime(t)}}
+
+# PAR report summary (unrouted, wns, score, wns_hold, score_hold), None if not found
+def par_report(t):
+    m = re_par_row.search(t)
+    if not m:
+        return None
+    return {
+        'unrouted':   int(m.group(2)),
+        'wns':        to_float(m.group(3)),
+        'score':      int(m.group(4)),
+        'wns_hold':   to_float(m.group(5)),
+        'score_hold': int(m.group(6))
+        }
+
+def radiant_par(t):
+    return {'timing': par_report(t) or {},'stages': {'par': radiant_runtime(t)}}
+
+def radiant_twr(t):
+    return {'timing': {'fmax': {c: float(f) for c,f in re_twr_clk.findall(t)}}}
+
+def radiant_syn(t):
+    return {'stages': {'synthesis': radiant_runtime(t)}}
+
+################################################################################
+# Vivado
+
+# utilization table row: | Site Type | Used | Fixed | [Prohibited |] Available | Util% |
+re_viv_util = re.compile(r'^\|\s*(\S[^|]*?)\s*\|\s*(\d+)\s*\|\s*\d+\s*\|(?:\s*\d+\s*\|)?\s*(\d+)\s*\|\s*[<\d.]+\s*\|\s*$',re.M)
+# "<command>: Time (s): cpu = 00:00:12 ; elapsed = 00:00:10 . Memory (MB): peak = 1234.5 ; ..."
+re_viv_time = re.compile(r'^(\w+): Time \(s\): cpu = ([\d:.]+) ; elapsed = ([\d:.]+) \. Memory \(MB\): peak = ([\d.]+)',re.M)
+
+def vivado_util(t):
+    util = {}
+    for m in re_viv_util.finditer(t):
+        util.setdefault(m.group(1),{'used': int(m.group(2)),'avail': int(m.group(3))})
+    return {'utilization': util}
+
+# rows of the table whose header line starts with the given words (after the
+# dashes line that follows it), as lists of fields
+def vivado_table(lines,header):
+    for i,l in enumerate(lines):
+        if l.split()[:len(header)] == header:
+            r = []
+            for x in lines[i+2:]:
+                if not x.strip():
+                    break
+                r.append(x.split())
+            return r
+    return []
+
+def vivado_timing(t):
+    lines = t.splitlines()
+    timing = {}
+    for row in vivado_table(lines,['WNS(ns)','TNS(ns)'])[:1]:
+        timing['wns'] = to_float(row[0])
+        timing['tns'] = to_float(row[1])
+        if len(row) > 5:
+            timing['whs'] = to_float(row[4])
+            timing['ths'] = to_float(row[5])
+    # Fmax of each clock from its period and intra clock setup WNS
+    period = {row[0]: to_float(row[-2]) for row in vivado_table(lines,['Clock','Waveform(ns)']) if len(row) >= 4}
+    fmax = {}
+    for row in vivado_table(lines,['Clock','WNS(ns)']):
+        p,w = period.get(row[0]),to_float(row[1])
+        if p and w is not None and p > w:
+            fmax[row[0]] = round(1000/(p-w),3)
+    if fmax:
+        timing['fmax'] = fmax
+    return {'timing': timing}
+
+def vivado_log(t):
+    stages = {}
+    for m in re_viv_time.finditer(t):
+        stages[m.group(1)] = {'cpu': duration(m.group(2)),'wall': duration(m.group(3)),'peak_mb': float(m.group(4))}
+    return {'stages': stages}
+
+################################################################################
+
+# Vivado non-project flow stage logs: <top>_<stage>.log (see vivado.mak), and
+# <top>_par.log from the best strategy run (see par_vivado.py)
+re_viv_stage_log = re.compile(r'_(synth|opt|place|route|par|bit)\.log$')
+
+# report kinds: (tool,parser,priority) by file name; where a later build stage
+# reports the same metric (e.g. utilization after placement rather than after
+# synthesis) the higher priority wins
+def report_kind(name):
+    n = name.lower()
+    if n.endswith('.mrp'):
+        return 'radiant',radiant_mrp,1
+    if n.endswith('.par'):
+        return 'radiant',radiant_par,1
+    if n.endswith('.twr'):
+        return 'radiant',radiant_twr,1
+    if n.endswith('_syn.log'):
+        return 'radiant',radiant_syn,1
+    if n.endswith('.rpt') and '_utilization_' in n:
+        return 'vivado',vivado_util,2 if '_placed' in n else 1
+    if n.endswith('.rpt') and '_timing_summary_' in n:
+        return 'vivado',vivado_timing,2 if '_routed' in n else 1
+    if n == 'runme.log' or re_viv_stage_log.search(n):
+        return 'vivado',vivado_log,1
+    return None
+
+# reports below directories (skipping hidden and PAR/strategy exploration directories)
+def find_reports(dirs):
+    r = []
+    for d in dirs:
+        for root,subdirs,files in os.walk(d):
+            subdirs[:] = sorted(s for s in subdirs if not s.startswith('.') and s not in ('par_seeds','par_strategies'))
+            r += [os.path.join(root,f) for f in sorted(files) if report_kind(f)]
+    return r
+
+# parse reports, reusing cached results for reports whose mtime/size are unchanged
+def parse_reports(files,cache_file=qor_cache_file):
+    cache = {}
+    if cache_file and os.path.isfile(cache_file):
+        try:
+            with open(cache_file,'r') as f:
+                cache = json.load(f)
+        except (OSError,ValueError):
+            cache = {}
+    new_cache = {}
+    r = {}
+    for path in files:
+        st = os.stat(path)
+        e = cache.get(path)
+        if e and e[0] == st.st_mtime and e[1] == st.st_size:
+            m = e[2]
+        else:
+            with open(path,'r',errors='replace') as f:
+                m = report_kind(os.path.basename(path))[1](f.read())
+        new_cache[path] = [st.st_mtime,st.st_size,m]
+        r[path] = m
+    if cache_file and new_cache != cache:
+        write_if_changed(cache_file,json.dumps(new_cache)+'\n')
+    return r
+
+# metrics record from parsed reports
+def qor_record(parsed,design=None):
+    rec = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'),'commit': git_commit(),'design': design,'tool': None,
+        'utilization': {},'timing': {},'stages': {}}
+    for path in sorted(parsed,key=lambda p: report_kind(os.path.basename(p))[2]):
+        rec['tool'] = report_kind(os.path.basename(path))[0]
+        m = parsed[path]
+        if m.get('utilization'):
+            rec['utilization'] = m['utilization']
+        t = dict(rec['timing'])
+        t.update({k: v for k,v in m.get('timing',{}).items() if v is not None and v != {}})
+        rec['timing'] = t
+        for s,v in m.get('stages',{}).items():
+            if v:
+                rec['stages'][s] = v
+    st = rec['stages'].values()
+    rec['wall'] = round(sum(s.get('wall',0) for s in st),3)
+    rec['peak_mb'] = max([s['peak_mb'] for s in st if 'peak_mb' in s] or [0])
+    return rec
+
+# commit of current directory (None outside a git work tree)
+def git_commit():
+    try:
+        return subprocess.run(['git','describe','--always','--dirty'],capture_output=True,text=True,check=True).stdout.strip() or None
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def read_db(path,design=None):
+    r = []
+    try:
+        with open(path,'r') as f:
+            for l in f:
+                try:
+                    rec = json.loads(l)
+                except ValueError:
+                    continue
+                if design is None or rec.get('design') == design:
+                    r.append(rec)
+    except OSError:
+        pass
+    return r
+
+# worst Fmax of a record (None if unknown)
+def fmax_min(rec):
+    f = rec['timing'].get('fmax')
+    return min(f.values()) if f else None
+
+# print trend of records, flagging runtime, memory and timing regressions
+# (beyond tolerance percent) w.r.t. the previous record
+def print_trend(recs,tol):
+    print('%-19s %-14s %9s %9s %9s %9s' % ('date','commit','wns','fmax','wall','peak_mb'))
+    prev = None
+    for rec in recs:
+        flags = []
+        if prev:
+            for k in ('wall','peak_mb'):
+                if prev.get(k) and rec.get(k,0) > prev[k]*(1+tol/100):
+                    flags.append(k)
+            w0,w1 = prev['timing'].get('wns'),rec['timing'].get('wns')
+            if w0 is not None and w1 is not None and w1 < w0 and (w1 < 0 or w0-w1 > abs(w0)*tol/100):
+                flags.append('wns')
+            f0,f1 = fmax_min(prev),fmax_min(rec)
+            if f0 and f1 and f1 < f0*(1-tol/100):
+                flags.append('fmax')
+        w = rec['timing'].get('wns')
+        f = fmax_min(rec)
+        print('%-19s %-14s %9s %9s %8.1fs %9.1f %s' % (rec['date'],rec.get('commit') or '-',
+            '-' if w is None else '%.3f' % w,'-' if f is None else '%.2f' % f,
+            rec.get('wall',0),rec.get('peak_mb',0),('regression: '+', '.join(flags)) if flags else ''))
+        prev = rec
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='qor_fpga.py',
+        description='Extract QoR and runtime metrics from Radiant/Vivado reports and append them to a trend database',
+        epilog='Reports: Radiant .mrp, .par, .twr and synthesis logs (*_syn.log); Vivado\n'
+            '*_utilization_*.rpt, *_timing_summary_*.rpt and runme.log (in project run directories).',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    parser.add_argument(
+        'dirs',
+        nargs='*',
+        help='directories to search for reports (defaults to current directory)'
+       )
+    parser.add_argument(
+        '--design',
+        help='design name (recorded, selects trend records)'
+       )
+    parser.add_argument(
+        '--db',
+        help='trend database (defaults to %s)' % qor_db_file,
+        default=qor_db_file
+       )
+    parser.add_argument(
+        '--cache',
+        help='report parse cache file (defaults to %s)' % qor_cache_file,
+        default=qor_cache_file
+       )
+    parser.add_argument(
+        '--no_append',
+        action='store_true',
+        help='print the record rather than appending it to the database'
+       )
+    parser.add_argument(
+        '--trend',
+        type=int,
+        metavar='N',
+        help='print the last N records of the design from the database'
+       )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        help='regression tolerance in percent (defaults to 10)',
+        default=10
+       )
+    args = parser.parse_args(argv)
+    if args.dirs or args.trend is None:
+        files = find_reports(args.dirs or ['.'])
+        if not files:
+            error_exit('no reports found')
+        rec = qor_record(parse_reports(files,args.cache),args.design)
+        if args.no_append:
+            print(json.dumps(rec,indent=1))
+        else:
+            with open(args.db,'a') as f:
+                f.write(json.dumps(rec,sort_keys=True)+'\n')
+            print('%s: %s record appended (%d report(s))' % (args.db,rec['tool'],len(files)))
+    if args.trend:
+        print_trend(read_db(args.db,args.design)[-args.trend:],args.tolerance)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
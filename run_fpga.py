@@ -0,0 +1,381 @@
+################################################################################
+# run_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script compiles an FPGA simulation once, then performs its simulation
+# runs in parallel, writing per run logs and a JUnit/JSON summary.
+################################################################################
+
+import sys,os,argparse,re,json,time,shlex,subprocess
+import concurrent.futures
+import xml.etree.ElementTree as ET
+from make_fpga import *
+from monitor_fpga import sim_limits,heap_size,run_history_file,read_history,run_need
+from prune_fpga import prune_waves
+
+################################################################################
+# simulator specifics
+# each simulator provides:
+#   setup(args)            list of (path,commands) pairs: commands are run (in the
+#                          output directory) if path does not exist there
+#   com(args,lib,src)      command to compile a source
+#   run(args,r,w)          command to perform run r (in its own directory),
+#                          dumping waveforms to wave.<format> per spec w (or None),
+#                          within its heap and simulated time limits
+#   fail                   regex identifying failure messages in run logs
+
+def gen_args(gen):
+    return flatten([shlex.split('-g%s=%s' % (n,v)) for n,v in gen])
+
+# limits of run r (a Run, or a list from dist_fpga.py)
+def run_limits(r):
+    return (r[5] if len(r) > 5 else None) or {}
+
+def nvc_setup(args):
+    return []
+
+def nvc_com(args,lib,src):
+    return ['nvc','--std='+args.vhdl,'-L.','--work='+lib,'-a','--relaxed',src]
+
+def nvc_run(args,r,w):
+    l = run_limits(r)
+    return ['nvc']+(['-H',heap_size(l['heap'])] if 'heap' in l else [])+[
+        '--std='+args.vhdl,'-L..','--work=%s:../%s' % (args.work,args.work),
+        '-e','--jit','--no-save']+gen_args(args.gen+r[2])+[r[1],
+        '-r','--ieee-warnings=off']+(['--stop-time='+l['stop']] if 'stop' in l else [])+([] if not w else ['--wave=wave.'+w[0],'--format='+w[0]]+
+        [('--include=' if c == '+' else '--exclude=')+x for c,x in w[1]])
+
+def vsim_setup(args):
+    libs = list(dict.fromkeys(l for l,_ in args.c))
+    return [('modelsim.ini',[[args.path+'vmap','-c']])]+[(l,[
+        [args.path+'vlib',l],
+        [args.path+'vmap','-modelsimini','modelsim.ini',l,os.path.abspath(os.path.join(args.dir,l))]
+        ]) for l in libs]
+
+def vsim_com(args,lib,src):
+    if src.lower().endswith(ext_vhdl):
+        return [args.path+'vcom','-modelsimini','modelsim.ini','-work',lib,'-'+args.vhdl,'-explicit','-stats=none',src]
+    else:
+        return [args.path+'vlog','-modelsimini','modelsim.ini','-work',lib,'-stats=none',src]
+
+def vsim_wave(w):
+    if not w:
+        return ''
+    inc = [x for c,x in w[1] if c == '+'] or ['/*']
+    exc = [x for c,x in w[1] if c == '-']
+    if w[0] == 'wlf':
+        return ' '.join(['log -r %s;' % x for x in inc]+['nolog -r %s;' % x for x in exc])+' '
+    if exc:
+        error_exit('vsim cannot exclude scopes from VCD dumps (use wlf)')
+    return ' '.join(['vcd file wave.vcd;']+['vcd add -r %s;' % x for x in inc])+' '
+
+def vsim_run(args,r,w):
+    return [args.path+'vsim','-batch','-modelsimini','../modelsim.ini','-l','transcript',
+        '-wlf','wave.wlf' if w and w[0] == 'wlf' else 'vsim.wlf',
+        '-t','ps','-do',vsim_wave(w)+'set NumericStdNoWarnings 1; onfinish exit; run %s; exit' % run_limits(r).get('stop','-all')]+ \
+        flatten([['-L',l] for l in args.lib])+gen_args(args.gen+r[2])+ \
+        flatten([['-sdf'+t,p+'='+f] for t,p,f in args.sdf+r[3]])+[r[1]]
+
+def ghdl_setup(args):
+    return []
+
+def ghdl_com(args,lib,src):
+    return ['ghdl','-a','--std='+args.vhdl[2:],'--work='+lib,'-frelaxed','-fsynopsys',src]
+
+# ghdl selects scopes to dump with a wave option file (which cannot exclude)
+def ghdl_wave(w,d):
+    if not w:
+        return []
+    if any(c == '-' for c,_ in w[1]):
+        error_exit('ghdl cannot exclude scopes from waveform dumps')
+    o = ['--%s=wave.%s' % ('wave' if w[0] == 'ghw' else w[0],w[0])]
+    if w[1]:
+        with open(os.path.join(d,'wave.opt'),'w') as f:
+            f.write('$ version 1.1\n'+''.join(x+'\n' for _,x in w[1]))
+        o.append('--read-wave-opt=wave.opt')
+    return o
+
+def ghdl_run(args,r,w):
+    return ['ghdl','--elab-run','--std='+args.vhdl[2:],'--work='+args.work,'--workdir=..','-P..',
+        '-frelaxed','-fsynopsys',r[1],'--ieee-asserts=disable']+gen_args(args.gen+r[2])+ \
+        (['--stop-time='+run_limits(r)['stop']] if 'stop' in run_limits(r) else [])+ \
+        ghdl_wave(w,os.path.join(args.dir,r[0]))
+
+sims = {
+    'nvc':  (nvc_setup,nvc_com,nvc_run,re.compile(r'\*\* (Fatal|Failure|Error):')),
+    'vsim': (vsim_setup,vsim_com,vsim_run,re.compile(r'^# \*\* (Fatal|Failure|Error)\b',re.M)),
+    'ghdl': (ghdl_setup,ghdl_com,ghdl_run,re.compile(r'\((assertion|report) (failure|error)\)'))
+    }
+
+################################################################################
+
+# compile all sources once (content hash stamps skip unchanged sources)
+def compile_all(args):
+    setup,com,_,_ = sims[args.sim]
+    os.makedirs(args.dir,exist_ok=True)
+    for p,cmds in setup(args):
+        if not os.path.exists(os.path.join(args.dir,p)):
+            for cmd in cmds:
+                if subprocess.call(cmd,cwd=args.dir):
+                    error_exit('setup failed: %s' % ' '.join(cmd))
+    if args.no_scan:
+        deps = [([i-1] if i else [],[]) for i in range(len(args.c))]
+    else:
+        deps = src_deps(args.c,args.scan_cache)
+    stamps = [os.path.join(args.dir,'.com',l,os.path.basename(s)) for l,s in args.c]
+    for i,(l,s) in enumerate(args.c):
+        src = os.path.abspath(s)
+        inputs = [s]+[stamps[j] for j in deps[i][0]]+deps[i][1]
+        if stamp_run(stamps[i],inputs,com(args,l,src),args.dir):
+            error_exit('compilation failed: %s' % s)
+
+# perform one run in its own directory through the run monitor (which
+# enforces its limits and records the resources it uses in the run history),
+# return result dict
+def run_one(args,r):
+    _,_,run,fail = sims[args.sim]
+    d = os.path.join(args.dir,r[0])
+    os.makedirs(d,exist_ok=True)
+    log = os.path.join(d,'run.log')
+    l = run_limits(r)
+    cmd = run(args,r,sim_wave(args.sim,(r[4] if len(r) > 4 else None) or args.wave))
+    timeout = min(filter(None,[l.get('wall'),args.timeout]),default=None)
+    t0 = time.time()
+    with open(log,'w') as f:
+        f.write('# '+' '.join(map(shlex.quote,cmd))+'\n')
+        f.flush()
+        cmd = [sys.executable,make_fpga_py,'monitor','--sim',args.sim,'--digest','run.digest','--name',r[0],
+            '--history',os.path.abspath(os.path.join(args.dir,run_history_file))]+ \
+            (['--max_rss',str(l['rss'])] if 'rss' in l else [])+ \
+            (['--max_wall',str(timeout)] if timeout else [])+ \
+            (['--max_errors',str(args.max_errors)] if args.max_errors else [])+ \
+            (['--abort_on',args.abort_on] if args.abort_on else [])+['--']+cmd
+        rc = subprocess.call(cmd,cwd=d,stdout=f,stderr=subprocess.STDOUT)
+        status = 'pass' if rc == 0 else 'timeout' if rc == 124 else 'fail'
+    t = time.time()-t0
+    msg = ''
+    if status != 'timeout':
+        with open(log,'r',errors='replace') as f:
+            m = fail.search(f.read())
+        if m:
+            status = 'fail'
+            msg = m.group(0)
+    return {'name': r[0],'top': r[1],'status': status,'rc': rc,'time': round(t,3),'log': log,'message': msg}
+
+def write_json(path,results):
+    write_if_changed(path,json.dumps(results,indent=1)+'\n')
+
+def write_junit(path,results,sim):
+    ts = ET.Element('testsuite',{
+        'name': sim,
+        'tests': str(len(results)),
+        'failures': str(sum(1 for r in results if r['status'] == 'fail')),
+        'errors': str(sum(1 for r in results if r['status'] not in ('pass','fail'))),
+        'time': '%.3f' % sum(r['time'] for r in results)
+        })
+    for r in results:
+        tc = ET.SubElement(ts,'testcase',{'classname': sim+'.'+r['top'],'name': r['name'],'time': '%.3f' % r['time']})
+        if r['status'] == 'fail':
+            ET.SubElement(tc,'failure',{'message': r['message'] or 'exit code %s' % r['rc']}).text = 'see '+r['log']
+        elif r['status'] != 'pass':
+            ET.SubElement(tc,'error',{'message': r['status']}).text = 'see '+r['log']
+    write_if_changed(path,ET.tostring(ts,encoding='unicode')+'\n')
+
+# command line arguments shared with dist_fpga.py
+def add_arguments(parser):
+    parser.add_argument(
+        '--sim',
+        choices=list(sims),
+        required=True,
+        help='simulator'
+       )
+    parser.add_argument(
+        '--path',
+        help='path to tool binaries (vsim only)'
+       )
+    parser.add_argument(
+        '--lib',
+        nargs='+',
+        action='append',
+        help='precompiled libraries'
+       )
+    parser.add_argument(
+        '--vhdl',
+        choices=['1993','2002','2008','2019'],
+        help='VHDL LRM version (defaults to 2008)',
+        default='2008'
+       )
+    parser.add_argument(
+        '--work',
+        help='work library (defaults to "work")',
+        default='work'
+       )
+    parser.add_argument(
+        '--src',
+        required=True,
+        nargs='+',
+        action='append',
+        help='source(s) in compile order, globs or directories (append =LIB to specify library name)'
+       )
+    parser.add_argument(
+        '--run',
+        required=True,
+        nargs='+',
+        action='append',
+        help='simulation run specification(s) (see below)'
+       )
+    parser.add_argument(
+        '--gen',
+        nargs='+',
+        action='append',
+        help='generics assignment(s) (applied to all runs)'
+       )
+    parser.add_argument(
+        '--sdf',
+        nargs='+',
+        action='append',
+        help='SDF mapping(s) (applied to all runs, vsim only)'
+       )
+    parser.add_argument(
+        '--no_scan',
+        action='store_true',
+        help='do not scan sources for dependencies'
+       )
+    parser.add_argument(
+        '--scan_cache',
+        help='source scan cache file (defaults to %s)' % scan_cache_file,
+        default=scan_cache_file
+       )
+    parser.add_argument(
+        '--wave',
+        help='waveform dump for runs without their own, to wave.<format> in run directories (see below, defaults to off)'
+       )
+    parser.add_argument(
+        '--wave_budget',
+        help='after all runs, delete the oldest waveform dumps until they are within this disk budget (e.g. 20G)'
+       )
+    parser.add_argument(
+        '--dir',
+        help='output directory (defaults to "sim_<simulator>")'
+       )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        help='per run timeout in seconds'
+       )
+    parser.add_argument(
+        '--max_errors',
+        type=int,
+        help='abort a run after this many errors (see run.digest in its directory)'
+       )
+    parser.add_argument(
+        '--abort_on',
+        help='abort a run on an output line matching this regular expression'
+       )
+    parser.add_argument(
+        '--json',
+        help='write JSON summary to this file'
+       )
+    parser.add_argument(
+        '--junit',
+        help='write JUnit XML summary to this file'
+       )
+
+# check and complete parsed arguments, return runs
+def process_args(args):
+    if args.path:
+        args.path += '/' if args.path[-1] != '/' else ''
+    else:
+        args.path = ''
+    args.dir = args.dir or 'sim_'+args.sim
+    args.c,_ = process_src(args.src,args.work,not args.no_scan,args.scan_cache)
+    runs = process_run(flatten(args.run))
+    args.lib = flatten(args.lib)
+    args.gen = process_gen(flatten(args.gen))
+    args.sdf = process_sdf(flatten(args.sdf))
+    args.wave = parse_wave(args.wave) if args.wave else None
+    for r in runs:
+        sim_wave(args.sim,r[4] or args.wave)
+        sim_limits(args.sim,r[5])
+    return runs
+
+# physical memory (bytes), None if unknown
+def phys_mem():
+    try:
+        return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError,ValueError,OSError):
+        return None
+
+# perform runs, yielding results as they complete: at most args.jobs at once,
+# packed so that the memory they are expected to need (learned from the run
+# history, see run_need) stays within args.mem (a run always starts if none
+# are in progress), runs expected to take longest starting first (unknown
+# ones before all others)
+def run_packed(args,runs):
+    h = read_history(os.path.join(args.dir,run_history_file))
+    need = {r[0]: run_need(r[0],run_limits(r).get('rss'),h) for r in runs}
+    todo = sorted(runs,key=lambda r: -h[r[0]]['wall'] if r[0] in h else -float('inf'))
+    running = {}
+    used = 0
+    # runs are simulator processes, so a thread per worker just waits on them
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,args.jobs)) as pool:
+        while todo or running:
+            for r in list(todo):
+                if len(running) >= max(1,args.jobs):
+                    break
+                if running and args.mem and used+need[r[0]] > args.mem:
+                    continue
+                todo.remove(r)
+                running[pool.submit(run_one,args,r)] = r
+                used += need[r[0]]
+            done,_ = concurrent.futures.wait(running,return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in done:
+                used -= need[running.pop(f)[0]]
+                yield f.result()
+
+# print and write summaries of results (sorted into run order), return exit code
+def summarize(args,runs,results):
+    order = {r[0]: i for i,r in enumerate(runs)}
+    results.sort(key=lambda r: order[r['name']])
+    n = sum(1 for r in results if r['status'] == 'pass')
+    print('%d of %d run(s) passed' % (n,len(results)))
+    if args.wave_budget:
+        for p in prune_waves([args.dir],parse_size(args.wave_budget))[0]:
+            print('deleted %s' % p)
+    if args.json:
+        write_json(args.json,results)
+    if args.junit:
+        write_junit(args.junit,results,args.sim)
+    return 0 if n == len(results) else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='run_fpga.py',
+        description='Compile an FPGA simulation once, then perform its runs in parallel',
+        epilog=help_run,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+       )
+    add_arguments(parser)
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='number of runs to perform concurrently (defaults to CPU count)',
+        default=os.cpu_count()
+       )
+    parser.add_argument(
+        '--mem',
+        help='memory budget for concurrent runs, e.g. 64G (defaults to physical memory, 0 for none)'
+       )
+    args = parser.parse_args(argv)
+    runs = process_args(args)
+    args.mem = parse_size(args.mem) if args.mem else phys_mem()
+
+    compile_all(args)
+
+    results = []
+    for r in run_packed(args,runs):
+        results.append(r)
+        print('%-7s %s (%.1fs) %s' % (r['status'].upper(),r['name'],r['time'],r['log']),flush=True)
+    return summarize(args,runs,results)
+
+if __name__ == '__main__':
+    sys.exit(main())
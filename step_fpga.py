@@ -0,0 +1,128 @@
+################################################################################
+# step_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# Per step timing and resource log: compile, elaborate and run steps of
+# generated makefiles are run through "make_fpga.py step", which records them,
+# and "make_fpga.py steps" summarizes the log.
+################################################################################
+
+import sys,os,json,time,subprocess
+from make_fpga import *
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# run command (list) in directory cwd, append a record of it (wall time, user
+# and system CPU time, peak RSS, exit code, inputs) to log as a JSON line
+def step_run(log,name,inputs,cmd,cwd=None):
+    t0 = time.time()
+    r0 = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+    try:
+        rc = subprocess.call(cmd,cwd=cwd)
+    except OSError as e:
+        print('%s: %s' % (cmd[0],e),file=sys.stderr)
+        rc = 127
+    s = {'name': name,'start': round(t0,3),'wall': round(time.time()-t0,3),'rc': rc,'cmd': cmd,'inputs': inputs}
+    if resource:
+        r1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        s['user'] = round(r1.ru_utime-r0.ru_utime,3)
+        s['sys'] = round(r1.ru_stime-r0.ru_stime,3)
+        # largest child (the tool rather than a wrapper), kB (bytes on macOS);
+        # Linux counts the launcher's own RSS at fork, so small values are a floor
+        s['maxrss_kb'] = r1.ru_maxrss//1024 if sys.platform == 'darwin' else r1.ru_maxrss
+    # one write per record, so concurrent steps (make -j) do not interleave
+    fd = os.open(log,os.O_WRONLY|os.O_APPEND|os.O_CREAT,0o666)
+    try:
+        os.write(fd,(json.dumps(s)+'\n').encode())
+    finally:
+        os.close(fd)
+    return rc
+
+# makefile lines defining STEP, the recipe prefix that runs a step through
+# step_run when STEP_LOG is set: $(STEP) or $(call STEP,name suffix,extra inputs)
+step_mk = [
+    '# per step timing and resource log: set STEP_LOG=file to record each step',
+    '# (summarize with: $(PYTHON) $(MAKE_FPGA_PY) steps file)',
+    'STEP=$(if $(STEP_LOG),$(PYTHON) $(MAKE_FPGA_PY) step --log $(abspath $(STEP_LOG)) --name $@$1 $^ $2 --)'
+    ]
+
+# latest record of each step in log
+def read_steps(log):
+    r = {}
+    with open(log,'r') as f:
+        for l in f:
+            try:
+                s = json.loads(l)
+            except ValueError:
+                continue
+            r.pop(s['name'],None) # keep in order of latest
+            r[s['name']] = s
+    return r
+
+# longest chain of steps (by wall time) through their inputs, returns
+# (total time,list of names); an input only counts if it is a step that
+# started before the step that uses it
+def critical_path(steps):
+    cp = {}
+    for s in sorted(steps.values(),key=lambda s: s['start']):
+        t,prev = 0,None
+        for i in s['inputs']:
+            if i in cp and steps[i]['start'] <= s['start'] and cp[i][0] > t:
+                t,prev = cp[i][0],i
+        cp[s['name']] = (t+s['wall'],prev)
+    if not cp:
+        return 0,[]
+    n = max(cp,key=lambda n: cp[n][0])
+    t = cp[n][0]
+    path = []
+    while n:
+        path.append(n)
+        n = cp[n][1]
+    return t,path[::-1]
+
+def print_steps(steps,top):
+    l = list(steps.values())
+    serial = sum(s['wall'] for s in l)
+    span = max(s['start']+s['wall'] for s in l)-min(s['start'] for s in l)
+    print('%d step(s): serialized %.1fs, elapsed %.1fs (parallelism %.1f)' % (len(l),serial,span,serial/span if span else 1))
+    print('slowest:')
+    print('  %8s %8s %8s %8s %4s  %s' % ('wall','user','sys','rss_mb','rc','step'))
+    for s in sorted(l,key=lambda s: -s['wall'])[:top]:
+        print('  %7.2fs %7.2fs %7.2fs %8.1f %4s  %s' % (s['wall'],s.get('user',0),s.get('sys',0),s.get('maxrss_kb',0)/1024,s['rc'],s['name']))
+    t,path = critical_path(steps)
+    print('critical path: %.1fs (%d step(s))' % (t,len(path)))
+    for n in path:
+        print('  %7.2fs  %s' % (steps[n]['wall'],n))
+
+# make_fpga.py subcommands
+def add_commands(sub):
+    p = sub.add_parser(
+        'step',
+        help='run a command, appending its wall time, CPU time, peak RSS and exit code to a log',
+        usage='make_fpga.py step --log LOG [--name NAME] [-C DIR] [INPUT ...] -- COMMAND ...'
+       )
+    p.add_argument('--log',required=True,help='log file (JSON lines)')
+    p.add_argument('--name',help='step name, e.g. its target (defaults to the command)')
+    p.add_argument('-C',dest='dir',help='directory to run command in')
+    p.add_argument('inputs',nargs='*',help='input files (e.g. prerequisites)')
+    p = sub.add_parser(
+        'steps',
+        help='summarize a step log: slowest steps, serialized time and critical path'
+       )
+    p.add_argument('--top',type=int,default=10,help='number of slowest steps to list (defaults to 10)')
+    p.add_argument('log',help='log file written by step')
+
+def command(args,cmd):
+    if args.cmd == 'step':
+        if not cmd:
+            error_exit('step: no command specified')
+        return step_run(args.log,args.name or ' '.join(cmd),args.inputs,cmd,args.dir)
+    elif args.cmd == 'steps':
+        try:
+            steps = read_steps(args.log)
+        except OSError as e:
+            error_exit('steps: %s' % e)
+        if steps:
+            print_steps(steps,args.top)
+        return 0
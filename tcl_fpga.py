@@ -0,0 +1,100 @@
+################################################################################
+# tcl_fpga.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# Persistent Tcl sessions (see tclserve.tcl): "make_fpga.py tclsend" sends a
+# script to a session, starting it if necessary, and copies its output.
+################################################################################
+
+import sys,os,shlex,socket,subprocess,time
+from make_fpga import *
+
+tclserve_tcl = make_fpga_py.rsplit('/',1)[0]+'/tclserve.tcl'
+
+# connected socket to session, None if it is not running
+def tcl_connect(session):
+    try:
+        with open(session,'r') as f:
+            port,token = f.read().split()[:2]
+        return socket.create_connection(('127.0.0.1',int(port)),timeout=5),token
+    except (OSError,ValueError):
+        return None,None
+
+# start session with command (string), return connection once it is serving
+def tcl_start(session,start,log,wait):
+    if os.path.exists(session):
+        os.remove(session) # stale
+    with open(log,'ab') as f:
+        if os.name == 'posix':
+            kw = {'start_new_session': True}
+        else:
+            kw = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        p = subprocess.Popen(shlex.split(start),stdin=subprocess.DEVNULL,stdout=f,stderr=subprocess.STDOUT,**kw)
+    t = time.time()+wait
+    while time.time() < t:
+        s,token = tcl_connect(session)
+        if s:
+            return s,token
+        if p.poll() is not None:
+            break
+        time.sleep(0.1)
+    error_exit('tclsend: session failed to start (see %s)' % log)
+
+# send script to session (starting it if necessary), copying the session's
+# output to stdout while it runs, return 0 on success
+def tcl_send(session,script,start=None,log=None,wait=120):
+    log = log or session+'.log'
+    s,token = tcl_connect(session)
+    if not s:
+        if not start:
+            print('tclsend: no session (%s)' % session)
+            return 1
+        s,token = tcl_start(session,start,log,wait)
+    pos = os.path.getsize(log) if os.path.exists(log) else 0
+    def tail():
+        nonlocal pos
+        try:
+            with open(log,'rb') as f:
+                f.seek(pos)
+                b = f.read()
+        except OSError:
+            return
+        pos += len(b)
+        sys.stdout.buffer.write(b)
+        sys.stdout.flush()
+    with s:
+        s.sendall(('%s %s\n' % (token,' '.join(script.split('\n')))).encode())
+        s.settimeout(0.2)
+        reply = b''
+        while not reply.endswith(b'\n'):
+            try:
+                b = s.recv(4096)
+            except socket.timeout:
+                tail()
+                continue
+            if not b:
+                break
+            reply += b
+    tail()
+    status,_,msg = reply.decode(errors='replace').strip().partition(' ')
+    if status != 'ok':
+        print('tclsend: error: %s' % (msg or 'session closed'),file=sys.stderr)
+        return 1
+    return 0
+
+# make_fpga.py subcommands
+def add_commands(sub):
+    p = sub.add_parser(
+        'tclsend',
+        help='send a script to a persistent Tcl session (see tclserve.tcl), starting it if necessary',
+        usage='make_fpga.py tclsend [--start COMMAND] [--log FILE] [--wait SECONDS] SESSION -- SCRIPT ...'
+       )
+    p.add_argument('--start',help='command that starts the session (e.g. "tclsh tclserve.tcl SESSION")')
+    p.add_argument('--log',help='session output (defaults to SESSION.log)')
+    p.add_argument('--wait',type=float,default=120,help='time allowed for the session to start (defaults to 120s)')
+    p.add_argument('session',help='session file (written by tclserve.tcl)')
+
+def command(args,cmd):
+    if args.cmd == 'tclsend':
+        if not cmd:
+            error_exit('tclsend: no script specified')
+        return tcl_send(args.session,' '.join(cmd),args.start,args.log,args.wait)
@@ -0,0 +1,87 @@
+################################################################################
+# tclserve.tcl
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# Persistent session for a tool's Tcl shell (e.g. radiantc). Serves scripts
+# sent by "make_fpga.py tclsend" over a local socket, so that tool start up
+# and project load happen once per build rather than once per step.
+# usage: <Tcl shell> tclserve.tcl session_file [idle_timeout_seconds]
+# The session file receives the port and a token that requests must quote.
+################################################################################
+
+set session_file [lindex $argv 0]
+set session_idle [expr {1000*([llength $argv] > 1 ? [lindex $argv 1] : 600)}]
+set session_token [format %08x%08x [expr {int(rand()*0x7fffffff)}] [clock microseconds]]
+
+# open project name with command open unless it is already open, closing any
+# other project (with its close command) first
+proc session_project {open close name} {
+  global session_prj session_close_cmd
+  if {[info exists session_prj]} {
+    if {$session_prj eq $name} {return}
+    session_close
+  }
+  {*}$open $name
+  set session_prj $name
+  set session_close_cmd $close
+}
+
+# close project opened by session_project (if any)
+proc session_close {} {
+  global session_prj session_close_cmd
+  if {[info exists session_prj]} {
+    unset session_prj
+    {*}$session_close_cmd
+  }
+}
+
+# close project and exit (once the current request has been answered)
+proc session_exit {} {
+  after 0 {
+    catch session_close
+    file delete $::session_file
+    exit 0
+  }
+}
+
+# exit when idle
+proc session_idle {{reset 1}} {
+  global session_idle session_idle_id
+  if {[info exists session_idle_id]} {after cancel $session_idle_id}
+  if {$reset} {set session_idle_id [after $session_idle session_exit]}
+}
+
+proc session_accept {ch addr port} {
+  fconfigure $ch -buffering line -translation lf
+  fileevent $ch readable [list session_read $ch]
+}
+
+# one request per connection: token script
+# reply: ok|error result
+proc session_read {ch} {
+  global session_token
+  if {[gets $ch line] < 0} {close $ch; return}
+  fileevent $ch readable {}
+  session_idle 0
+  set i [string first " " $line]
+  if {$i < 0 || [string range $line 0 $i-1] ne $session_token} {
+    set e 1
+    set m "bad token"
+  } else {
+    set e [catch {uplevel #0 [string range $line $i+1 end]} m]
+  }
+  flush stdout
+  puts $ch "[expr {$e ? "error" : "ok"}] [string map {"\n" " "} $m]"
+  close $ch
+  session_idle
+}
+
+set s [socket -server session_accept -myaddr 127.0.0.1 0]
+set port [lindex [fconfigure $s -sockname] 2]
+set f [open $session_file.tmp w]
+puts $f "$port $session_token [pid]"
+close $f
+file rename -force $session_file.tmp $session_file
+puts "tclserve: session [pid] serving on port $port"
+flush stdout
+session_idle
+vwait forever
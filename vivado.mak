@@ -23,6 +23,14 @@
 #   VIVADO_SIM_ELF   ELF to associate with CPU for simulations
 #   VIVADO_SIM_WCFG  simulation waveform configuration files
 #   VIVADO_XDC       list of constraint files, with =scope suffixes
+#   VIVADO_QOR_DB    QoR and runtime metrics trend database (default qor.jsonl)
+#   VIVADO_FLOW      project (default) or nonproject: synthesis and
+#                      implementation stages write checkpoints (DCPs)
+#   VIVADO_INCR      reference DCP for incremental implementation (non-project
+#                      flow, defaults to the last routed DCP, empty to disable)
+#   VIVADO_STRATEGIES  implementation strategies to run concurrently in the
+#                      non-project flow, keeping the best (see par_vivado.py)
+#   VIVADO_STRATEGIES_BEST  only run this many of the best strategies so far
 ################################################################################
 
 include $(dir $(lastword $(MAKEFILE_LIST)))/common.mak
@@ -36,6 +44,8 @@ VIVADO_WORK?=work
 VIVADO_LANGUAGE?=VHDL
 VIVADO_VHDL_LRM?=2008
 VIVADO_SIM_ELF?=$(VIVADO_DSN_ELF)
+VIVADO_QOR_DB?=qor.jsonl
+VIVADO_FLOW?=project
 ifeq ($(OS),Windows_NT)
 VIVADO_CORES:=$(shell set /a %NUMBER_OF_PROCESSORS%)
 else
@@ -46,6 +56,7 @@ VIVADO_JOBS?=$(VIVADO_CORES)
 # checks
 $(call check_defined,XILINX_VIVADO)
 $(call check_option,VIVADO_LANGUAGE,VHDL Verilog)
+$(call check_option,VIVADO_FLOW,project nonproject)
 $(call check_defined_alt,VIVADO_DSN_SRC VIVADO_SIM_SRC)
 $(call check_defined_alt,VIVADO_DSN_TOP VIVADO_SIM_TOP)
 $(if $(filter 1993 2000 2008 2019,$(VIVADO_VHDL_LRM)),,$(error VIVADO_VHDL_LRM value is unsupported: $(VIVADO_VHDL_LRM)))
@@ -63,10 +74,24 @@ VIVADO_BD_GEN_DIR?=$(VIVADO_PROJ).gen/$(VIVADO_FS_SRC)/bd
 VIVADO_XSA=$(VIVADO_DSN_TOP).xsa
 VIVADO_BIT=$(VIVADO_DSN_TOP).bit
 vivado_touch_dir=$(VIVADO_DIR)/touch
+VIVADO_INCR?=$(VIVADO_DIR)/$(VIVADO_DSN_TOP)_routed.dcp
+ifeq (nonproject,$(VIVADO_FLOW))
+$(if $(VIVADO_BD_TCL)$(VIVADO_DSN_ELF),$(error Block diagrams and ELF files require VIVADO_FLOW=project))
+vivado_dcp=$(VIVADO_DIR)/$(VIVADO_DSN_TOP)_$1.dcp
+vivado_impl=$(call vivado_dcp,routed)
+vivado_bit=$(VIVADO_BIT)
+else
+$(if $(VIVADO_STRATEGIES),$(error VIVADO_STRATEGIES requires VIVADO_FLOW=nonproject))
+vivado_impl=$(vivado_touch_dir)/$(VIVADO_PROJ).impl
+vivado_bit=$(vivado_touch_dir)/$(VIVADO_PROJ).bit
+endif
 $(if $(filter dev,$(MAKECMDGOALS)),$(eval dev=1))
 
 # functions
-vivado_run     = @cd $(VIVADO_DIR) && $(VIVADO) -mode tcl -notrace -nolog -nojournal -source $(subst _tcl,.tcl,$1) $(addprefix -tclargs ,$2)
+# vivado_run: $1 = script, $2 = arguments, $3 = log file (console output is
+# also written to this, e.g. for qor_fpga.py)
+vivado_run     = @cd $(VIVADO_DIR) && $(VIVADO) -mode tcl -notrace $(if $3,-log $3,-nolog) -nojournal -source $(subst _tcl,.tcl,$1) $(addprefix -tclargs ,$2)
+vivado_np_log  = $(VIVADO_DSN_TOP)_$1.log
 get_xdc_file   = $(foreach x,$1,$(word 1,$(subst =, ,$x)))
 get_xdc_usedin = $(strip $(foreach x,$1,$(word 2,$(subst =, ,$x))))
 get_bd_file    = $(word 1,$(subst =, ,$1))
@@ -88,9 +113,10 @@ endif
 
 # constraints
 $(foreach x,$(VIVADO_XDC),$(if $(call get_xdc_usedin,$x),,$(error All constraints must be scoped)))
-VIVADO_XDC_SYNTH=$(foreach x,$(VIVADO_XDC),$(if,$(findstring SYNTH,$(call get_xdc_usedin,$x)),$(call get_xdc_file,$x)))
-VIVADO_XDC_IMPL=$(foreach x,$(VIVADO_XDC),$(if,$(findstring IMPL,$(call get_xdc_usedin,$x)),$(call get_xdc_file,$x)))
-VIVADO_XDC_SIM=$(foreach x,$(VIVADO_XDC),$(if,$(findstring SIM,$(call get_xdc_usedin,$x)),$(call get_xdc_file,$x)))
+VIVADO_XDC_SYNTH=$(foreach x,$(VIVADO_XDC),$(if $(findstring SYNTH,$(call get_xdc_usedin,$x)),$(call get_xdc_file,$x)))
+VIVADO_XDC_IMPL=$(foreach x,$(VIVADO_XDC),$(if $(findstring IMPL,$(call get_xdc_usedin,$x)),$(call get_xdc_file,$x)))
+VIVADO_XDC_IMPL_ONLY=$(filter-out $(VIVADO_XDC_SYNTH),$(VIVADO_XDC_IMPL))
+VIVADO_XDC_SIM=$(foreach x,$(VIVADO_XDC),$(if $(findstring SIM,$(call get_xdc_usedin,$x)),$(call get_xdc_file,$x)))
 
 ################################################################################
 # TCL sequences
@@ -335,6 +361,102 @@ endef
 
 #-------------------------------------------------------------------------------
 
+vivado_scripts+=vivado_np_synth_tcl
+define vivado_np_synth_tcl
+	puts "reading design sources..."
+	foreach s {$(VIVADO_DSN_SRC)} {
+		set f [lindex [split "$$s" "=;"] 0]
+		if {[string first "=" $$s] != -1} {
+			set l [lindex [split "$$s" "=;"] 1]
+		} else {
+			set l "$(VIVADO_WORK)"
+		}
+		if {[string first ";" $$s] != -1} {
+			set lang [string map {"-" " "} [lindex [split "$$s" ";"] 1]]
+		} elseif {[string match .vh* [file extension $$f]]} {
+			set lang "VHDL $(VIVADO_VHDL_LRM)"
+		} elseif {[file extension $$f] == ".sv"} {
+			set lang "SystemVerilog"
+		} else {
+			set lang "Verilog"
+		}
+		switch -glob $$lang {
+			"VHDL 2008"   {read_vhdl -vhdl2008 -library $$l $$f}
+			"VHDL 2019"   {read_vhdl -vhdl2019 -library $$l $$f}
+			VHDL*         {read_vhdl -library $$l $$f}
+			SystemVerilog {read_verilog -sv -library $$l $$f}
+			default       {read_verilog -library $$l $$f}
+		}
+	}
+	if {"$(VIVADO_XDC_SYNTH)" != ""} {
+		puts "reading synthesis constraints..."
+		foreach f {$(VIVADO_XDC_SYNTH)} {
+			read_xdc $$f
+			if {!("$$f" in {$(VIVADO_XDC_IMPL)})} {
+				set_property used_in_implementation false [get_files $$f]
+			}
+		}
+	}
+	foreach x {$(VIVADO_XDC_REF)} {
+		set file [lindex [split "$$x" "="] 0]
+		set ref  [lindex [split "$$x" "="] 1]
+		read_xdc -ref $$ref $$file
+	}
+	synth_design -top $(VIVADO_DSN_TOP) $(if $(VIVADO_PART),-part "$(VIVADO_PART)") $(addprefix -generic ,$(subst $(comma), ,$(VIVADO_DSN_GEN))) -assert
+	write_checkpoint -force $(VIVADO_DSN_TOP)_synth.dcp
+	report_utilization -file $(VIVADO_DSN_TOP)_utilization_synth.rpt
+endef
+
+#-------------------------------------------------------------------------------
+
+vivado_scripts+=vivado_np_opt_tcl
+define vivado_np_opt_tcl
+	open_checkpoint $(VIVADO_DSN_TOP)_synth.dcp
+	foreach f {$(VIVADO_XDC_IMPL_ONLY)} {
+		read_xdc $$f
+	}
+	opt_design
+	write_checkpoint -force $(VIVADO_DSN_TOP)_opt.dcp
+endef
+
+#-------------------------------------------------------------------------------
+
+vivado_scripts+=vivado_np_place_tcl
+define vivado_np_place_tcl
+	open_checkpoint $(VIVADO_DSN_TOP)_opt.dcp
+	if {"$(VIVADO_INCR)" != "" && [file exists "$(abspath $(VIVADO_INCR))"]} {
+		puts "reading reference checkpoint for incremental implementation..."
+		read_checkpoint -incremental "$(abspath $(VIVADO_INCR))"
+	}
+	place_design
+	phys_opt_design
+	write_checkpoint -force $(VIVADO_DSN_TOP)_placed.dcp
+	report_utilization -file $(VIVADO_DSN_TOP)_utilization_placed.rpt
+endef
+
+#-------------------------------------------------------------------------------
+
+vivado_scripts+=vivado_np_route_tcl
+define vivado_np_route_tcl
+	open_checkpoint $(VIVADO_DSN_TOP)_placed.dcp
+	route_design
+	write_checkpoint -force $(VIVADO_DSN_TOP)_routed.dcp
+	report_timing_summary -file $(VIVADO_DSN_TOP)_timing_summary_routed.rpt
+	if {"$(VIVADO_INCR)" != "" && [file exists "$(abspath $(VIVADO_INCR))"]} {
+		report_incremental_reuse -file $(VIVADO_DSN_TOP)_incremental_reuse_routed.rpt
+	}
+endef
+
+#-------------------------------------------------------------------------------
+
+vivado_scripts+=vivado_np_bit_tcl
+define vivado_np_bit_tcl
+	open_checkpoint $(VIVADO_DSN_TOP)_routed.dcp
+	write_bitstream -force $(abspath $(VIVADO_BIT))
+endef
+
+#-------------------------------------------------------------------------------
+
 vivado_scripts+=vivado_prog_tcl
 define vivado_prog_tcl
 	set file    [lindex $$argv 0]
@@ -400,8 +522,12 @@ endef
 
 vivado_scripts+=vivado_sdf_tcl
 define vivado_sdf_tcl
-	open_project $(VIVADO_PROJ)
-	open_run $(VIVADO_IMPL_RUN)
+	if {"$(VIVADO_FLOW)" == "nonproject"} {
+		open_checkpoint $(VIVADO_DSN_TOP)_routed.dcp
+	} else {
+		open_project $(VIVADO_PROJ)
+		open_run $(VIVADO_IMPL_RUN)
+	}
 	write_verilog -mode timesim -force $(VIVADO_DSN_TOP)_timesim.v
 	write_sdf -process_corner slow -force $(VIVADO_DSN_TOP)_slow.sdf
 	write_sdf -process_corner fast -force $(VIVADO_DSN_TOP)_fast.sdf
@@ -426,7 +552,7 @@ $(file >$(VIVADO_DIR)/vivado_bit_cp.tcl,$(vivado_bit_cp_tcl))
 ################################################################################
 # Vivado rules and recipes
 
-.PHONY: dev vivado_default vivado_force xpr bd hwdef xsa dsn_order synth impl bit sim_order sim_elf sim_bat sim_gui sdf
+.PHONY: dev vivado_default vivado_force xpr bd hwdef xsa dsn_order synth opt place route impl qor bit sim_order sim_elf sim_bat sim_gui sdf
 
 dev::
 	@:
@@ -482,6 +608,55 @@ $(vivado_touch_dir)/dsn.order: $(vivado_touch_dir)/$(VIVADO_PROJ).xpr
 	$(call vivado_run,vivado_dsn_order_tcl)
 	@touch $@
 
+ifeq (nonproject,$(VIVADO_FLOW))
+
+# non-project flow: each stage opens the checkpoint written by the previous
+# stage, so a change restarts from the first stage it affects
+
+# synthesis
+$(call vivado_dcp,synth): $(if $(filter dev,$(MAKECMDGOALS)),,$(MAKEFILE_LIST)) $(call get_src_file,$(VIVADO_DSN_SRC)) $(VIVADO_XDC_SYNTH) $(call get_xdc_file,$(VIVADO_XDC_REF)) | $(VIVADO_DIR)
+	$(call banner,Vivado: synthesis (non-project))
+	$(call vivado_run,vivado_np_synth_tcl,,$(call vivado_np_log,synth))
+synth: $(call vivado_dcp,synth)
+
+# logic optimisation (applies implementation only constraints)
+$(call vivado_dcp,opt): $(call vivado_dcp,synth) $(VIVADO_XDC_IMPL_ONLY)
+	$(call banner,Vivado: optimisation)
+	$(call vivado_run,vivado_np_opt_tcl,,$(call vivado_np_log,opt))
+opt: $(call vivado_dcp,opt)
+
+ifneq (,$(VIVADO_STRATEGIES))
+
+# placement and routing with each strategy concurrently, keeping the best
+$(call vivado_dcp,routed): $(call vivado_dcp,opt)
+	$(call banner,Vivado: implementation strategies)
+	@cd $(VIVADO_DIR) && $(PYTHON) $(dir $(MAKE_FPGA_PY))par_vivado.py $(notdir $<) $(notdir $@) --strategies $(VIVADO_STRATEGIES) $(addprefix --jobs ,$(VIVADO_JOBS)) $(addprefix --best ,$(VIVADO_STRATEGIES_BEST)) --vivado $(VIVADO)
+place route impl: $(call vivado_dcp,routed)
+
+else
+
+# placement (incremental if a reference checkpoint exists)
+$(call vivado_dcp,placed): $(call vivado_dcp,opt)
+	$(call banner,Vivado: placement)
+	$(call vivado_run,vivado_np_place_tcl,,$(call vivado_np_log,place))
+place: $(call vivado_dcp,placed)
+
+# routing
+$(call vivado_dcp,routed): $(call vivado_dcp,placed)
+	$(call banner,Vivado: routing)
+	$(call vivado_run,vivado_np_route_tcl,,$(call vivado_np_log,route))
+route impl: $(call vivado_dcp,routed)
+
+endif
+
+# write bitstream
+$(VIVADO_BIT): $(call vivado_dcp,routed)
+	$(call banner,Vivado: write bitstream)
+	$(call vivado_run,vivado_np_bit_tcl,,$(call vivado_np_log,bit))
+bit: $(VIVADO_BIT)
+
+else
+
 # synthesis
 $(vivado_touch_dir)/$(VIVADO_PROJ).synth: $(call get_src_file,$(VIVADO_DSN_SRC)) $(call get_xdc_file,$(VIVADO_XDC_SYNTH)) $(foreach x,$(VIVADO_BD_TCL),$(addprefix $(vivado_touch_dir)/,$(basename $(notdir $(call get_bd_file,$x))).gen)) $(vivado_touch_dir)/dsn.order
 	$(call banner,Vivado: synthesis)
@@ -510,8 +685,15 @@ $(vivado_touch_dir)/$(VIVADO_PROJ).bit: $(vivado_touch_dir)/$(VIVADO_PROJ).impl
 	@touch $@
 bit: $(vivado_touch_dir)/$(VIVADO_PROJ).bit
 
+endif
+
+# QoR and runtime metrics from synthesis and implementation run reports
+qor: vivado_force
+	$(call banner,Vivado: QoR and runtime metrics)
+	@$(PYTHON) $(dir $(MAKE_FPGA_PY))qor_fpga.py --design $(VIVADO_DSN_TOP) --db $(VIVADO_QOR_DB) $(if $(filter nonproject,$(VIVADO_FLOW)),$(VIVADO_DIR),$(VIVADO_DIR)/$(VIVADO_PROJ).runs)
+
 # program
-prog: vivado_force $(vivado_touch_dir)/$(VIVADO_PROJ).bit
+prog: vivado_force $(vivado_bit)
 	$(call banner,Vivado: program)
 	$(call vivado_run,vivado_prog_tcl,$(abspath $(VIVADO_BIT)))
 
@@ -553,7 +735,7 @@ else
 endif
 
 # timing simulation (netlist and SDF)
-$(VIVADO_DIR)/$(VIVADO_DSN_TOP)_timesim.v $(VIVADO_DIR)/$(VIVADO_DSN_TOP)_slow.sdf  $(VIVADO_DIR)/$(VIVADO_DSN_TOP)_fast.sdf &: $(vivado_touch_dir)/$(VIVADO_PROJ).impl
+$(VIVADO_DIR)/$(VIVADO_DSN_TOP)_timesim.v $(VIVADO_DIR)/$(VIVADO_DSN_TOP)_slow.sdf  $(VIVADO_DIR)/$(VIVADO_DSN_TOP)_fast.sdf &: $(vivado_impl)
 	$(call banner,Vivado: generating timing simulation netlist and SDF files)
 	$(call vivado_run,vivado_sdf_tcl,$1)
 sdf:: $(VIVADO_DIR)/$(VIVADO_DSN_TOP)_timesim.v $(VIVADO_DIR)/$(VIVADO_DSN_TOP)_slow.sdf  $(VIVADO_DIR)/$(VIVADO_DSN_TOP)_fast.sdf
@@ -629,6 +811,9 @@ help::
 	$(call print_col,col_fi_cyn,  vivado.mak)
 	$(call print_col,col_fi_wht,  Support for synthesis, implementation and simulation with Vivado,)
 	$(call print_col,col_fi_wht,  in project mode. The resulting XPR may be opened in the Vivado GUI.)
+	$(call print_col,col_fi_wht,  With VIVADO_FLOW=nonproject, synthesis and implementation write a)
+	$(call print_col,col_fi_wht,  checkpoint per stage and placement is incremental (see VIVADO_INCR),)
+	$(call print_col,col_fi_wht,  or several strategies are run concurrently (see VIVADO_STRATEGIES).)
 	$(call print_col,col_fg_wht, )
 	$(call print_col,col_fg_wht,    Primary Goals:)
 	$(call print_col,col_fi_grn,      bit       $(col_fg_wht)- create BIT file)
@@ -646,6 +831,10 @@ help::
 	$(call print_col,col_fi_grn,      synth     $(col_fg_wht)- synthesise design)
 	$(call print_col,col_fi_grn,      dsn_elf   $(col_fg_wht)- associate ELF file with design)
 	$(call print_col,col_fi_grn,      impl      $(col_fg_wht)- implement design)
+	$(call print_col,col_fi_grn,      opt       $(col_fg_wht)- optimise design (non-project flow))
+	$(call print_col,col_fi_grn,      place     $(col_fg_wht)- place design (non-project flow))
+	$(call print_col,col_fi_grn,      route     $(col_fg_wht)- route design (non-project flow))
+	$(call print_col,col_fi_grn,      qor       $(col_fg_wht)- append QoR and runtime metrics to VIVADO_QOR_DB)
 	$(call print_col,col_fi_grn,      sim_order $(col_fg_wht)- set simulation compilation order)
 	$(call print_col,col_fi_grn,      sim_elf   $(col_fg_wht)- associate ELF file with simulation)
 	$(call print_col,col_fi_grn,      dev       $(col_fg_wht)- remove makefiles from prerequisites)
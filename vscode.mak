@@ -18,59 +18,23 @@ $(foreach l,$(VSCODE_LIB),$(call check_defined,VSCODE_SRC.$l))
 ################################################################################
 # rules and recipes
 
-# workspace directory
-$(VSCODE_DIR):
-	@bash -c "mkdir -p $@"
-
-# library directory(s) containing symbolic link(s) to source(s)
-$(foreach l,$(VSCODE_LIB),$(eval $l: $(addprefix $$(VSCODE_DIR)/$l/,$(notdir $(VSCODE_SRC.$l)))))
-
-# symbolic links to library/source files
-ifeq ($(OS),Windows_NT)
-define rr_srclink
-$$(VSCODE_DIR)/$1/$(notdir $2): $2
-	@bash -c "mkdir -p $$(dir $$@)"
-	@bash -c "cmd.exe //C \"mklink $$(shell cygpath -w $$@) $$(shell cygpath -w -a $$<)\""
-endef
-else
-define rr_srclink
-$$(VSCODE_DIR)/$1/$(notdir $2): $2
-	@mkdir -p $$(dir $$@)
-	@ln $$< $$@
-endef
-endif
-$(foreach l,$(VSCODE_LIB),$(foreach s,$(VSCODE_SRC.$l),$(eval $(call rr_srclink,$l,$s))))
-
-# symbolic links to auxilliary text files
-ifeq ($(OS),Windows_NT)
-define rr_auxlink	
-$$(VSCODE_DIR)/$(notdir $1): $1
-	@bash -c "cmd.exe //C \"mklink $$(shell cygpath -w $$@) $$(shell cygpath -w -a $$<)\""
-endef
-else
-define rr_auxlink
-$$(VSCODE_DIR)/$(notdir $1): $1
-	@ln $$< $$@
-endef
-endif
-$(foreach a,$(VSCODE_AUX),$(eval $(call rr_auxlink,$a)))
-
-# V4P configuration file
-$(VSCODE_DIR)/config.v4p: vscode_force $(VSCODE_LIB)
-	@bash -c "echo \"[libraries]\" > $@"
-	@bash -c "$(foreach l,$(VSCODE_LIB),$(foreach s,$(VSCODE_SRC.$l),echo \"$l/$(notdir $s)=$l\" >> $@;))"
-	@bash -c "echo \"[settings]\" >> $@"
-	@bash -c "echo \"V4p.Settings.Basics.TopLevelEntities=$(subst $(space),$(comma),$(VSCODE_TOP))\" >> $@"
+# workspace: links to sources and auxiliary text files, and config.v4p,
+# synced in one pass by make_vscode.py (only changes are made)
+MAKE_VSCODE_PY:=$(dir $(MAKE_FPGA_PY))make_vscode.py
+VSCODE_AUXX:=$(VSCODE_AUX) $(foreach x,$(VSCODE_XDC),$(word 1,$(subst =, ,$x)))
+vscode_sync: vscode_force
+	$(file >$(VSCODE_DIR).args,--sync $(VSCODE_DIR) --src $(foreach l,$(VSCODE_LIB),$(addsuffix =$l,$(VSCODE_SRC.$l))) $(addprefix --top ,$(VSCODE_TOP)) $(if $(strip $(VSCODE_AUXX)),--aux $(VSCODE_AUXX)))
+	@$(PYTHON) $(MAKE_VSCODE_PY) @$(VSCODE_DIR).args
 
 ################################################################################
 # goals	
 
-.PHONY: vscode_force edit
+.PHONY: vscode_force vscode_sync edit
 
 vscode_force:
 
-edit: $(VSCODE_DIR)/config.v4p $(addprefix $(VSCODE_DIR)/,$(VSCODE_LIB)) $(foreach x,$(VSCODE_XDC),$(VSCODE_DIR)/$(notdir $(word 1,$(subst =, ,$x)))) $(addprefix $(VSCODE_DIR)/,$(notdir $(VSCODE_AUX)))
+edit: vscode_sync
 	@code $(VSCODE_DIR)
 
 clean::
-	@rm -rf $(VSCODE_DIR)
+	@rm -rf $(VSCODE_DIR) $(VSCODE_DIR).args
@@ -11,10 +11,21 @@
 #                For a single run, name= may be omitted and defaults to 'sim='
 # VCOM_OPTS      compilation options
 # VSIM_EDIT      Set to 0 to disable Visual Studio Code 'edit' goal.
+# STAMP          Set to 0 to track compilation by mtime only (no content hash).
+# BUILTIN_RULES  Set to 0 to disable make's built-in implicit rules (speeds up make
+#                start up for large designs, but applies to your whole makefile).
 ################################################################################
 
 include $(dir $(lastword $(MAKEFILE_LIST)))/common.mak
 
+# built-in implicit rules are not used here, and searching them for every
+# source file dominates make start up time for large designs, but turning them
+# off affects the whole makefile (and sub-makes), so this is left to the user
+ifeq (0,$(BUILTIN_RULES))
+MAKEFLAGS+=--no-builtin-rules
+.SUFFIXES:
+endif
+
 # defaults
 .PHONY: vsim_default vsim_force
 vsim_default: vsim
@@ -45,8 +56,15 @@ endif
 $(if $(filter 1987 1993 2002 2008,$(VSIM_VHDL_LRM)),,$(error VSIM_VHDL_LRM value is unsupported: $(VSIM_VHDL_LRM)))
 $(foreach s,$(VSIM_SRC),$(if $(filter 1987 1993 2002 2008,$(call get_src_lrm,$s,$(VSIM_VHDL_LRM))),,$(error source file LRM is unsupported: $s)))
 
-# compilation dependencies enforce compilation order
-dep:=$(firstword $(VSIM_SRC))<= $(if $(word 2,$(VSIM_SRC)),$(call pairmap,src_dep,$(call rest,$(VSIM_SRC)),$(call chop,$(VSIM_SRC))),)
+# compilation dependencies: each source depends on the sources providing the
+# units it uses, as scanned by make_fpga.py (so that make -j compiles in parallel)
+VSIM_COM:=$(call src_stamps,$(VSIM_SRC),$(VSIM_DIR),$(VSIM_WORK))
+VSIM_DEPS:=$(VSIM_DIR)/deps.mk
+$(VSIM_DEPS): $(call get_src_file,$(VSIM_SRC)) $(MAKEFILE_LIST)
+	@$(PYTHON) $(MAKE_FPGA_PY) deps --dir $(VSIM_DIR) --work $(VSIM_WORK) --out $@ $(foreach s,$(VSIM_SRC),'$s')
+ifneq (,$(filter-out clean help,$(or $(MAKECMDGOALS),default)))
+-include $(VSIM_DEPS)
+endif
 
 # extract libraries from sources
 VSIM_LIB=$(call nodup,$(call get_src_lib,$(VSIM_SRC),$(VSIM_WORK)))
@@ -81,24 +99,14 @@ $(foreach l,$(VSIM_LIB),$(eval $(call rr_touchdir,$l)))
 # $1 = source path/file
 # $2 = source library
 # $3 = LRM
-# $4 = dependency source path/file
-# $5 = dependency source library
 define rr_com
-$(VSIM_DIR)/$(strip $2)/.touch/$(notdir $(strip $1)): $(strip $1) $(if $(strip $4),$(VSIM_DIR)/$(strip $5)/.touch/$(notdir $(strip $4))) $(if $(filter dev,$(MAKECMDGOALS)),,$(MAKEFILE_LIST)) | $(VSIM_DIR)/$(strip $2) $(VSIM_DIR)/$(strip $2)/.touch
-	@cd $(VSIM_DIR) && $(VCOM) \
-		-modelsimini $(VSIM_INI) \
-		-work $(strip $2) \
-		-$(strip $3) \
-		$(VCOM_OPTS) \
-		$$<
-	@touch $$@
+$(VSIM_DIR)/$(strip $2)/.touch/$(notdir $(strip $1)): $(strip $1) $(if $(filter dev,$(MAKECMDGOALS)),,$(filter-out $(VSIM_DEPS),$(MAKEFILE_LIST))) | $(VSIM_DIR)/$(strip $2) $(VSIM_DIR)/$(strip $2)/.touch
+	@$$(call stamp,$$@,$$^,$(VSIM_DIR),$(VCOM) -modelsimini $(VSIM_INI) -work $(strip $2) -$(strip $3) $(VCOM_OPTS) $$<)
 endef
-$(foreach d,$(dep),$(eval $(call rr_com, \
-	$(call get_src_file, $(word 1,$(subst <=, ,$d))), \
-	$(call get_src_lib,  $(word 1,$(subst <=, ,$d)),$(VSIM_WORK)), \
-	$(call get_src_lrm,  $(word 1,$(subst <=, ,$d)),$(VSIM_VHDL_LRM)), \
-	$(call get_src_file, $(word 2,$(subst <=, ,$d))), \
-	$(call get_src_lib,  $(word 2,$(subst <=, ,$d)),$(VSIM_WORK))  \
+$(foreach s,$(VSIM_SRC),$(eval $(call rr_com, \
+	$(call get_src_file, $s), \
+	$(call get_src_lib,  $s,$(VSIM_WORK)), \
+	$(call get_src_lrm, $s,$(VSIM_VHDL_LRM)) \
 )))
 
 # simulation run
@@ -109,9 +117,9 @@ $(foreach d,$(dep),$(eval $(call rr_com, \
 .PHONY: vsim
 define rr_run
 .PHONY: vsim.$(strip $1)
-vsim.$(strip $1):: $(VSIM_DIR)/$(call get_src_lib,$(lastword $(VSIM_SRC)),$(VSIM_WORK))/.touch/$(notdir $(call get_src_file,$(lastword $(VSIM_SRC))))
+vsim.$(strip $1):: $(VSIM_COM)
 	$(call banner,vsim: simulation run = $1)
-	@cd $(VSIM_DIR) && $(VSIM) \
+	@cd $(VSIM_DIR) && $$(STEP) $(VSIM) \
 		-t ps \
 		-modelsimini $(VSIM_INI) \
 		-work $2 \
@@ -149,7 +157,7 @@ endef
 .PHONY: vsim_do
 $(VSIM_DIR)/$(VCOM_DO): vsim_force | $(VSIM_DIR)
 	@printf "# generated by vsim.mak" > $@
-	@printf "$(foreach d,$(dep),\n$(call rr_do_com,$(call get_src_file,$(word 1,$(subst <=, ,$d))),$(call get_src_lib,$(word 1,$(subst <=, ,$d)),$(VSIM_WORK)),$(call get_src_lrm,$(word 1,$(subst <=, ,$d)),$(VSIM_VHDL_LRM))))\n" >> $@
+	@printf "$(foreach s,$(VSIM_SRC),\n$(call rr_do_com,$(call get_src_file,$s),$(call get_src_lib,$s,$(VSIM_WORK)),$(call get_src_lrm,$s,$(VSIM_VHDL_LRM))))\n" >> $@
 $(VSIM_DIR)/$(VSIM_DO): vsim_force | $(VSIM_DIR)
 	@printf "# generated by vsim.mak" > $@
 	@printf "$(subst ",\",$(foreach r,$(VSIM_RUN),\n$(call rr_do_run,$(call get_run_name,$r),$(call get_run_lib,$r),$(call get_run_unit,$r),$(call get_run_gen,$r)))\n)" >> $@
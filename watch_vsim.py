@@ -0,0 +1,193 @@
+################################################################################
+# watch_vsim.py
+# A part of make-fpga - see https://github.com/amb5l/make-fpga
+# This script watches the sources of a do_vsim.py simulation and, when they
+# are saved, asks the running vsim session to recompile the affected sources
+# (and their dependents) and restart the simulation.
+################################################################################
+
+import sys,os,argparse,time,select,socket,struct,ctypes,ctypes.util
+from make_fpga import *
+
+################################################################################
+# file change notification: inotify on Linux, polling elsewhere
+
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+
+# inotify file descriptor watching dirs, None if inotify is not available
+def inotify_open(dirs):
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None,use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError,AttributeError):
+        return None
+    if fd < 0:
+        return None
+    # editors often save by writing a new file and renaming it over the old one
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    for d in dirs:
+        if libc.inotify_add_watch(fd,os.fsencode(d),mask) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+# names (basenames) of files changed, waiting up to timeout seconds
+def inotify_wait(fd,timeout):
+    if not select.select([fd],[],[],timeout)[0]:
+        return set()
+    buf = os.read(fd,65536)
+    r = set()
+    i = 0
+    while i < len(buf):
+        _,_,_,n = struct.unpack_from('iIII',buf,i)
+        r.add(os.fsdecode(buf[i+16:i+16+n].rstrip(b'\0')))
+        i += 16+n
+    return r
+
+# (mtime,size) of files, None for missing files
+def poll_stat(files):
+    r = {}
+    for f in files:
+        try:
+            st = os.stat(f)
+            r[f] = (st.st_mtime,st.st_size)
+        except OSError:
+            r[f] = None
+    return r
+
+################################################################################
+
+# send request to vsim session, return reply (None if no session)
+def request(port_file,req):
+    try:
+        with open(port_file,'r') as f:
+            port,token = f.read().split()
+        with socket.create_connection(('127.0.0.1',int(port)),timeout=5) as s:
+            s.settimeout(None) # recompiling and restarting may take a while
+            s.sendall(('%s %s\n' % (token,req)).encode())
+            return s.makefile('r').readline().strip()
+    except (OSError,ValueError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='watch_vsim.py',
+        description='Watch the sources of a do_vsim.py simulation, recompile changed sources (and their dependents) in the running vsim session and restart it',
+        epilog='The vsim session must serve requests: generate its script with do_vsim.py --serve, or enter "serve" at the vsim prompt.'
+       )
+    parser.add_argument(
+        '--work',
+        help='work library (defaults to "work")',
+        default='work'
+       )
+    parser.add_argument(
+        '--src',
+        required=True,
+        nargs='+',
+        action='append',
+        help='source(s) in compile order (as given to do_vsim.py)'
+       )
+    parser.add_argument(
+        '--no_scan',
+        action='store_true',
+        help='do not scan sources for dependencies (recompile all later sources)'
+       )
+    parser.add_argument(
+        '--scan_cache',
+        help='source scan cache file (defaults to %s)' % scan_cache_file,
+        default=scan_cache_file
+       )
+    parser.add_argument(
+        '--port_file',
+        help='file written by the vsim session\'s serve command (defaults to .watch_vsim)',
+        default='.watch_vsim'
+       )
+    parser.add_argument(
+        '--settle',
+        type=float,
+        help='time to wait for further changes before recompiling (defaults to 0.2s)',
+        default=0.2
+       )
+    parser.add_argument(
+        '--poll',
+        type=float,
+        help='poll for changes at this interval (seconds) instead of using inotify'
+       )
+    args = parser.parse_args(argv)
+    p = make_project(flatten(args.src),work=args.work,scan=not args.no_scan,scan_cache=args.scan_cache)
+    files = list(dict.fromkeys(s for _,s in p.src))
+    hashes = {f: file_hash(f) for f in files if os.path.isfile(f)}
+    by_name = {} # basename -> sources
+    for f in files:
+        by_name.setdefault(os.path.basename(f),[]).append(f)
+    dirs = sorted(set(os.path.dirname(os.path.abspath(f)) for f in files))
+
+    fd = None if args.poll else inotify_open(dirs)
+    if fd is None:
+        interval = args.poll or 0.5
+        stat = poll_stat(files)
+        print('watching %d source(s) (polling every %gs)' % (len(files),interval))
+    else:
+        print('watching %d source(s) in %d directory(s)' % (len(files),len(dirs)))
+
+    pending = set() # sources changed but not yet recompiled
+    try:
+        while True:
+            # wait for change(s), then allow further changes to settle
+            changed = set()
+            timeout = None
+            while True:
+                if fd is None:
+                    time.sleep(interval if timeout is None else timeout)
+                    s = poll_stat(files)
+                    names = [os.path.basename(f) for f in files if s[f] != stat[f]]
+                    stat = s
+                else:
+                    names = inotify_wait(fd,timeout)
+                if not names:
+                    if changed:
+                        break
+                    continue
+                for n in names:
+                    changed.update(by_name.get(n,[]))
+                timeout = args.settle if changed else None
+
+            # ignore saves that do not change content
+            for f in changed:
+                h = file_hash(f) if os.path.isfile(f) else None
+                if h != hashes.get(f):
+                    hashes[f] = h
+                    pending.add(f)
+            if not pending:
+                continue
+
+            # affected sources: changed sources plus all their dependents
+            # (dependencies are rescanned as changed sources may use new units)
+            rdeps = src_rdeps(p.deps())
+            l = set()
+            for i,(_,s) in enumerate(p.src):
+                if s in pending:
+                    l.add(i)
+                    l.update(rdeps[i])
+            print('%s changed: recompiling %d source(s)' % (', '.join(sorted(pending)),len(l)),flush=True)
+            r = request(args.port_file,'recompile {%s}' % ' '.join(map(str,sorted(l))))
+            if r is None:
+                print('no vsim session is serving requests (see %s), will retry on next change' % args.port_file,flush=True)
+            else:
+                print(r,flush=True)
+                # a failed recompile (e.g. a syntax error) is retried on next change
+                if r.startswith('ok'):
+                    pending = set()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+if __name__ == '__main__':
+    main()